@@ -20,6 +20,8 @@ Examples:
     python batch_process.py -i /path/to/input -o /path/to/output --pattern "*.{mp4,mov,avi}"
     # Without displaying the Tqdm bar inside sorawm procrssing.
     python batch_process.py -i /path/to/input -o /path/to/output --quiet
+    # Process 4 videos at a time
+    python batch_process.py -i /path/to/input -o /path/to/output --jobs 4
         """
     )
 
@@ -43,6 +45,12 @@ Examples:
         default="*.mp4",
         help="🔍 File pattern to match (default: *.mp4)"
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="⚙️  Videos processed at once, each in its own worker process (default: 1)"
+    )
     parser.add_argument(
         "--quiet",
         action="store_true",
@@ -97,6 +105,7 @@ def main():
     from rich import box
     from rich.text import Text as RichText
     from sorawm.core import SoraWM
+    from sorawm.parallel import iter_batch_parallel
 
     # Initialize console after importing rich
     console = Console()
@@ -128,7 +137,8 @@ def main():
             self.input_folder = input_folder
             self.output_folder = output_folder
             self.pattern = pattern
-            self.sora_wm = SoraWM()
+            # with several jobs the models are loaded by the worker processes instead
+            self.sora_wm = SoraWM() if args.jobs <= 1 else None
             self.console = console
 
             # Statistics
@@ -176,27 +186,21 @@ def main():
             config_table.add_row("📁 Output folder:", f"[green]{self.output_folder}[/green]")
             config_table.add_row("🔍 Pattern:", f"[yellow]{self.pattern}[/yellow]")
             config_table.add_row("🎬 Videos found:", f"[bold magenta]{len(video_files)}[/bold magenta]")
+            config_table.add_row("⚙️  Jobs:", f"[bold]{args.jobs}[/bold]")
             console.print(config_table)
             console.print()
 
             # Create output folder
             self.output_folder.mkdir(parents=True, exist_ok=True)
 
+            if args.jobs > 1:
+                return self._process_parallel(video_files)
+
             # Process each video with batch-level progress bar
             start_time = datetime.now()
 
             # Create rich progress display
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(bar_width=40),
-                TaskProgressColumn(),
-                MofNCompleteColumn(),
-                SpeedColumn(),
-                TimeElapsedColumn(),
-                TimeRemainingColumn(),
-                console=console,
-            ) as progress:
+            with self._create_progress() as progress:
 
                 # Batch progress task
                 batch_task = progress.add_task(
@@ -255,6 +259,67 @@ def main():
             # Print summary
             self._print_summary(start_time)
 
+        def _create_progress(self) -> Progress:
+            """Create the rich progress display"""
+            return Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(bar_width=40),
+                TaskProgressColumn(),
+                MofNCompleteColumn(),
+                SpeedColumn(),
+                TimeElapsedColumn(),
+                TimeRemainingColumn(),
+                console=console,
+            )
+
+        def _process_parallel(self, video_files: List[Path]):
+            """Process the videos on worker processes, results arrive in completion order"""
+            jobs = [(path, self.output_folder / f"cleaned_{path.name}") for path in video_files]
+            job_index = {path: idx for idx, path in enumerate(video_files)}
+            video_tasks = {}
+
+            start_time = datetime.now()
+            with self._create_progress() as progress:
+                batch_task = progress.add_task(
+                    "[cyan]Overall Progress", total=len(video_files)
+                )
+
+                def progress_callback(idx: int, prog: int):
+                    """Update the progress bar of a video running in a worker"""
+                    if idx not in video_tasks:
+                        video_tasks[idx] = progress.add_task(
+                            f"  [green]{video_files[idx].name}", total=100
+                        )
+                    progress.update(video_tasks[idx], completed=prog)
+
+                results = iter_batch_parallel(
+                    SoraWM, {"segments": 1}, jobs, args.jobs, progress_callback
+                )
+                for done, result in enumerate(results, 1):
+                    idx = job_index[result.input_video_path]
+                    if idx in video_tasks:
+                        progress.remove_task(video_tasks.pop(idx))
+
+                    name = result.input_video_path.name
+                    if result.ok:
+                        self.successful.append(name)
+                        console.print(
+                            f"  [bold green]✅ Completed:[/bold green] {result.output_video_path.name} "
+                            f"[dim]({result.elapsed:.1f}s)[/dim]"
+                        )
+                    else:
+                        self.failed[name] = result.error
+                        console.print(f"  [bold red]❌ Error:[/bold red] {name}: {result.error}")
+
+                    progress.update(
+                        batch_task,
+                        advance=1,
+                        description=f"[cyan]Overall Progress ({done}/{len(video_files)})"
+                    )
+
+            self._print_summary(start_time)
+
         def _print_summary(self, start_time: datetime):
             """Print processing summary with rich formatting"""
             end_time = datetime.now()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Latency and output error of the CPU performance mode against plain fp32.
+
+    python -m sorawm.benchmarks.cpu_inference --names lama migan --crops 288x352 320x448
+    python -m sorawm.benchmarks.cpu_inference --names lama --threads 4 --detector
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from sorawm.iopaint.model_manager import ModelManager
+from sorawm.iopaint.schema import InpaintRequest
+from sorawm.utils.cpu_utils import CpuOptimizedModule
+from sorawm.utils.devices_utils import configure_cpu_threads, cpu_supports_bf16
+
+MODES = {
+    "fp32": None,
+    "frozen+channels_last": {"channels_last": True, "bf16": False},
+    "frozen+channels_last+bf16": {"channels_last": True, "bf16": True},
+}
+
+
+def make_crop(size: tuple[int, int], margin: int, seed: int = 0):
+    """Smooth texture rather than noise, closer to the background around a watermark."""
+    height, width = size
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    image = np.ascontiguousarray(
+        np.kron(small, np.ones((16, 16, 1), dtype=np.uint8))[:height, :width]
+    )
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[margin : height - margin, margin : width - margin] = 255
+    return image, mask
+
+
+def timed(fn, times: int):
+    fn()
+    # TorchScript profiles its first calls before optimizing the graph
+    fn()
+    elapsed = []
+    for _ in range(times):
+        start = time.perf_counter()
+        result = fn()
+        elapsed.append(time.perf_counter() - start)
+    return result, float(np.median(elapsed))
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255**2 / mse)
+
+
+def benchmark_inpaint(name: str, crops: list[tuple[int, int]], margin: int, times: int):
+    manager = ModelManager(name=name, device=torch.device("cpu"))
+    inpaint_model = manager.model
+    fp32_module = inpaint_model.model
+    config = InpaintRequest()
+    print(f"\n{name}, threads: {torch.get_num_threads()}, native bf16: {cpu_supports_bf16()}")
+    print(f"{'crop':>10} {'mode':>26} {'ms':>9} {'speedup':>8} {'max err':>8} {'psnr':>7}")
+    for height, width in crops:
+        image, mask = make_crop((height, width), min(margin, height // 4, width // 4))
+        baseline, baseline_time = None, None
+        for mode, options in MODES.items():
+            # freezing works on a copy, fp32_module stays the reference
+            inpaint_model.model = (
+                fp32_module if options is None else CpuOptimizedModule(fp32_module, **options)
+            )
+            result, elapsed = timed(lambda: manager(image, mask, config), times)
+            if baseline is None:
+                baseline, baseline_time = result, elapsed
+            error = np.abs(result.astype(np.int16) - baseline.astype(np.int16)).max()
+            print(
+                f"{f'{height}x{width}':>10} {mode:>26} {elapsed * 1000:>9.1f} "
+                f"{baseline_time / elapsed:>7.2f}x {error:>8} {psnr(result, baseline):>7.1f}"
+            )
+    inpaint_model.model = fp32_module
+
+
+def channels_last_share(model: torch.nn.Module) -> str:
+    """Conv weights (kernels larger than 1x1) stored channels_last."""
+    weights = [
+        module.weight
+        for module in model.modules()
+        if isinstance(module, torch.nn.Conv2d) and module.weight.shape[-1] > 1
+    ]
+    converted = sum(
+        weight.is_contiguous(memory_format=torch.channels_last) for weight in weights
+    )
+    return f"{converted}/{len(weights)}"
+
+
+def benchmark_detector(times: int, num_frames: int = 8):
+    from sorawm.watermark_detector import SoraWaterMarkDetector
+
+    frames = [make_crop((360, 640), 0, seed)[0] for seed in range(num_frames)]
+    detector = SoraWaterMarkDetector(cpu_optimize=False)
+    # the first call builds the predictor, which runs its own fused model
+    detector.detect_batch(frames[:1])
+    fused_model = detector.model.predictor.model.model
+    print(f"\ndetector, {num_frames} frames of 640x360")
+    print(f"{'mode':>26} {'ms/frame':>9} {'speedup':>8} {'channels_last':>14}")
+    baseline_time = None
+    for mode, options in MODES.items():
+        memory_format = torch.contiguous_format if options is None else torch.channels_last
+        fused_model.to(memory_format=memory_format)
+        detector.bf16 = options is not None and options["bf16"] and cpu_supports_bf16()
+        _, elapsed = timed(lambda: detector.detect_batch(frames), times)
+        baseline_time = baseline_time or elapsed
+        print(
+            f"{mode:>26} {elapsed * 1000 / num_frames:>9.1f} {baseline_time / elapsed:>7.2f}x "
+            f"{channels_last_share(fused_model):>14}"
+        )
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", default=["lama"], nargs="+", help="lama, migan, mat")
+    parser.add_argument(
+        "--crops", default=["288x352", "320x448"], nargs="+", help="HxW of the ROI windows"
+    )
+    parser.add_argument("--margin", default=128, type=int)
+    parser.add_argument("--threads", default=0, type=int)
+    parser.add_argument("--times", default=5, type=int)
+    parser.add_argument("--detector", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    configure_cpu_threads(args.threads)
+    crops = [tuple(int(v) for v in crop.lower().split("x")) for crop in args.crops]
+    for name in args.names:
+        benchmark_inpaint(name, crops, args.margin, args.times)
+    if args.detector:
+        benchmark_detector(args.times)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Detector throughput (frames/s) against batch size.
+
+    python -m sorawm.benchmarks.detect_batch --video resources/dog_vs_sam.mp4
+"""
+
+import argparse
+import time
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from sorawm.utils.video_utils import VideoLoader
+from sorawm.watermark_detector import SoraWaterMarkDetector
+
+
+def load_frames(video: Path | None, num_frames: int, size: tuple[int, int]):
+    if video is None:
+        height, width = size
+        return [
+            np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+            for _ in range(num_frames)
+        ]
+    # copy, the loader hands out read-only views on the pipe buffer
+    return [frame.copy() for frame in islice(VideoLoader(video), num_frames)]
+
+
+def benchmark(
+    detector: SoraWaterMarkDetector,
+    frames: list[np.ndarray],
+    batch_sizes: list[int],
+    imgsz: int | None,
+    times: int,
+):
+    # first call pays for model fusing and allocator warmup
+    detector.detect_batch(frames[: max(batch_sizes)], batch_size=max(batch_sizes), imgsz=imgsz)
+
+    print(f"frames: {len(frames)}, shape: {frames[0].shape}, imgsz: {imgsz or 'default'}")
+    print(f"{'batch':>6} {'frames/s':>10} {'ms/frame':>10} {'speedup':>8}")
+    baseline = None
+    for batch_size in batch_sizes:
+        elapsed = []
+        for _ in range(times):
+            start = time.perf_counter()
+            detector.detect_batch(frames, batch_size=batch_size, imgsz=imgsz)
+            elapsed.append(time.perf_counter() - start)
+        fps = len(frames) / np.median(elapsed)
+        baseline = baseline or fps
+        print(
+            f"{batch_size:>6} {fps:>10.2f} {1000 / fps:>10.2f} {fps / baseline:>7.2f}x"
+        )
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", type=Path, default=None)
+    parser.add_argument("--frames", default=64, type=int)
+    parser.add_argument("--height", default=1080, type=int)
+    parser.add_argument("--width", default=1920, type=int)
+    parser.add_argument("--batch-sizes", default=[1, 2, 4, 8, 16, 32], type=int, nargs="+")
+    parser.add_argument("--imgsz", default=None, type=int)
+    parser.add_argument("--times", default=3, type=int)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    frames = load_frames(args.video, args.frames, (args.height, args.width))
+    benchmark(SoraWaterMarkDetector(), frames, args.batch_sizes, args.imgsz, args.times)
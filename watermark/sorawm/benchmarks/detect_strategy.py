@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Speed and agreement of the hybrid template/YOLO detector against pure YOLO.
+
+    python -m sorawm.benchmarks.detect_strategy --video resources/dog_vs_sam.mp4
+    python -m sorawm.benchmarks.detect_strategy --video resources/dog_vs_sam.mp4 --thresholds 0.7 0.8 0.9
+"""
+
+import argparse
+import time
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from sorawm.utils.video_utils import VideoLoader
+from sorawm.watermark_detector import SoraWaterMarkDetector, TemplateTracker
+
+
+def load_frames(video: Path, num_frames: int | None, max_side: int | None):
+    loader = VideoLoader(video)
+    scale = max_side / max(loader.width, loader.height) if max_side else 1
+    if scale < 1:
+        frames = loader.iter_scaled(
+            round(loader.width * scale / 2) * 2, round(loader.height * scale / 2) * 2
+        )
+    else:
+        frames = iter(loader)
+    return list(islice(frames, num_frames))
+
+
+def run(detector: SoraWaterMarkDetector, frames: list[np.ndarray]):
+    detector.reset()
+    detections = []
+    start = time.perf_counter()
+    for idx in range(0, len(frames), detector.batch_size):
+        detections.extend(detector.detect_batch(frames[idx : idx + detector.batch_size]))
+    return detections, time.perf_counter() - start
+
+
+def iou(a, b) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(detections: list[dict], reference: list[dict]) -> str:
+    same_flag = np.mean([d["detected"] == r["detected"] for d, r in zip(detections, reference)])
+    both = [iou(d["bbox"], r["bbox"]) for d, r in zip(detections, reference) if d["detected"] and r["detected"]]
+    mean_iou = f"{np.mean(both):.3f}" if both else "-"
+    return f"flag {same_flag:.1%}, mean IoU {mean_iou}"
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", type=Path, required=True)
+    parser.add_argument("--frames", default=None, type=int)
+    parser.add_argument(
+        "--max-side", default=640, type=int, help="decode size, as the detection pass does"
+    )
+    parser.add_argument("--thresholds", default=[0.8], type=float, nargs="+")
+    parser.add_argument("--max-interval", default=60, type=int)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    frames = load_frames(args.video, args.frames, args.max_side)
+    print(f"frames: {len(frames)}, shape: {frames[0].shape}")
+
+    detector = SoraWaterMarkDetector(strategy="yolo")
+    # first call pays for model fusing and allocator warmup
+    detector.detect_batch(frames[: detector.batch_size])
+    reference, yolo_time = run(detector, frames)
+
+    print(f"{'strategy':>18} {'frames/s':>10} {'speedup':>8} {'yolo frames':>12}  agreement with yolo")
+    print(f"{'yolo':>18} {len(frames) / yolo_time:>10.2f} {1:>7.2f}x {len(frames):>12}")
+    for threshold in args.thresholds:
+        detector.strategy = "hybrid"
+        detector.template_tracker = TemplateTracker(
+            threshold=threshold, max_interval=args.max_interval
+        )
+        detections, elapsed = run(detector, frames)
+        print(
+            f"{f'hybrid@{threshold}':>18} {len(frames) / elapsed:>10.2f} "
+            f"{yolo_time / elapsed:>7.2f}x {detector.yolo_frames:>12}  "
+            f"{agreement(detections, reference)}"
+        )
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Bytes allocated per decoded frame, with and without reusable frame buffers.
+
+    python -m sorawm.benchmarks.frame_reader --video resources/dog_vs_sam.mp4
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from sorawm.utils.video_utils import VideoLoader
+
+
+def measure(video: Path, reuse_buffers: bool, max_frames: int | None):
+    loader = VideoLoader(video, reuse_buffers=reuse_buffers)
+    frames = iter(loader)
+    allocated = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        while max_frames is None or len(allocated) < max_frames:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            frame = next(frames, None)
+            if frame is None:
+                break
+            _, peak = tracemalloc.get_traced_memory()
+            allocated.append(peak - before)
+            # a consumer touching the frame, it must be writable without a copy
+            frame[0, 0] = 0
+            loader.release(frame)
+        elapsed = time.perf_counter() - start
+    finally:
+        tracemalloc.stop()
+        frames.close()
+    # the first frames fill the pool, report the steady state separately
+    steady = allocated[len(allocated) // 10 :] or allocated
+    pool = loader.buffer_pool
+    return {
+        "frames": len(allocated),
+        "fps": len(allocated) / elapsed,
+        "bytes/frame": float(np.mean(allocated)),
+        "steady bytes/frame": float(np.mean(steady)),
+        "buffers": pool.allocated if pool is not None else len(allocated),
+    }
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", type=Path, required=True)
+    parser.add_argument("--frames", default=None, type=int)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    print(f"{'mode':>8} {'frames':>7} {'fps':>8} {'bytes/frame':>13} {'steady':>13} {'buffers':>8}")
+    for reuse_buffers in (False, True):
+        stats = measure(args.video, reuse_buffers, args.frames)
+        print(
+            f"{'pool' if reuse_buffers else 'alloc':>8} {stats['frames']:>7} {stats['fps']:>8.1f} "
+            f"{stats['bytes/frame']:>13,.0f} {stats['steady bytes/frame']:>13,.0f} "
+            f"{stats['buffers']:>8}"
+        )
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Speed and agreement of the linear imputation against the KernelCPD reference.
+
+    # detection trace of a real video (saved with --save-trace for later runs)
+    python -m sorawm.benchmarks.imputation --video resources/dog_vs_sam.mp4 --save-trace trace.json
+    python -m sorawm.benchmarks.imputation --trace trace.json
+    # synthetic trace: watermark jumping between corners with missed detections
+    python -m sorawm.benchmarks.imputation --frames 20000 --miss-rate 0.1
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from sorawm.utils.imputation_utils import impute_bboxes_kernel_cpd, impute_bboxes_linear
+
+
+def detect_trace(video: Path) -> list:
+    from sorawm.utils.video_utils import VideoLoader
+    from sorawm.watermark_detector import SoraWaterMarkDetector
+
+    detector = SoraWaterMarkDetector()
+    loader = VideoLoader(video)
+    trace = []
+    batch = []
+    for frame in loader:
+        batch.append(frame)
+        if len(batch) == detector.batch_size:
+            trace.extend(result["bbox"] for result in detector.detect_batch(batch))
+            batch = []
+    if batch:
+        trace.extend(result["bbox"] for result in detector.detect_batch(batch))
+    return trace
+
+
+def synthetic_trace(num_frames: int, miss_rate: float, seed: int = 0):
+    """Watermark that hops between positions every few seconds, with jitter and misses."""
+    rng = np.random.default_rng(seed)
+    positions = [(60, 60), (1600, 60), (60, 900), (1600, 900), (830, 480)]
+    truth, trace = [], []
+    idx = 0
+    while idx < num_frames:
+        x, y = positions[rng.integers(len(positions))]
+        for _ in range(int(rng.integers(90, 300))):
+            bbox = (x, y, x + 240, y + 90)
+            truth.append(bbox)
+            if rng.random() < miss_rate:
+                trace.append(None)
+            else:
+                jitter = rng.integers(-3, 4, size=4)
+                trace.append(tuple(int(v) for v in np.add(bbox, jitter)))
+            idx += 1
+    return trace[:num_frames], truth[:num_frames]
+
+
+def iou(a, b) -> float:
+    if a is None or b is None:
+        return float(a is None and b is None)
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(filled, reference, missed) -> str:
+    if not missed:
+        return "-"
+    scores = np.array([iou(filled[idx], reference[idx]) for idx in missed])
+    return f"mean IoU {scores.mean():.3f}, IoU>=0.5 {np.mean(scores >= 0.5):.1%}"
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", type=Path, default=None)
+    parser.add_argument("--trace", type=Path, default=None, help="json list of bboxes or null")
+    parser.add_argument("--save-trace", type=Path, default=None)
+    parser.add_argument("--frames", default=5000, type=int)
+    parser.add_argument("--miss-rate", default=0.05, type=float)
+    parser.add_argument("--skip-cpd-above", default=10000, type=int, help="KernelCPD is quadratic")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    truth = None
+    if args.trace is not None:
+        trace = [tuple(bbox) if bbox else None for bbox in json.loads(args.trace.read_text())]
+    elif args.video is not None:
+        trace = detect_trace(args.video)
+    else:
+        trace, truth = synthetic_trace(args.frames, args.miss_rate)
+    if args.save_trace is not None:
+        args.save_trace.write_text(json.dumps(trace))
+
+    missed = [idx for idx, bbox in enumerate(trace) if bbox is None]
+    print(f"frames: {len(trace)}, missed: {len(missed)}")
+
+    linear, linear_time = timed(impute_bboxes_linear, trace)
+    cpd, cpd_time = None, None
+    if len(trace) <= args.skip_cpd_above:
+        cpd, cpd_time = timed(impute_bboxes_kernel_cpd, trace)
+
+    print(f"{'method':>22} {'time (s)':>10}  agreement on missed frames")
+    rows = [
+        ("kernel_cpd", cpd, cpd_time),
+        ("linear", linear, linear_time),
+    ]
+    for name, filled, elapsed in rows:
+        if filled is None:
+            print(f"{name:>22} {'skipped':>10}")
+            continue
+        reference = truth if truth is not None else cpd
+        against = "truth" if truth is not None else "kernel_cpd"
+        print(
+            f"{name:>22} {elapsed:>10.3f}  vs {against}: "
+            f"{agreement(filled, reference, missed) if reference else '-'}"
+        )
+    if truth is not None and cpd is not None:
+        print(f"{'':>22} {'':>10}  linear vs kernel_cpd: {agreement(linear, cpd, missed)}")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Inpainting throughput (crops/s) against batch size on watermark-sized ROI crops.
+
+    python -m sorawm.benchmarks.lama_batch --device cpu --crop 288x352
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from sorawm.iopaint.model_manager import ModelManager
+from sorawm.iopaint.schema import InpaintRequest
+
+
+def make_crops(num_crops: int, size: tuple[int, int], margin: int):
+    height, width = size
+    images = [
+        np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        for _ in range(num_crops)
+    ]
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[margin : height - margin, margin : width - margin] = 255
+    return images, [mask] * num_crops
+
+
+def benchmark(
+    model: ModelManager,
+    images: list[np.ndarray],
+    masks: list[np.ndarray],
+    batch_sizes: list[int],
+    times: int,
+):
+    config = InpaintRequest()
+    # the first calls pay for TorchScript profiling and allocator warmup
+    warmup = max(batch_sizes)
+    for _ in range(2):
+        model.batch(images[:warmup], masks[:warmup], config, batch_size=warmup)
+
+    print(f"crops: {len(images)}, shape: {images[0].shape}, threads: {torch.get_num_threads()}")
+    print(f"{'batch':>6} {'crops/s':>10} {'ms/crop':>10} {'speedup':>8}")
+    baseline = None
+    for batch_size in batch_sizes:
+        elapsed = []
+        for _ in range(times):
+            start = time.perf_counter()
+            model.batch(images, masks, config, batch_size=batch_size)
+            elapsed.append(time.perf_counter() - start)
+        throughput = len(images) / np.median(elapsed)
+        baseline = baseline or throughput
+        print(
+            f"{batch_size:>6} {throughput:>10.2f} {1000 / throughput:>10.2f} "
+            f"{throughput / baseline:>7.2f}x"
+        )
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", default="lama")
+    parser.add_argument("--device", default="cpu", type=str)
+    parser.add_argument("--crop", default="288x352", type=str, help="HxW of the ROI crop")
+    parser.add_argument("--margin", default=128, type=int)
+    parser.add_argument("--crops", default=32, type=int)
+    parser.add_argument("--batch-sizes", default=[1, 2, 4, 8, 16], type=int, nargs="+")
+    parser.add_argument("--times", default=3, type=int)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    height, width = (int(v) for v in args.crop.lower().split("x"))
+    images, masks = make_crops(args.crops, (height, width), min(args.margin, height // 4, width // 4))
+    model = ModelManager(name=args.name, device=torch.device(args.device))
+    benchmark(model, images, masks, args.batch_sizes, args.times)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Sustained task submissions per second of the server, on a scratch SQLite database.
+
+    python -m sorawm.benchmarks.server_load --clients 32 --duration 10
+    python -m sorawm.benchmarks.server_load --clients 32 --pollers 200 --process
+
+The clients POST small uploads to /submit_remove_task in a loop through an
+in-process ASGI transport, so the numbers are those of the submission path
+(upload, task rows, queueing) rather than of the network. The models are not
+loaded: with --process the worker coroutines run every task with a stand-in that
+reports progress and writes the output at once, so status and progress writes
+compete with the submissions. Pollers read /get_results of a submitted task every
+--poll-interval seconds, like clients waiting for their result.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+class _InstantRun:
+    """Stands in for SoraWM: reports progress and writes the output without models."""
+
+    def run(
+        self,
+        input_video_path,
+        output_video_path,
+        progress_callback=None,
+        quiet=True,
+        content_hash=None,
+    ):
+        if progress_callback is not None:
+            for percentage in range(0, 100, 10):
+                progress_callback(percentage)
+        Path(output_video_path).write_bytes(b"")
+
+
+async def load(
+    clients: int,
+    pollers: int,
+    poll_interval: float,
+    duration: float,
+    size: int,
+    process: bool,
+    workdir: Path,
+) -> dict:
+    import httpx
+    from fastapi import FastAPI
+
+    from sorawm.server.db import init_db
+    from sorawm.server.router import router
+    from sorawm.server.worker import worker
+
+    worker.upload_dir = workdir / "uploads"
+    worker.output_dir = workdir / "outputs"
+    worker.upload_dir.mkdir()
+    worker.output_dir.mkdir()
+    worker.retention_hours = 0
+    await init_db()
+    if process:
+        worker.sora_wm = _InstantRun()
+        worker.start()
+
+    app = FastAPI()
+    app.include_router(router)
+    latencies = []
+    task_ids = []
+    failures = 0
+    deadline = time.perf_counter() + duration
+
+    async def submit(client: httpx.AsyncClient, index: int):
+        nonlocal failures
+        # distinct content, or the uploads would be deduplicated
+        payload = os.urandom(size)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.post(
+                "/submit_remove_task",
+                files={"video": (f"{index}.mp4", payload, "video/mp4")},
+            )
+            if response.is_error:
+                # e.g. "database is locked" under write contention
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            task_ids.append(response.json()["task_id"])
+            payload = os.urandom(size)
+
+    async def poll(client: httpx.AsyncClient):
+        polls = 0
+        # spread the pollers over the interval
+        await asyncio.sleep(random.uniform(0, poll_interval))
+        while time.perf_counter() < deadline:
+            if not task_ids:
+                await asyncio.sleep(poll_interval)
+                continue
+            response = await client.get(
+                "/get_results", params={"remove_task_id": random.choice(task_ids)}
+            )
+            polls += not response.is_error
+            await asyncio.sleep(poll_interval)
+        return polls
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(submit(client, index) for index in range(clients)),
+            *(poll(client) for _ in range(pollers)),
+        )
+        elapsed = time.perf_counter() - started
+        if process:
+            await worker.queue.join()
+            await worker.stop()
+        await worker.repository.stop()
+        statuses = await worker.repository.count_by_status()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "submissions": len(latencies),
+        "failures": failures,
+        "per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "polls_per_second": sum(results[clients:]) / elapsed,
+        "statuses": statuses,
+    }
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", default=32, type=int, help="concurrent submitters")
+    parser.add_argument("--pollers", default=0, type=int, help="concurrent /get_results")
+    parser.add_argument("--poll-interval", default=0.5, type=float, help="seconds")
+    parser.add_argument("--duration", default=10.0, type=float, help="seconds")
+    parser.add_argument("--size", default=16 * 1024, type=int, help="upload bytes")
+    parser.add_argument(
+        "--process", action="store_true", help="run the tasks with an instant stand-in"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    workdir = Path(tempfile.mkdtemp(prefix="sorawm-load-"))
+    try:
+        # the server modules read the database path when imported
+        import sorawm.configs
+
+        sorawm.configs.SQLITE_PATH = workdir / "db.sqlite"
+        stats = asyncio.run(
+            load(
+                args.clients,
+                args.pollers,
+                args.poll_interval,
+                args.duration,
+                args.size,
+                args.process,
+                workdir,
+            )
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(
+        f"{stats['submissions']} submissions ({stats['failures']} failed), "
+        f"{stats['per_second']:.1f}/s, "
+        f"latency p50 {stats['p50_ms']:.1f} ms p99 {stats['p99_ms']:.1f} ms"
+        + (f", {stats['polls_per_second']:.1f} polls/s" if args.pollers else "")
+    )
+    print("tasks by status:", stats["statuses"])
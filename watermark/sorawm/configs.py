@@ -10,13 +10,96 @@ WATER_MARK_DETECT_YOLO_WEIGHTS = RESOURCES_DIR / "best.pt"
 
 WATER_MARK_DETECT_YOLO_WEIGHTS_HASH_JSON = RESOURCES_DIR / "model_version.json"
 
+# Inference backend of the detector and the lama inpainting model: "torch", or "onnx" to
+# run the exports of `python -m sorawm.onnx_export` with ONNX Runtime on CPU nodes.
+INFERENCE_BACKEND = "torch"
+ONNX_DIR = RESOURCES_DIR / "onnx"
+DETECTOR_ONNX_PATH = ONNX_DIR / "detector.onnx"
+LAMA_ONNX_PATH = ONNX_DIR / "big-lama.onnx"
+MIGAN_ONNX_PATH = ONNX_DIR / "migan.onnx"
+# The first use of an export compares its output with torch, an error (max abs diff
+# relative to the output range) above this falls back to torch.
+ONNX_PARITY_TOLERANCE = 1e-3
+# Reuse the input/output buffers of the lama session for repeated ROI shapes.
+ONNX_IO_BINDING = True
+
+# INT8 variants of the erase models ("lama-int8", "migan-int8"), built by
+# `python -m sorawm.quantize`. A variant is only enabled when, on watermark crops held
+# out from the calibration, its inpainted regions stay within these PSNR (dB) and SSIM
+# bounds of the fp32 model.
+QUANT_MIN_PSNR = 30.0
+QUANT_MIN_SSIM = 0.95
+
+# CPU performance mode of the torch backend, used when no accelerator is available: the
+# erase models (lama, migan, mat) run as frozen TorchScript graphs with oneDNN-prepacked
+# weights and channels_last tensors, the detector with channels_last weights. CPU_BF16
+# adds bf16 autocast on CPUs with native bf16 (AVX512-BF16 or AMX), its output error is
+# reported by sorawm.benchmarks.cpu_inference.
+CPU_OPTIMIZE = False
+CPU_BF16 = False
+# torch intra-op threads, 0 keeps the default of one per core. The worker processes of
+# the segment and batch modes get their share of the cores instead.
+CPU_THREADS = 0
+
+# Frames per YOLO forward pass during detection.
+DETECT_BATCH_SIZE = 8
+# YOLO inference size, None keeps the size the weights were trained with.
+DETECT_IMGSZ = None
+# The detector gets frames whose longest side is at most this (or DETECT_IMGSZ if
+# larger), YOLO letterboxes them to its inference size anyway. When the detection pass
+# decodes the video by itself ffmpeg scales them while decoding; with the spool the
+# full frames are decoded once for both passes and cv2 resizes them for the detector.
+# 0 detects on full resolution frames.
+DETECT_DECODE_MAX_SIDE = 640
+
+# Detector strategy: "yolo" runs the model on every frame, "hybrid" first looks for the
+# watermark by normalized template correlation around the positions YOLO found it at
+# in the video, with the crop of the last YOLO detection as the template, and only runs
+# YOLO on the frames where the correlation stays below DETECT_TEMPLATE_THRESHOLD.
+DETECT_STRATEGY = "yolo"
+DETECT_TEMPLATE_THRESHOLD = 0.8
+# Search window around a known position, in template sizes on every side.
+DETECT_TEMPLATE_SEARCH_MARGIN = 0.5
+# YOLO runs again after this many template matches in a row, so the template follows
+# slow changes of the watermark.
+DETECT_TEMPLATE_MAX_INTERVAL = 60
+
+# Sparse detection: run YOLO every SPARSE_DETECT_INTERVAL frames and keep the previous
+# bbox in between while the watermark ROI barely changes (mean abs diff in grayscale).
+SPARSE_DETECTION = False
+SPARSE_DETECT_INTERVAL = 30
+# Frames between detector calls while no watermark is currently known.
+SPARSE_DETECT_MISS_INTERVAL = 5
+SPARSE_ROI_DIFF_THRESHOLD = 12.0
+
+# Imputation of missed detections: "linear" segments the bbox centers in one pass,
+# "kernel_cpd" is the quadratic ruptures KernelCPD reference.
+IMPUTATION_METHOD = "linear"
+# A new watermark position starts where the center moves more than IMPUTE_JUMP bbox
+# sizes away and IMPUTE_MIN_SEGMENT detections in a row agree on it.
+IMPUTE_JUMP = 0.5
+IMPUTE_MIN_SEGMENT = 3
+
 
 OUTPUT_DIR = ROOT / "output"
 
 OUTPUT_DIR.mkdir(exist_ok=True, parents=True)
 
 
+# "lama-int8" or "migan-int8" for the quantized variants, once they passed the gate;
+# until then the cleaner falls back to the fp32 model.
 DEFAULT_WATERMARK_REMOVE_MODEL = "lama"
+# Context (in pixels) kept around the watermark bbox when inpainting only the ROI.
+CLEAN_ROI_MARGIN = 128
+# Same-sized ROI crops per inpainting model call.
+CLEAN_BATCH_SIZE = 4
+# Memory budget of the LRU cache of inpainted patches, 0 disables it. Duplicated frames
+# and static backgrounds give identical ROI crops that reuse the cached patch.
+INPAINT_CACHE_MAX_BYTES = 256 * 1024**2
+# Key the cache on a quantized thumbnail of the crop so near-duplicates also hit. Off
+# by default: the thumbnail misses small or slow motion under the watermark, which
+# then reuses a stale patch and looks frozen. Only for truly static footage.
+INPAINT_CACHE_NEAR_DUPLICATE = False
 
 WORKING_DIR = ROOT / "working_dir"
 WORKING_DIR.mkdir(exist_ok=True, parents=True)
@@ -28,3 +111,71 @@ DATA_PATH = ROOT / "data"
 DATA_PATH.mkdir(exist_ok=True, parents=True)
 
 SQLITE_PATH = DATA_PATH / "db.sqlite3"
+# Milliseconds a connection waits for the lock of the database before failing, and
+# the most writes the single writer of the server commits in one transaction.
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_WRITE_BATCH = 256
+
+# Uploads to /submit_remove_task are streamed to disk in chunks of this size, larger
+# videos are rejected with a 413 as soon as they cross the limit.
+UPLOAD_CHUNK_BYTES = 1024**2
+UPLOAD_MAX_BYTES = 2 * 1024**3
+# Finished, failed and cancelled server tasks are deleted this many hours after their
+# last update, with their upload. Outputs shared by resubmissions of the same video are
+# reference counted and removed with the last task using them. 0 keeps tasks forever.
+TASK_RETENTION_HOURS = 24 * 7
+# Progress reports of the server are kept in memory and pushed to the event streams,
+# the percentages are written to the database in one batch every this many seconds.
+PROGRESS_FLUSH_INTERVAL = 1.0
+# Seconds between keep-alive comments on an idle task event stream, below the idle
+# timeout of the usual proxies.
+SSE_KEEPALIVE_INTERVAL = 15.0
+# Delivery of the completion webhook (SORA_WEBHOOK_URL): attempts and timeout in
+# seconds of each one, retries back off exponentially from 1s.
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_TIMEOUT = 10.0
+
+# Keep the raw detections of every video on disk, keyed by a hash of its content, the
+# detector weights and the detection settings, so processing the same video again skips
+# the detection pass.
+TRACK_CACHE = True
+TRACK_CACHE_DIR = DATA_PATH / "tracks"
+# Oldest tracks are removed past this size, a track takes about 11 bytes per frame.
+TRACK_CACHE_MAX_BYTES = 256 * 1024**2
+
+# Optimized model artifacts reused across restarts: ONNX Runtime sessions load the graph
+# they optimized for this machine the first time. None disables it. The frozen
+# TorchScript graphs of the CPU mode do not serialize, warmup covers those.
+ARTIFACT_CACHE_DIR = DATA_PATH / "artifacts"
+
+# The server runs the detector and the erase model on synthetic frames of these
+# (width, height) sizes before taking jobs, so the first job does not pay for the
+# TorchScript profiling runs, allocator growth and the ultralytics predictor setup.
+WARMUP = True
+WARMUP_FRAME_SIZES = [(1280, 720), (720, 1280)]
+# (width, height) of the synthetic watermark bbox, about the Sora watermark at 720p.
+WARMUP_WATERMARK_SIZE = (180, 60)
+
+# Decode the input once and spool the raw frames to a memory-mapped file, so the
+# removal pass reads them back from the page cache instead of running ffmpeg again.
+SINGLE_DECODE = True
+# Videos whose raw frames would exceed this budget fall back to decoding twice.
+SPOOL_MAX_BYTES = 8 * 1024**3
+SPOOL_DIR = WORKING_DIR / "spool"
+
+# Frames buffered between the decode, model and encode stages, which run in their own
+# threads so ffmpeg and the model work at the same time. 0 runs the stages serially.
+PIPELINE_QUEUE_SIZE = 8
+# Decode into a pool of reusable frame buffers instead of allocating every frame.
+REUSE_FRAME_BUFFERS = True
+
+# Split a video at keyframes into this many segments processed by separate worker
+# processes, 1 disables it and 0 sizes it to the available cores.
+PARALLEL_SEGMENTS = 1
+PARALLEL_MIN_SEGMENT_SECONDS = 10
+# torch threads per worker when sizing the segment count automatically
+PARALLEL_THREADS_PER_WORKER = 4
+
+# Videos processed at once by SoraWM.run_batch, each in its own worker process
+# with its own models.
+BATCH_JOBS = 1
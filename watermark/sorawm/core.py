@@ -1,32 +1,181 @@
+import time
+from collections import deque
+from itertools import batched
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable
 
+import cv2
 import ffmpeg
 import numpy as np
 from loguru import logger
 from tqdm import tqdm
 
-from sorawm.utils.video_utils import VideoLoader
+from sorawm.configs import (
+    BATCH_JOBS,
+    CPU_THREADS,
+    DETECT_DECODE_MAX_SIDE,
+    IMPUTATION_METHOD,
+    IMPUTE_JUMP,
+    IMPUTE_MIN_SEGMENT,
+    PARALLEL_SEGMENTS,
+    PIPELINE_QUEUE_SIZE,
+    REUSE_FRAME_BUFFERS,
+    SINGLE_DECODE,
+    SPARSE_DETECTION,
+    SPOOL_MAX_BYTES,
+    TRACK_CACHE,
+    TRACK_CACHE_DIR,
+    TRACK_CACHE_MAX_BYTES,
+    WARMUP_FRAME_SIZES,
+    WARMUP_WATERMARK_SIZE,
+)
+from sorawm.parallel import (
+    BatchResult,
+    auto_segment_count,
+    iter_batch_parallel,
+    run_chunked,
+)
+from sorawm.utils.pipeline_utils import FrameWriter, StageTimer, prefetch
+from sorawm.utils.devices_utils import configure_cpu_threads
+from sorawm.utils.track_cache import DetectionTrack, TrackCache
+from sorawm.utils.video_utils import FrameSpool, VideoLoader, audio_output_options
 from sorawm.watermark_cleaner import WaterMarkCleaner
-from sorawm.watermark_detector import SoraWaterMarkDetector
+from sorawm.watermark_detector import SoraWaterMarkDetector, SparseWaterMarkDetector
 from sorawm.utils.imputation_utils import (
-    find_2d_data_bkps,
-    get_interval_average_bbox,
-    find_idxs_interval,
+    impute_bboxes_kernel_cpd,
+    impute_bboxes_linear,
 )
 
 VIDEO_EXTENSIONS = [".mp4", ".avi", ".mov", ".mkv", ".flv", ".wmv", ".webm"]
 
+
+def _synthetic_frames(width: int, height: int, count: int) -> list[np.ndarray]:
+    """Smooth random textures, the models take the same paths as on real frames."""
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+        frames.append(
+            np.ascontiguousarray(
+                np.kron(small, np.ones((16, 16, 1), dtype=np.uint8))[:height, :width]
+            )
+        )
+    return frames
+
+
+def _resized_frames(
+    frames: Iterable[np.ndarray],
+    size: tuple[int, int],
+    release: Callable[[np.ndarray], None],
+) -> Iterable[np.ndarray]:
+    # the source frame goes back to the decoder as soon as it is resized
+    for frame in frames:
+        resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        release(frame)
+        yield resized
+
+
+def _track_frames(frames: Iterable[np.ndarray], in_flight: deque) -> Iterable[np.ndarray]:
+    for frame in frames:
+        in_flight.append(frame)
+        yield frame
+
+
 class SoraWM:
-    def __init__(self):
+    def __init__(
+        self,
+        single_decode: bool = SINGLE_DECODE,
+        spool_max_bytes: int = SPOOL_MAX_BYTES,
+        sparse_detection: bool = SPARSE_DETECTION,
+        pipeline_queue_size: int = PIPELINE_QUEUE_SIZE,
+        segments: int = PARALLEL_SEGMENTS,
+        reuse_frame_buffers: bool = REUSE_FRAME_BUFFERS,
+        detect_decode_max_side: int = DETECT_DECODE_MAX_SIDE,
+        track_cache: bool = TRACK_CACHE,
+        cpu_threads: int = CPU_THREADS,
+    ):
+        configure_cpu_threads(cpu_threads)
+        loading = time.perf_counter()
         self.detector = SoraWaterMarkDetector()
         self.cleaner = WaterMarkCleaner()
+        logger.info(f"models loaded in {time.perf_counter() - loading:.2f}s")
+        self.single_decode = single_decode
+        self.spool_max_bytes = spool_max_bytes
+        self.pipeline_queue_size = pipeline_queue_size
+        self.segments = segments
+        self.reuse_frame_buffers = reuse_frame_buffers
+        self.detect_decode_max_side = detect_decode_max_side
+        self.sparse_detector = (
+            SparseWaterMarkDetector(self.detector) if sparse_detection else None
+        )
+        self.track_cache = (
+            TrackCache(TRACK_CACHE_DIR, TRACK_CACHE_MAX_BYTES) if track_cache else None
+        )
+
+    def worker_kwargs(self) -> dict:
+        """Arguments that rebuild this configuration in a worker process."""
+        return {
+            "single_decode": self.single_decode,
+            "spool_max_bytes": self.spool_max_bytes,
+            "sparse_detection": self.sparse_detector is not None,
+            "pipeline_queue_size": self.pipeline_queue_size,
+            "segments": 1,
+            "reuse_frame_buffers": self.reuse_frame_buffers,
+            "detect_decode_max_side": self.detect_decode_max_side,
+            "track_cache": self.track_cache is not None,
+            # the pool sets the threads of every worker
+            "cpu_threads": 0,
+        }
+
+    def warmup(
+        self,
+        frame_sizes: Iterable[tuple[int, int]] = WARMUP_FRAME_SIZES,
+        watermark_size: tuple[int, int] = WARMUP_WATERMARK_SIZE,
+        runs: int = 2,
+    ) -> dict[tuple[int, int], list[float]]:
+        """Run the detection and removal passes on synthetic frames of ``frame_sizes``.
+
+        The first calls of the models pay for the ultralytics predictor setup, the
+        TorchScript profiling runs and the allocator growing its pools, per input
+        shape. Doing it here moves that cost out of the first job. Returns the
+        seconds of every run per (width, height), the first one is a cold start.
+        """
+        cache, self.cleaner.cache = self.cleaner.cache, None
+        timings = {}
+        try:
+            for width, height in frame_sizes:
+                frames = _synthetic_frames(width, height, self.cleaner.batch_size)
+                size = self._detection_decode_size(width, height) or (width, height)
+                detect_frames = _synthetic_frames(*size, self.detector.batch_size)
+                bbox_width, bbox_height = watermark_size
+                x1 = max(0, (width - bbox_width) // 2)
+                y1 = max(0, (height - bbox_height) // 2)
+                bbox = (x1, y1, min(width, x1 + bbox_width), min(height, y1 + bbox_height))
+                elapsed = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    self.detector.reset()
+                    self.detector.detect_batch(detect_frames)
+                    self.cleaner.clean_roi_batch(
+                        [frame.copy() for frame in frames], [bbox] * len(frames)
+                    )
+                    elapsed.append(time.perf_counter() - start)
+                timings[(width, height)] = elapsed
+                logger.info(
+                    f"Warmup {width}x{height}: first run {elapsed[0]:.2f}s, "
+                    f"last run {elapsed[-1]:.2f}s"
+                )
+        finally:
+            self.detector.reset()
+            self.cleaner.cache = cache
+        return timings
 
     def run_batch(self, input_video_dir_path: Path,
         output_video_dir_path: Path | None = None,
         progress_callback: Callable[[int], None] | None = None,
         quiet: bool = False,
-        ):
+        jobs: int = BATCH_JOBS,
+        ) -> list[BatchResult]:
         if output_video_dir_path is None:
             output_video_dir_path = input_video_dir_path.parent / "watermark_removed"
             if not quiet:
@@ -39,8 +188,17 @@ class SoraWM:
         video_lengths = len(input_video_paths)
         if not quiet:
             logger.info(f"Found {video_lengths} video(s) to process")
+        if jobs > 1 and video_lengths > 1:
+            return self._run_batch_parallel(
+                [(path, output_video_dir_path / path.name) for path in input_video_paths],
+                jobs,
+                progress_callback,
+                quiet,
+            )
+        results = []
         for idx, input_video_path in enumerate(tqdm(input_video_paths, desc="Processing videos", disable=quiet)):
             output_video_path = output_video_dir_path / input_video_path.name            
+            start = time.perf_counter()
             if progress_callback:
                 def batch_progress_callback(single_video_progress: int):
                     overall_progress = int((idx / video_lengths) * 100 + (single_video_progress / video_lengths))
@@ -49,6 +207,46 @@ class SoraWM:
                 self.run(input_video_path, output_video_path, progress_callback=batch_progress_callback, quiet=quiet)
             else:
                 self.run(input_video_path, output_video_path, progress_callback=None, quiet=quiet)
+            results.append(
+                BatchResult(
+                    input_video_path, output_video_path, elapsed=time.perf_counter() - start
+                )
+            )
+        return results
+
+    def _run_batch_parallel(
+        self,
+        jobs: list[tuple[Path, Path]],
+        num_jobs: int,
+        progress_callback: Callable[[int], None] | None = None,
+        quiet: bool = False,
+    ) -> list[BatchResult]:
+        # every worker process loads its own models, errors are collected per video
+        video_progress = [0] * len(jobs)
+        job_index = {input_path: idx for idx, (input_path, _) in enumerate(jobs)}
+
+        def on_progress(idx: int, progress: int):
+            video_progress[idx] = progress
+            if progress_callback:
+                progress_callback(min(int(sum(video_progress) / len(jobs)), 100))
+
+        results = []
+        for result in tqdm(
+            iter_batch_parallel(
+                type(self), self.worker_kwargs(), jobs, num_jobs, on_progress
+            ),
+            total=len(jobs),
+            desc="Processing videos",
+            disable=quiet,
+        ):
+            on_progress(job_index[result.input_video_path], 100)
+            if result.ok:
+                if not quiet:
+                    logger.info(f"Finished {result.input_video_path} in {result.elapsed:.1f}s")
+            else:
+                logger.error(f"Failed {result.input_video_path}: {result.error}")
+            results.append(result)
+        return results
 
     def run(
         self,
@@ -56,15 +254,117 @@ class SoraWM:
         output_video_path: Path,
         progress_callback: Callable[[int], None] | None = None,
         quiet: bool = False,
+        content_hash: str | None = None,
     ):
-        input_video_loader = VideoLoader(input_video_path)
+        """``content_hash`` is the blake2b of the video when the caller already has
+        it, e.g. the server from the upload, the track cache then skips hashing."""
+        started = time.perf_counter()
+        input_video_loader = VideoLoader(
+            input_video_path, reuse_buffers=self.reuse_frame_buffers
+        )
+        segments = self.segments or auto_segment_count(
+            input_video_loader.total_frames / input_video_loader.fps
+        )
+        # segments are detected by their worker processes, each decoding its own
+        single_decode = segments == 1 and self._spool_fits(input_video_loader)
+        track_key = self.track_key(
+            input_video_path, "spool" if single_decode else "decode", content_hash
+        )
+        track = self.track_cache.get(track_key) if track_key else None
+        if track is not None and not quiet:
+            logger.info(f"Reusing the cached detections of {input_video_path}")
+        if segments > 1:
+            return run_chunked(
+                self,
+                input_video_path,
+                output_video_path,
+                segments,
+                progress_callback,
+                quiet,
+                track=track,
+                track_key=track_key,
+            )
         output_video_path.parent.mkdir(parents=True, exist_ok=True)
         width = input_video_loader.width
         height = input_video_loader.height
         fps = input_video_loader.fps
         total_frames = input_video_loader.total_frames
 
-        temp_output_path = output_video_path.parent / f"temp_{output_video_path.name}"
+        if not quiet:
+            logger.debug(
+                f"total frames: {total_frames}, fps: {fps}, width: {width}, height: {height}"
+            )
+        # with cached detections the video is only decoded once anyway
+        spool = self._create_spool(input_video_loader, quiet) if track is None else None
+        timer = StageTimer()
+        start = time.perf_counter()
+        process_out = None
+        try:
+            frames = input_video_loader
+            if track is not None:
+                if progress_callback:
+                    progress_callback(50)
+            else:
+                track, frames = self._detect(
+                    input_video_loader, spool, progress_callback, quiet, timer
+                )
+                if track_key:
+                    self.track_cache.put(track_key, track, video=input_video_path.name)
+            frame_bboxes = self.impute_bboxes(track.to_list(), quiet)
+            # opened last, a failed or cancelled detection leaves no encoder behind
+            process_out = self.open_encoder(
+                input_video_loader,
+                output_video_path,
+                audio_source=input_video_path,
+                quiet=quiet,
+            )
+            self.remove_watermarks(
+                frames,
+                frame_bboxes,
+                process_out,
+                total_frames,
+                progress_callback,
+                quiet,
+                timer,
+                release=input_video_loader.release,
+                started=started,
+            )
+        except BaseException:
+            if process_out is not None:
+                # remove_watermarks reaps it, unless it failed before writing
+                if process_out.poll() is None:
+                    process_out.kill()
+                    process_out.wait()
+                # no truncated output
+                output_video_path.unlink(missing_ok=True)
+            raise
+        finally:
+            if spool is not None:
+                spool.close()
+        if not quiet:
+            logger.debug(f"pipeline stages: {timer.summary(time.perf_counter() - start)}")
+
+        # 95% - 99%
+        if progress_callback:
+            progress_callback(95)
+
+        if not quiet:
+            logger.info(f"Saved no watermark video at: {output_video_path}")
+
+        if progress_callback:
+            progress_callback(99)
+
+    def open_encoder(
+        self,
+        input_video_loader: VideoLoader,
+        output_video_path: Path,
+        audio_source: Path | None = None,
+        quiet: bool = False,
+    ):
+        """ffmpeg process encoding bgr24 frames from its stdin to ``output_video_path``.
+
+        The audio of ``audio_source`` is muxed in the same pass when it has any.
+        """
         output_options = {
             "pix_fmt": "yuv420p",
             "vcodec": "libx264",
@@ -78,142 +378,316 @@ class SoraWM:
         else:
             output_options["crf"] = "18"
 
-        process_out = (
-            ffmpeg.input(
-                "pipe:",
-                format="rawvideo",
-                pix_fmt="bgr24",
-                s=f"{width}x{height}",
-                r=fps,
+        video_stream = ffmpeg.input(
+            "pipe:",
+            format="rawvideo",
+            pix_fmt="bgr24",
+            s=f"{input_video_loader.width}x{input_video_loader.height}",
+            r=input_video_loader.fps,
+        )
+        streams = [video_stream]
+        if audio_source is not None and input_video_loader.audio_codec is not None:
+            # mux the source audio in the same pass, no temp file and second remux
+            streams.append(ffmpeg.input(str(audio_source)).audio)
+            output_options.update(
+                audio_output_options(input_video_loader.audio_codec, output_video_path)
             )
-            .output(str(temp_output_path), **output_options)
+            if not quiet:
+                logger.debug(
+                    f"audio: {input_video_loader.audio_codec} -> {output_options['acodec']}"
+                )
+
+        return (
+            ffmpeg.output(*streams, str(output_video_path), **output_options)
             .overwrite_output()
             .global_args("-loglevel", "error")
             .run_async(pipe_stdin=True)
         )
 
-        frame_bboxes = {}
-        detect_missed = []
-        bbox_centers = []
-        bboxes = []
-        if not quiet:
-            logger.debug(
-                f"total frames: {total_frames}, fps: {fps}, width: {width}, height: {height}"
+    def _spool_fits(self, input_video_loader: VideoLoader) -> bool:
+        spool_bytes = input_video_loader.frame_bytes * input_video_loader.total_frames
+        return self.single_decode and spool_bytes <= self.spool_max_bytes
+
+    def _create_spool(
+        self, input_video_loader: VideoLoader, quiet: bool = False
+    ) -> FrameSpool | None:
+        if not self.single_decode:
+            return None
+        if not self._spool_fits(input_video_loader):
+            spool_bytes = input_video_loader.frame_bytes * input_video_loader.total_frames
+            if not quiet:
+                logger.info(
+                    f"Raw frames need {spool_bytes / 1024**3:.1f} GiB, above the spool budget, "
+                    "decoding the video twice instead"
+                )
+            return None
+        return FrameSpool(input_video_loader.width, input_video_loader.height)
+
+    def _detect(
+        self,
+        input_video_loader: VideoLoader,
+        spool: FrameSpool | None,
+        progress_callback: Callable[[int], None] | None = None,
+        quiet: bool = False,
+        timer: StageTimer | None = None,
+    ) -> tuple[DetectionTrack, Iterable[np.ndarray]]:
+        """Raw detections of the video and the frames the removal pass should read."""
+        if spool is not None:
+            # decode once: the detection pass fills the spool, the removal pass replays it
+            width, height = input_video_loader.width, input_video_loader.height
+            size = self._detection_decode_size(width, height)
+            frames = spool.record(input_video_loader)
+            release = input_video_loader.release
+            if size is not None:
+                # the spool keeps the full frames, the detector gets them downscaled
+                frames = _resized_frames(frames, size, release)
+                release = None
+            track = self.collect_detections(
+                frames,
+                input_video_loader.total_frames,
+                progress_callback,
+                quiet,
+                timer,
+                release=release,
             )
-        for idx, frame in enumerate(
-            tqdm(input_video_loader, total=total_frames, desc="Detect watermarks", disable=quiet)
-        ):
-            detection_result = self.detector.detect(frame)
-            if detection_result["detected"]:
-                frame_bboxes[idx] = { "bbox": detection_result["bbox"]}
-                x1, y1, x2, y2 = detection_result["bbox"]
-                bbox_centers.append((int((x1 + x2) / 2), int((y1 + y2) / 2)))
-                bboxes.append((x1, y1, x2, y2))
+            if size is not None:
+                track = track.scaled(width / size[0], height / size[1], width, height)
+            return track, spool
+        # the detection pass decodes by itself, at detection resolution
+        track = self.detect_video(input_video_loader, progress_callback, quiet, timer)
+        return track, input_video_loader
+
+    def detection_settings(self, source: str) -> dict:
+        """Everything besides the video and the weights that changes the detections.
+
+        ``source`` is where the detector frames come from: "spool" frames are
+        resized by cv2, "decode" frames are scaled by ffmpeg.
+        """
+        sparse = self.sparse_detector
+        tracker = self.detector.template_tracker
+        return {
+            "backend": self.detector.backend,
+            "bf16": self.detector.bf16,
+            "imgsz": self.detector.imgsz,
+            "decode_max_side": self.detect_decode_max_side,
+            "source": source,
+            "template": None
+            if tracker is None
+            else [tracker.threshold, tracker.search_margin, tracker.max_interval],
+            "sparse": None
+            if sparse is None
+            else [sparse.interval, sparse.miss_interval, sparse.roi_diff_threshold],
+        }
+
+    def track_key(
+        self, input_video_path: Path, source: str, content_hash: str | None = None
+    ) -> str | None:
+        """Key of the video in the detection track cache, None when it is disabled.
+
+        The video is only hashed when ``content_hash`` is not given.
+        """
+        if self.track_cache is None:
+            return None
+        return self.track_cache.key(
+            input_video_path,
+            self.detector.weights_hash,
+            self.detection_settings(source),
+            content_hash,
+        )
+
+    def detect_video(
+        self,
+        input_video_loader: VideoLoader,
+        progress_callback: Callable[[int], None] | None = None,
+        quiet: bool = False,
+        timer: StageTimer | None = None,
+    ) -> DetectionTrack:
+        """Raw detections for a whole video, in source frame coordinates.
+
+        ffmpeg downscales the frames while decoding, so the pipe and the detector
+        only see frames about the size YOLO runs at.
+        """
+        width, height = input_video_loader.width, input_video_loader.height
+        size = self._detection_decode_size(width, height)
+        if size is None:
+            return self.collect_detections(
+                input_video_loader,
+                input_video_loader.total_frames,
+                progress_callback,
+                quiet,
+                timer,
+                release=input_video_loader.release,
+            )
+        if not quiet:
+            logger.debug(f"detection decode size: {size[0]}x{size[1]}")
+        track = self.collect_detections(
+            input_video_loader.iter_scaled(*size),
+            input_video_loader.total_frames,
+            progress_callback,
+            quiet,
+            timer,
+        )
+        return track.scaled(width / size[0], height / size[1], width, height)
+
+    def _detection_decode_size(self, width: int, height: int) -> tuple[int, int] | None:
+        max_side = self.detect_decode_max_side
+        if not max_side:
+            return None
+        max_side = max(max_side, self.detector.imgsz or 0)
+        scale = max_side / max(width, height)
+        if scale >= 1:
+            return None
+        # even sizes keep ffmpeg's scaler away from odd chroma edge cases
+        return (
+            max(2, round(width * scale / 2) * 2),
+            max(2, round(height * scale / 2) * 2),
+        )
 
+    def collect_detections(
+        self,
+        frames: Iterable[np.ndarray],
+        total_frames: int,
+        progress_callback: Callable[[int], None] | None = None,
+        quiet: bool = False,
+        timer: StageTimer | None = None,
+        release: Callable[[np.ndarray], None] | None = None,
+    ) -> DetectionTrack:
+        """Raw detector output, one bbox and confidence (or a miss) per frame.
+
+        ``release`` is called with every frame once its detection is done.
+        """
+        track = DetectionTrack()
+        timer = timer or StageTimer()
+        self.detector.reset()
+        # decoding runs ahead in its own thread while the detector works
+        frames = prefetch(frames, self.pipeline_queue_size, timer, "decode")
+        frames = tqdm(frames, total=total_frames, desc="Detect watermarks", disable=quiet)
+        # detections come back in frame order, the oldest in-flight frame is done first
+        in_flight = deque()
+        frames = _track_frames(frames, in_flight)
+        if self.sparse_detector is not None:
+            detections = self.sparse_detector.detect_stream(frames)
+        else:
+            detections = self._detect_batches(frames, timer)
+        for idx, detection_result in enumerate(detections):
+            frame = in_flight.popleft()
+            if release:
+                release(frame)
+            if detection_result["detected"]:
+                track.append(detection_result["bbox"], detection_result["confidence"])
             else:
-                frame_bboxes[idx] = {"bbox": None}
-                detect_missed.append(idx)
-                bbox_centers.append(None)
-                bboxes.append(None)
+                track.append(None)
             # 10% - 50%
             if progress_callback and idx % 10 == 0:
                 progress = 10 + int((idx / total_frames) * 40)
                 progress_callback(progress)
+        if not quiet and self.sparse_detector is not None:
+            logger.debug(
+                f"sparse detection ran the detector on "
+                f"{self.sparse_detector.detector_calls}/{len(track)} frames"
+            )
+        elif not quiet and self.detector.template_tracker is not None:
+            logger.debug(
+                f"template matching left {self.detector.yolo_frames}/{len(track)} "
+                "frames to yolo"
+            )
+        track.shrink()
+        return track
+
+    def impute_bboxes(
+        self, bboxes: list[tuple[int, int, int, int] | None], quiet: bool = False
+    ) -> dict[int, dict]:
+        """Fill the frames the detector missed from the bboxes around them."""
+        detect_missed = [idx for idx, bbox in enumerate(bboxes) if bbox is None]
         if not quiet:
             logger.debug(f"detect missed frames: {detect_missed}")
         if detect_missed:
-            # 1. find the bkps of the bbox centers
-            bkps = find_2d_data_bkps(bbox_centers)
-            # add the start and end position, to form the complete interval boundaries
-            bkps_full = [0] + bkps + [total_frames]
-            # logger.debug(f"bkps intervals: {bkps_full}")
-
-            # 2. calculate the average bbox of each interval
-            interval_bboxes = get_interval_average_bbox(bboxes, bkps_full)
-            # logger.debug(f"interval average bboxes: {interval_bboxes}")
-
-            # 3. find the interval index of each missed frame
-            missed_intervals = find_idxs_interval(detect_missed, bkps_full)
-            # logger.debug(
-            #     f"missed frame intervals: {list(zip(detect_missed, missed_intervals))}"
-            # )
-
-            # 4. fill the missed frames with the average bbox of the corresponding interval
-            for missed_idx, interval_idx in zip(detect_missed, missed_intervals):
-                if (
-                    interval_idx < len(interval_bboxes)
-                    and interval_bboxes[interval_idx] is not None
-                ):
-                    frame_bboxes[missed_idx]["bbox"] = interval_bboxes[interval_idx]
-                    if not quiet:
-                        logger.debug(f"Filled missed frame {missed_idx} with bbox:\n"
-                        f" {interval_bboxes[interval_idx]}")
-                else:
-                    # if the interval has no valid bbox, use the previous and next frame to complete (fallback strategy)
-                    before = max(missed_idx - 1, 0)
-                    after = min(missed_idx + 1, total_frames - 1)
-                    before_box = frame_bboxes[before]["bbox"]
-                    after_box = frame_bboxes[after]["bbox"]
-                    if before_box:
-                        frame_bboxes[missed_idx]["bbox"] = before_box
-                    elif after_box:
-                        frame_bboxes[missed_idx]["bbox"] = after_box
-        else:
-            del bboxes
-            del bbox_centers
-            del detect_missed
-        
-        input_video_loader = VideoLoader(input_video_path)
-
-        for idx, frame in enumerate(tqdm(input_video_loader, total=total_frames, desc="Remove watermarks", disable=quiet)):
-            bbox = frame_bboxes[idx]["bbox"]
-            if bbox is not None:
-                x1, y1, x2, y2 = bbox
-                mask = np.zeros((height, width), dtype=np.uint8)
-                mask[y1:y2, x1:x2] = 255
-                cleaned_frame = self.cleaner.clean(frame, mask)
+            if IMPUTATION_METHOD == "kernel_cpd":
+                bboxes = impute_bboxes_kernel_cpd(bboxes)
             else:
-                cleaned_frame = frame
-            process_out.stdin.write(cleaned_frame.tobytes())
-
-            # 50% - 95%
-            if progress_callback and idx % 10 == 0:
-                progress = 50 + int((idx / total_frames) * 45)
-                progress_callback(progress)
+                bboxes = impute_bboxes_linear(bboxes, IMPUTE_JUMP, IMPUTE_MIN_SEGMENT)
+            if not quiet:
+                filled = sum(bboxes[idx] is not None for idx in detect_missed)
+                logger.debug(f"Filled {filled}/{len(detect_missed)} missed frames")
+        return {idx: {"bbox": bbox} for idx, bbox in enumerate(bboxes)}
 
-        process_out.stdin.close()
-        process_out.wait()
+    def _detect_batches(
+        self, frames: Iterable[np.ndarray], timer: StageTimer
+    ) -> Iterable[dict]:
+        # frames are sent to YOLO in batches, results come back one per frame in order
+        for batch in batched(frames, self.detector.batch_size):
+            with timer.measure("detect"):
+                detection_results = self.detector.detect_batch(batch)
+            yield from detection_results
 
-        # 95% - 99%
-        if progress_callback:
-            progress_callback(95)
+    def remove_watermarks(
+        self,
+        frames: Iterable[np.ndarray],
+        frame_bboxes: dict[int, dict],
+        process_out,
+        total_frames: int,
+        progress_callback: Callable[[int], None] | None = None,
+        quiet: bool = False,
+        timer: StageTimer | None = None,
+        release: Callable[[np.ndarray], None] | None = None,
+        started: float | None = None,
+    ):
+        """Clean ``frames`` and encode them, ``release`` gets every frame once written.
 
-        self.merge_audio_track(input_video_path, temp_output_path, output_video_path)
+        With ``started`` (a perf_counter value, the start of the run), the time from
+        it to the first frame handed to the encoder is logged. Model loading is
+        logged on its own by ``__init__``, the two add up to the cold start.
+        """
+        timer = timer or StageTimer()
+        frames = prefetch(frames, self.pipeline_queue_size, timer, "decode")
+        frames = tqdm(frames, total=total_frames, desc="Remove watermarks", disable=quiet)
+        cache = self.cleaner.cache
+        if cache is not None:
+            cache.reset_stats()
+        idx = 0
+        # the encoder pipe is fed from its own thread, so x264 keeps working
+        # while the next batch is inpainted
+        with FrameWriter(
+            process_out.stdin,
+            self.pipeline_queue_size,
+            timer,
+            release=release,
+            process=process_out,
+        ) as writer:
+            for batch in batched(frames, self.cleaner.batch_size):
+                bboxes = [frame_bboxes[idx + offset]["bbox"] for offset in range(len(batch))]
+                watermarked = [
+                    offset for offset, bbox in enumerate(bboxes) if bbox is not None
+                ]
+                if watermarked:
+                    # only the padded watermark windows go through the model,
+                    # the results are pasted back into the (writable) frames
+                    with timer.measure("inpaint"):
+                        self.cleaner.clean_roi_batch(
+                            [batch[offset] for offset in watermarked],
+                            [bboxes[offset] for offset in watermarked],
+                        )
+                for frame in batch:
+                    writer.write(frame)
+                    idx += 1
+                    if idx == 1 and started is not None and not quiet:
+                        logger.info(
+                            "first frame encoded "
+                            f"{time.perf_counter() - started:.2f}s after the run started"
+                        )
 
-        if progress_callback:
-            progress_callback(99)
+                    # 50% - 95%
+                    if progress_callback and idx % 10 == 0:
+                        progress = 50 + int((idx / total_frames) * 45)
+                        progress_callback(progress)
 
-    def merge_audio_track(
-        self, input_video_path: Path, temp_output_path: Path, output_video_path: Path
-    ):
-        logger.info("Merging audio track...")
-        video_stream = ffmpeg.input(str(temp_output_path))
-        audio_stream = ffmpeg.input(str(input_video_path)).audio
-
-        (
-            ffmpeg.output(
-                video_stream,
-                audio_stream,
-                str(output_video_path),
-                vcodec="copy",
-                acodec="aac",
+        if cache is not None and not quiet:
+            lookups = cache.hits + cache.misses
+            logger.info(
+                f"inpaint cache: {cache.hits} hits, {cache.misses} misses "
+                f"({cache.hits / max(lookups, 1):.0%}), {len(cache)} patches, "
+                f"{cache.nbytes / 1024**2:.1f} MiB"
             )
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        # Clean up temporary file
-        temp_output_path.unlink()
-        logger.info(f"Saved no watermark video with audio at: {output_video_path}")
 
 
 if __name__ == "__main__":
@@ -114,6 +114,37 @@ def load_jit_model(url_or_path, device, model_md5: str):
     return model
 
 
+def get_int8_path_by_url(url):
+    """The INT8 variant of a model is stored next to its downloaded checkpoint."""
+    return os.path.splitext(get_cache_path_by_url(url))[0] + ".int8.onnx"
+
+
+def is_int8_model_enabled(url) -> bool:
+    from sorawm.utils.onnx_utils import read_gate_record
+
+    record = read_gate_record(get_int8_path_by_url(url))
+    return bool(record and record.get("passed"))
+
+
+def load_int8_model(url):
+    """ONNX Runtime session of the INT8 variant, only if it passed the accuracy gate."""
+    from sorawm.utils.onnx_utils import OnnxModule, read_gate_record
+
+    model_path = get_int8_path_by_url(url)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(
+            f"{model_path} not found, build it with `python -m sorawm.quantize`"
+        )
+    record = read_gate_record(model_path)
+    if not record or not record.get("passed"):
+        raise RuntimeError(
+            f"{model_path} did not pass the accuracy gate of `python -m sorawm.quantize`: "
+            f"{record}"
+        )
+    logger.info(f"Loading model from: {model_path}")
+    return OnnxModule(model_path)
+
+
 def load_model(model: torch.nn.Module, url_or_path, device, model_md5):
     if os.path.exists(url_or_path):
         model_path = url_or_path
@@ -3,11 +3,11 @@ from .controlnet import ControlNet
 from .fcf import FcF
 from .instruct_pix2pix import InstructPix2Pix
 from .kandinsky import Kandinsky22
-from .lama import AnimeLaMa, LaMa
+from .lama import AnimeLaMa, LaMa, LaMaInt8
 from .ldm import LDM
 from .manga import Manga
 from .mat import MAT
-from .mi_gan import MIGAN
+from .mi_gan import MIGAN, MIGANInt8
 from .opencv2 import OpenCV2
 from .paint_by_example import PaintByExample
 from .power_paint.power_paint import PowerPaint
@@ -18,6 +18,7 @@ from .zits import ZITS
 models = {
     LaMa.name: LaMa,
     AnimeLaMa.name: AnimeLaMa,
+    LaMaInt8.name: LaMaInt8,
     LDM.name: LDM,
     ZITS.name: ZITS,
     MAT.name: MAT,
@@ -25,6 +26,7 @@ models = {
     OpenCV2.name: OpenCV2,
     Manga.name: Manga,
     MIGAN.name: MIGAN,
+    MIGANInt8.name: MIGANInt8,
     SD15.name: SD15,
     Anything4.name: Anything4,
     RealisticVision14.name: RealisticVision14,
@@ -24,6 +24,8 @@ class InpaintModel:
     pad_mod = 8
     pad_to_square = False
     is_erase_model = False
+    # forward_batch runs several images in one model call
+    supports_batch = False
 
     def __init__(self, device, **kwargs):
         """
@@ -74,12 +76,75 @@ class InpaintModel:
         result = result[0:origin_height, 0:origin_width, :]
 
         result, image, mask = self.forward_post_process(result, image, mask, config)
+        return self._keep_unmasked_area(result, image, mask, config)
 
+    def _keep_unmasked_area(self, result, image, mask, config: InpaintRequest):
         if config.sd_keep_unmasked_area:
             mask = mask[:, :, np.newaxis]
             result = result * (mask / 255) + image[:, :, ::-1] * (1 - (mask / 255))
         return result
 
+    def forward_batch(self, images, masks, config: InpaintRequest):
+        """Input images and output images have same size
+        images: list of [H, W, C] RGB, all of the same size
+        masks: list of [H, W]
+        return: list of BGR IMAGE
+        """
+        return [
+            self.forward(image, mask, config) for image, mask in zip(images, masks)
+        ]
+
+    @torch.no_grad()
+    def batch_call(self, images, masks, config: InpaintRequest, batch_size: int = 8):
+        """
+        images: list of [H, W, C] RGB, not normalized, all of the same size
+        masks: list of [H, W]
+        return: list of BGR IMAGE, in input order
+
+        Pairs are padded once and sent to forward_batch ``batch_size`` at a time.
+        HD strategies are not applied, inputs are expected to be small crops.
+        Models without batch support fall back to one call per pair.
+        """
+        if len(images) == 0:
+            return []
+        if not self.supports_batch:
+            return [self(image, mask, config) for image, mask in zip(images, masks)]
+        if len({image.shape for image in images}) > 1:
+            raise ValueError("batch_call expects images of the same size")
+
+        images, masks = list(images), list(masks)
+        origin_height, origin_width = images[0].shape[:2]
+        pad_images, pad_masks = [], []
+        for idx, (image, mask) in enumerate(zip(images, masks)):
+            pad_images.append(
+                pad_img_to_modulo(
+                    image, mod=self.pad_mod, square=self.pad_to_square, min_size=self.min_size
+                )
+            )
+            pad_masks.append(
+                pad_img_to_modulo(
+                    mask, mod=self.pad_mod, square=self.pad_to_square, min_size=self.min_size
+                )
+            )
+            images[idx], masks[idx] = self.forward_pre_process(image, mask, config)
+
+        results = []
+        for start in range(0, len(pad_images), max(1, batch_size)):
+            results.extend(
+                self.forward_batch(
+                    pad_images[start : start + batch_size],
+                    pad_masks[start : start + batch_size],
+                    config,
+                )
+            )
+
+        outputs = []
+        for result, image, mask in zip(results, images, masks):
+            result = result[0:origin_height, 0:origin_width, :]
+            result, image, mask = self.forward_post_process(result, image, mask, config)
+            outputs.append(self._keep_unmasked_area(result, image, mask, config))
+        return outputs
+
     def forward_pre_process(self, image, mask, config):
         return image, mask
 
@@ -7,6 +7,8 @@ import torch
 from sorawm.iopaint.helper import (
     download_model,
     get_cache_path_by_url,
+    is_int8_model_enabled,
+    load_int8_model,
     load_jit_model,
     norm_img,
 )
@@ -33,6 +35,7 @@ class LaMa(InpaintModel):
     name = "lama"
     pad_mod = 8
     is_erase_model = True
+    supports_batch = True
 
     @staticmethod
     def download():
@@ -51,19 +54,24 @@ class LaMa(InpaintModel):
         mask: [H, W]
         return: BGR IMAGE
         """
-        image = norm_img(image)
-        mask = norm_img(mask)
+        return self.forward_batch([image], [mask], config)[0]
 
-        mask = (mask > 0) * 1
-        image = torch.from_numpy(image).unsqueeze(0).to(self.device)
-        mask = torch.from_numpy(mask).unsqueeze(0).to(self.device)
+    def forward_batch(self, images, masks, config: InpaintRequest):
+        """Input images and output images have same size
+        images: list of [H, W, C] RGB, all of the same size
+        masks: list of [H, W]
+        return: list of BGR IMAGE
+        """
+        image = np.stack([norm_img(image) for image in images])
+        mask = np.stack([(norm_img(mask) > 0) * 1 for mask in masks])
+        image = torch.from_numpy(image).to(self.device)
+        mask = torch.from_numpy(mask).to(self.device)
 
         inpainted_image = self.model(image, mask)
 
-        cur_res = inpainted_image[0].permute(1, 2, 0).detach().cpu().numpy()
+        cur_res = inpainted_image.permute(0, 2, 3, 1).detach().cpu().numpy()
         cur_res = np.clip(cur_res * 255, 0, 255).astype("uint8")
-        cur_res = cv2.cvtColor(cur_res, cv2.COLOR_RGB2BGR)
-        return cur_res
+        return [cv2.cvtColor(res, cv2.COLOR_RGB2BGR) for res in cur_res]
 
 
 class AnimeLaMa(LaMa):
@@ -81,3 +89,24 @@ class AnimeLaMa(LaMa):
     @staticmethod
     def is_downloaded() -> bool:
         return os.path.exists(get_cache_path_by_url(ANIME_LAMA_MODEL_URL))
+
+
+class LaMaInt8(LaMa):
+    """big-lama quantized to INT8 by `python -m sorawm.quantize`, runs on CPU."""
+
+    name = "lama-int8"
+
+    @staticmethod
+    def download():
+        raise FileNotFoundError(
+            "lama-int8 is built from lama, run `python -m sorawm.quantize --model lama`"
+        )
+
+    def init_model(self, device, **kwargs):
+        # ONNX Runtime runs it on CPU, keep the input tensors there
+        self.device = torch.device("cpu")
+        self.model = load_int8_model(LAMA_MODEL_URL)
+
+    @staticmethod
+    def is_downloaded() -> bool:
+        return is_int8_model_enabled(LAMA_MODEL_URL)
@@ -7,6 +7,8 @@ from sorawm.iopaint.helper import (
     boxes_from_mask,
     download_model,
     get_cache_path_by_url,
+    is_int8_model_enabled,
+    load_int8_model,
     load_jit_model,
     norm_img,
     resize_max_size,
@@ -109,3 +111,24 @@ class MIGAN(InpaintModel):
         output = output[0].cpu().numpy()
         cur_res = cv2.cvtColor(output, cv2.COLOR_RGB2BGR)
         return cur_res
+
+
+class MIGANInt8(MIGAN):
+    """MI-GAN quantized to INT8 by `python -m sorawm.quantize`, runs on CPU."""
+
+    name = "migan-int8"
+
+    def init_model(self, device, **kwargs):
+        # ONNX Runtime runs it on CPU, keep the input tensors there
+        self.device = torch.device("cpu")
+        self.model = load_int8_model(MIGAN_MODEL_URL)
+
+    @staticmethod
+    def download():
+        raise FileNotFoundError(
+            "migan-int8 is built from migan, run `python -m sorawm.quantize --model migan`"
+        )
+
+    @staticmethod
+    def is_downloaded() -> bool:
+        return is_int8_model_enabled(MIGAN_MODEL_URL)
@@ -110,6 +110,29 @@ class ModelManager:
         self.enable_disable_lcm_lora(config)
         return self.model(image, mask, config).astype(np.uint8)
 
+    @torch.inference_mode()
+    def batch(self, images, masks, config: InpaintRequest, batch_size: int = 8):
+        """
+
+        Args:
+            images: list of [H, W, C] RGB, all of the same size
+            masks: list of [H, W, 1] 255 means area to repaint
+            config:
+            batch_size: number of pairs per model call
+
+        Returns:
+            list of BGR image, in input order
+        """
+        if config.enable_controlnet:
+            self.switch_controlnet_method(config)
+        if config.enable_brushnet:
+            self.switch_brushnet_method(config)
+
+        self.enable_disable_powerpaint_v2(config)
+        self.enable_disable_lcm_lora(config)
+        results = self.model.batch_call(images, masks, config, batch_size=batch_size)
+        return [result.astype(np.uint8) for result in results]
+
     def scan_models(self) -> List[ModelInfo]:
         available_models = scan_models()
         self.available_models = {it.name: it for it in available_models}
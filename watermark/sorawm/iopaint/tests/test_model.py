@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 import torch
 
@@ -8,6 +9,7 @@ from sorawm.iopaint.tests.utils import (
     check_device,
     current_dir,
     get_config,
+    get_data,
 )
 
 
@@ -33,6 +35,52 @@ def test_lama(device, strategy):
     )
 
 
+@pytest.mark.parametrize("device", ["cuda", "mps", "cpu"])
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_lama_batch(device, batch_size):
+    check_device(device)
+    model = ModelManager(name="lama", device=device)
+    cfg = get_config(strategy=HDStrategy.ORIGINAL)
+    img, mask = get_data()
+    images = [img, img[:, ::-1].copy(), img[::-1].copy(), img]
+    masks = [mask, mask[:, ::-1].copy(), mask[::-1].copy(), mask]
+
+    batch_results = model.batch(images, masks, cfg, batch_size=batch_size)
+
+    assert len(batch_results) == len(images)
+    for image, m, batch_result in zip(images, masks, batch_results):
+        single_result = model(image, m, cfg)
+        assert batch_result.shape == single_result.shape
+        assert np.abs(batch_result.astype(int) - single_result.astype(int)).max() <= 1
+
+
+@pytest.mark.parametrize("device", ["cuda", "mps", "cpu"])
+def test_lama_batch_empty(device):
+    check_device(device)
+    model = ModelManager(name="lama", device=device)
+    cfg = get_config(strategy=HDStrategy.ORIGINAL)
+    assert model.batch([], [], cfg, batch_size=4) == []
+
+
+@pytest.mark.parametrize("device", ["cuda", "mps", "cpu"])
+@pytest.mark.parametrize("num_images, batch_size", [(5, 2), (7, 3), (2, 8)])
+def test_lama_batch_uneven(device, num_images, batch_size):
+    check_device(device)
+    model = ModelManager(name="lama", device=device)
+    cfg = get_config(strategy=HDStrategy.ORIGINAL)
+    img, mask = get_data()
+    # distinct images, so results coming back out of order would not match
+    images = [np.roll(img, 16 * i, axis=1) for i in range(num_images)]
+    masks = [mask] * num_images
+
+    batch_results = model.batch(images, masks, cfg, batch_size=batch_size)
+
+    assert len(batch_results) == num_images
+    for image, m, batch_result in zip(images, masks, batch_results):
+        single_result = model(image, m, cfg)
+        assert np.abs(batch_result.astype(int) - single_result.astype(int)).max() <= 1
+
+
 @pytest.mark.parametrize("device", ["cuda", "cpu"])
 @pytest.mark.parametrize(
     "strategy", [HDStrategy.ORIGINAL, HDStrategy.RESIZE, HDStrategy.CROP]
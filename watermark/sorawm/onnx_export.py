@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Export the YOLO detector and big-lama to ONNX for INFERENCE_BACKEND = "onnx".
+
+    python -m sorawm.onnx_export --model detector
+    python -m sorawm.onnx_export --model lama
+    python -m sorawm.onnx_export --model migan
+    python -m sorawm.onnx_export --model all --opset 17
+
+The detector goes through the ultralytics exporter, which keeps the pre and post
+processing of the YOLO wrapper. big-lama only ships as TorchScript and uses
+torch.fft in its Fourier units, which the TorchScript exporter does not map to
+ONNX, so ``register_fft_symbolics`` adds rfftn/irfftn over the last two dims on
+top of the ONNX DFT op (opset 17). MI-GAN is a plain convolutional network over
+fixed 512x512 inputs. The inpainting exports are also the fp32 models that
+sorawm/quantize.py turns into INT8.
+"""
+
+import argparse
+import shutil
+from pathlib import Path
+
+import torch
+from loguru import logger
+
+from sorawm.configs import (
+    DETECTOR_ONNX_PATH,
+    LAMA_ONNX_PATH,
+    MIGAN_ONNX_PATH,
+    WATER_MARK_DETECT_YOLO_WEIGHTS,
+)
+
+DFT_OPSET = 17
+
+
+def _fft_sizes(g, x, axes: list[int]):
+    shape = g.op("Shape", x)
+    return [
+        g.op("Gather", shape, g.op("Constant", value_t=torch.tensor(axis)), axis_i=0)
+        for axis in axes
+    ]
+
+
+def _norm_factor(g, sizes, norm: str | None, inverse: bool):
+    """Multiplier turning the ONNX DFT scaling into the torch ``norm`` one.
+
+    ONNX divides by n on the inverse transform only, like torch's "backward".
+    """
+    count = sizes[0]
+    for size in sizes[1:]:
+        count = g.op("Mul", count, size)
+    count = g.op("Cast", count, to_i=1)
+    norm = norm or "backward"
+    if norm == "ortho":
+        factor = g.op("Sqrt", count)
+        return factor if inverse else g.op("Reciprocal", factor)
+    if norm == "forward":
+        return count if inverse else g.op("Reciprocal", count)
+    return None
+
+
+def _check_dims(dim, rank: int | None):
+    dims = list(dim) if dim is not None else [-2, -1]
+    if rank is not None:
+        dims = [d - rank if d >= 0 else d for d in dims]
+    if dims != [-2, -1]:
+        raise RuntimeError(f"only fft over the last two dims is exported, got {dim}")
+
+
+def register_fft_symbolics(opset: int = DFT_OPSET):
+    """Export complex tensors as real ones with a trailing (real, imag) axis of size 2."""
+    from torch.onnx import register_custom_op_symbolic, symbolic_helper
+
+    def rfftn(g, self, s, dim, norm):
+        rank = symbolic_helper._get_tensor_rank(self)
+        _check_dims(symbolic_helper._maybe_get_const(dim, "is"), rank)
+        norm = symbolic_helper._maybe_get_const(norm, "s")
+        x = g.op("Unsqueeze", self, g.op("Constant", value_t=torch.tensor([-1])))
+        # width first, only the non-negative frequencies as torch keeps them
+        x = g.op("DFT", x, axis_i=-2, onesided_i=1)
+        x = g.op("DFT", x, axis_i=-3, onesided_i=0)
+        factor = _norm_factor(g, _fft_sizes(g, self, [-2, -1]), norm, inverse=False)
+        return x if factor is None else g.op("Mul", x, factor)
+
+    def irfftn(g, self, s, dim, norm):
+        _check_dims(symbolic_helper._maybe_get_const(dim, "is"), None)
+        norm = symbolic_helper._maybe_get_const(norm, "s")
+        x = g.op("DFT", self, axis_i=-3, inverse_i=1, onesided_i=0)
+        # restore the negative width frequencies from the hermitian symmetry
+        if symbolic_helper._is_packed_list(s):
+            width = symbolic_helper._unpack_list(s)[-1]
+        else:
+            width = g.op(
+                "Gather", s, g.op("Constant", value_t=torch.tensor(-1)), axis_i=0
+            )
+        width = g.op("Reshape", width, g.op("Constant", value_t=torch.tensor([1])))
+        two = g.op("Constant", value_t=torch.tensor([2]))
+        one = g.op("Constant", value_t=torch.tensor([1]))
+        start = g.op("Sub", g.op("Sub", width, g.op("Div", width, two)), one)
+        mirrored = g.op(
+            "Slice",
+            x,
+            start,
+            g.op("Constant", value_t=torch.tensor([0])),
+            g.op("Constant", value_t=torch.tensor([-2])),
+            g.op("Constant", value_t=torch.tensor([-1])),
+        )
+        conjugate = g.op("Constant", value_t=torch.tensor([1.0, -1.0]))
+        x = g.op("Concat", x, g.op("Mul", mirrored, conjugate), axis_i=-2)
+        x = g.op("DFT", x, axis_i=-2, inverse_i=1, onesided_i=0)
+        x = g.op(
+            "Gather", x, g.op("Constant", value_t=torch.tensor(0)), axis_i=-1
+        )
+        sizes = [_fft_sizes(g, x, [-2])[0], g.op("Squeeze", width)]
+        factor = _norm_factor(g, sizes, norm, inverse=True)
+        return x if factor is None else g.op("Mul", x, factor)
+
+    def real(g, self):
+        return g.op("Gather", self, g.op("Constant", value_t=torch.tensor(0)), axis_i=-1)
+
+    def imag(g, self):
+        return g.op("Gather", self, g.op("Constant", value_t=torch.tensor(1)), axis_i=-1)
+
+    def complex_(g, real_part, imag_part):
+        axis = g.op("Constant", value_t=torch.tensor([-1]))
+        return g.op(
+            "Concat",
+            g.op("Unsqueeze", real_part, axis),
+            g.op("Unsqueeze", imag_part, axis),
+            axis_i=-1,
+        )
+
+    register_custom_op_symbolic("aten::fft_rfftn", rfftn, opset)
+    register_custom_op_symbolic("aten::fft_irfftn", irfftn, opset)
+    register_custom_op_symbolic("aten::real", real, opset)
+    register_custom_op_symbolic("aten::imag", imag, opset)
+    register_custom_op_symbolic("aten::complex", complex_, opset)
+
+
+def export_detector(output_path: Path, imgsz: int = 640, opset: int = DFT_OPSET) -> Path:
+    from ultralytics import YOLO
+
+    exported = YOLO(WATER_MARK_DETECT_YOLO_WEIGHTS).export(
+        format="onnx", imgsz=imgsz, dynamic=True, opset=opset, simplify=True
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(exported, output_path)
+    return output_path
+
+
+def export_torchscript(
+    model: torch.jit.ScriptModule, output_path: Path, size: int = 512, opset: int = DFT_OPSET
+) -> Path:
+    """Export an (image, mask) -> image inpainting model with dynamic batch and size."""
+    register_fft_symbolics(opset)
+    image = torch.rand(1, 3, size, size)
+    mask = (torch.rand(1, 1, size, size) > 0.5).float()
+    dynamic_axes = {0: "batch", 2: "height", 3: "width"}
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.onnx.export(
+        model,
+        (image, mask),
+        str(output_path),
+        input_names=["image", "mask"],
+        output_names=["output"],
+        dynamic_axes={"image": dynamic_axes, "mask": dynamic_axes, "output": dynamic_axes},
+        opset_version=opset,
+        dynamo=False,
+    )
+    return output_path
+
+
+def export_lama(output_path: Path, opset: int = DFT_OPSET) -> Path:
+    from sorawm.iopaint.helper import load_jit_model
+    from sorawm.iopaint.model.lama import LAMA_MODEL_MD5, LAMA_MODEL_URL
+
+    model = load_jit_model(LAMA_MODEL_URL, torch.device("cpu"), LAMA_MODEL_MD5)
+    return export_torchscript(model, output_path, opset=opset)
+
+
+def export_migan(output_path: Path, opset: int = DFT_OPSET) -> Path:
+    """MI-GAN takes the erased image and the mask as one 4 channel input."""
+    from sorawm.iopaint.helper import load_jit_model
+    from sorawm.iopaint.model.mi_gan import MIGAN_MODEL_MD5, MIGAN_MODEL_URL
+
+    model = load_jit_model(MIGAN_MODEL_URL, torch.device("cpu"), MIGAN_MODEL_MD5)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.onnx.export(
+        model,
+        (torch.rand(1, 4, 512, 512),),
+        str(output_path),
+        input_names=["input"],
+        output_names=["output"],
+        dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+        opset_version=opset,
+        dynamo=False,
+    )
+    return output_path
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", choices=["detector", "lama", "migan", "all"], default="all")
+    parser.add_argument("--detector-output", type=Path, default=DETECTOR_ONNX_PATH)
+    parser.add_argument("--lama-output", type=Path, default=LAMA_ONNX_PATH)
+    parser.add_argument("--migan-output", type=Path, default=MIGAN_ONNX_PATH)
+    parser.add_argument("--imgsz", default=640, type=int)
+    parser.add_argument("--opset", default=DFT_OPSET, type=int)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    if args.model in ("detector", "all"):
+        path = export_detector(args.detector_output, args.imgsz, args.opset)
+        logger.info(f"Exported the detector to {path}")
+    if args.model in ("lama", "all"):
+        path = export_lama(args.lama_output, args.opset)
+        logger.info(f"Exported big-lama to {path}")
+    if args.model in ("migan", "all"):
+        path = export_migan(args.migan_output, args.opset)
+        logger.info(f"Exported MI-GAN to {path}")
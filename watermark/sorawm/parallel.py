@@ -0,0 +1,296 @@
+"""Multi-process processing: chunks of a single video, or many videos at once.
+
+For a single video, the video stream is cut at keyframes into segments without re-encoding. Every
+segment is detected and cleaned in a worker process that holds its own detector
+and cleaner. The bbox imputation runs once over the whole video in the parent, so
+missed frames at segment boundaries are filled from both sides. The cleaned
+segments are joined with the concat demuxer and the source audio is muxed back.
+
+For a batch of videos, every worker process loads the models once and takes the
+next video off the shared queue of the pool until the batch is done.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+import ffmpeg
+import torch
+from loguru import logger
+
+from sorawm.configs import (
+    PARALLEL_MIN_SEGMENT_SECONDS,
+    PARALLEL_THREADS_PER_WORKER,
+    WORKING_DIR,
+)
+from sorawm.utils.devices_utils import get_device
+from sorawm.utils.roi_utils import BBox
+from sorawm.utils.track_cache import DetectionTrack
+from sorawm.utils.video_utils import VideoLoader, audio_output_options
+
+# the SoraWM instance of a worker process, created once by _init_worker
+_worker = None
+# how often the parent drains the progress queue while waiting for workers
+_PROGRESS_POLL_SECONDS = 0.5
+
+
+@dataclass
+class BatchResult:
+    input_video_path: Path
+    output_video_path: Path
+    error: str | None = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def auto_segment_count(duration: float) -> int:
+    """Segments that keep every core busy without making segments too short."""
+    if get_device().type != "cpu":
+        # the workers would all share the one accelerator
+        return 1
+    workers = max(1, (os.cpu_count() or 1) // PARALLEL_THREADS_PER_WORKER)
+    return max(1, min(workers, int(duration // PARALLEL_MIN_SEGMENT_SECONDS)))
+
+
+def split_video(input_video_path: Path, segment_dir: Path, segments: int) -> list[Path]:
+    """Cut the video stream into about ``segments`` pieces at keyframes, no re-encode."""
+    loader = VideoLoader(input_video_path)
+    segment_time = loader.total_frames / loader.fps / segments
+    (
+        ffmpeg.input(str(input_video_path))
+        .output(
+            str(segment_dir / "segment_%04d.mkv"),
+            map="0:v:0",
+            c="copy",
+            f="segment",
+            segment_time=f"{segment_time:.3f}",
+            reset_timestamps=1,
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return sorted(segment_dir.glob("segment_*.mkv"))
+
+
+def concat_segments(
+    segment_paths: list[Path], input_video_path: Path, output_video_path: Path
+):
+    """Join the encoded segments without re-encoding and mux the source audio."""
+    list_path = segment_paths[0].parent / "concat.txt"
+    list_path.write_text("".join(f"file '{path.as_posix()}'\n" for path in segment_paths))
+    streams = [ffmpeg.input(str(list_path), f="concat", safe=0).video]
+    output_options = {"vcodec": "copy"}
+    audio_codec = VideoLoader(input_video_path).audio_codec
+    if audio_codec is not None:
+        streams.append(ffmpeg.input(str(input_video_path)).audio)
+        output_options.update(audio_output_options(audio_codec, output_video_path))
+    (
+        ffmpeg.output(*streams, str(output_video_path), **output_options)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def _init_worker(sora_wm_cls: type, sora_wm_kwargs: dict, num_threads: int):
+    global _worker
+    torch.set_num_threads(num_threads)
+    _worker = sora_wm_cls(**sora_wm_kwargs)
+
+
+def _detect_segment(segment_path: Path) -> DetectionTrack:
+    return _worker.detect_video(VideoLoader(segment_path), quiet=True)
+
+
+def _clean_segment(
+    segment_path: Path, output_path: Path, bboxes: list[BBox | None]
+) -> Path:
+    loader = VideoLoader(segment_path)
+    frame_bboxes = {idx: {"bbox": bbox} for idx, bbox in enumerate(bboxes)}
+    process_out = _worker.open_encoder(loader, output_path, quiet=True)
+    _worker.remove_watermarks(
+        loader, frame_bboxes, process_out, len(bboxes), quiet=True
+    )
+    return output_path
+
+
+def run_chunked(
+    sora_wm,
+    input_video_path: Path,
+    output_video_path: Path,
+    segments: int,
+    progress_callback: Callable[[int], None] | None = None,
+    quiet: bool = False,
+    track: DetectionTrack | None = None,
+    track_key: str | None = None,
+):
+    """Process ``input_video_path`` as ``segments`` keyframe-aligned chunks in parallel.
+
+    With the cached ``track`` of the video the detection phase is skipped, otherwise
+    the detections are stored in the track cache of ``sora_wm`` under ``track_key``.
+    """
+    output_video_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=WORKING_DIR, prefix="segments_") as tmp:
+        segment_dir = Path(tmp)
+        segment_paths = split_video(input_video_path, segment_dir, segments)
+        num_segments = len(segment_paths)
+        # keyframe spacing can yield a few more segments than asked for
+        num_workers = min(num_segments, segments)
+        num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        if not quiet:
+            logger.info(
+                f"Processing {num_segments} segment(s) on {num_workers} worker(s), "
+                f"{num_threads} thread(s) each"
+            )
+
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            # fork is unsafe once torch has started its thread pools
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(type(sora_wm), sora_wm.worker_kwargs(), num_threads),
+        ) as executor:
+            segment_lengths = None
+            if track is not None:
+                segment_lengths = [VideoLoader(path).frame_count for path in segment_paths]
+                if sum(segment_lengths) != len(track):
+                    logger.warning(
+                        f"Cached track has {len(track)} frames, the segments "
+                        f"{sum(segment_lengths)}, detecting again"
+                    )
+                    track = None
+            if track is None:
+                # phase 1: raw detections per segment
+                futures = {
+                    executor.submit(_detect_segment, path): idx
+                    for idx, path in enumerate(segment_paths)
+                }
+                segment_tracks = [None] * num_segments
+                for done, future in enumerate(as_completed(futures), 1):
+                    segment_tracks[futures[future]] = future.result()
+                    # 10% - 50%
+                    if progress_callback:
+                        progress_callback(10 + int(done / num_segments * 40))
+                segment_lengths = [len(segment_track) for segment_track in segment_tracks]
+                track = DetectionTrack.concat(segment_tracks)
+                if track_key:
+                    sora_wm.track_cache.put(track_key, track, video=input_video_path.name)
+            elif progress_callback:
+                progress_callback(50)
+
+            # imputation over the whole video, so gaps at the boundaries see both sides
+            bboxes = track.to_list()
+            frame_bboxes = sora_wm.impute_bboxes(bboxes, quiet)
+            imputed = [frame_bboxes[idx]["bbox"] for idx in range(len(bboxes))]
+
+            # phase 2: clean and encode every segment
+            futures = {}
+            start = 0
+            for idx, (path, length) in enumerate(zip(segment_paths, segment_lengths)):
+                output_path = segment_dir / f"cleaned_{idx:04d}.mp4"
+                futures[
+                    executor.submit(
+                        _clean_segment, path, output_path, imputed[start : start + length]
+                    )
+                ] = idx
+                start += length
+            cleaned_paths = [None] * num_segments
+            for done, future in enumerate(as_completed(futures), 1):
+                cleaned_paths[futures[future]] = future.result()
+                # 50% - 95%
+                if progress_callback:
+                    progress_callback(50 + int(done / num_segments * 45))
+
+        concat_segments(cleaned_paths, input_video_path, output_video_path)
+    if not quiet:
+        logger.info(f"Saved no watermark video at: {output_video_path}")
+    if progress_callback:
+        progress_callback(99)
+
+
+def _process_video(
+    idx: int, input_video_path: Path, output_video_path: Path, progress_queue
+) -> tuple[float, str | None]:
+    start = time.perf_counter()
+    try:
+        _worker.run(
+            input_video_path,
+            output_video_path,
+            progress_callback=lambda progress: progress_queue.put((idx, progress)),
+            quiet=True,
+        )
+    except Exception as e:
+        # the error goes back as text, exceptions like ffmpeg.Error cannot be
+        # unpickled in the parent and would break the whole pool
+        return time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, None
+
+
+def iter_batch_parallel(
+    sora_wm_cls: type,
+    sora_wm_kwargs: dict,
+    jobs: list[tuple[Path, Path]],
+    num_jobs: int,
+    progress_callback: Callable[[int, int], None] | None = None,
+) -> Iterator[BatchResult]:
+    """Process ``(input, output)`` pairs on ``num_jobs`` worker processes.
+
+    Results are yielded in completion order. A failing video yields a result with
+    its error and the pool carries on with the rest. ``progress_callback`` gets
+    ``(job index, progress)`` with the per-video progress reported by the workers.
+    """
+    num_jobs = max(1, min(num_jobs, len(jobs)))
+    num_threads = max(1, (os.cpu_count() or 1) // num_jobs)
+    with mp.get_context("spawn").Manager() as manager:
+        progress_queue = manager.Queue()
+        with ProcessPoolExecutor(
+            max_workers=num_jobs,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(sora_wm_cls, sora_wm_kwargs, num_threads),
+        ) as executor:
+            pending = {
+                executor.submit(_process_video, idx, input_path, output_path, progress_queue): (
+                    input_path,
+                    output_path,
+                )
+                for idx, (input_path, output_path) in enumerate(jobs)
+            }
+            try:
+                yield from _collect_results(pending, progress_queue, progress_callback)
+            finally:
+                # the consumer may stop early, do not start the videos left in the queue
+                executor.shutdown(cancel_futures=True)
+
+
+def _collect_results(
+    pending: dict,
+    progress_queue,
+    progress_callback: Callable[[int, int], None] | None,
+) -> Iterator[BatchResult]:
+    while pending:
+        done, _ = wait(pending, timeout=_PROGRESS_POLL_SECONDS, return_when=FIRST_COMPLETED)
+        while True:
+            try:
+                idx, progress = progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if progress_callback:
+                progress_callback(idx, progress)
+        for future in done:
+            input_path, output_path = pending.pop(future)
+            try:
+                elapsed, error = future.result()
+            except Exception as e:
+                # the worker process itself died
+                elapsed, error = 0.0, f"{type(e).__name__}: {e}"
+            result = BatchResult(input_path, output_path, error, elapsed)
+            yield result
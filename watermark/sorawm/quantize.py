@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Build the INT8 variants of the erase models and gate them on watermark crops.
+
+    python -m sorawm.quantize --model lama --video resources/dog_vs_sam.mp4
+    python -m sorawm.quantize --model lama migan --video a.mp4 b.mp4 --mode dynamic
+    python -m sorawm.quantize --model lama --video a.mp4 --min-psnr 32 --min-ssim 0.97
+
+The fp32 ONNX export of sorawm/onnx_export.py is quantized with ONNX Runtime,
+either "static" (QDQ, per channel conv weights, activation ranges calibrated on
+the inputs the model gets for real watermark crops) or "dynamic" (weights only,
+activation ranges computed at run time). The INT8 model is written next to the
+downloaded checkpoint, e.g. big-lama.int8.onnx, and becomes the "lama-int8"
+model of the ModelManager.
+
+The crops come from the videos: the detector finds the watermark and the crop
+is the ROI window the cleaner would inpaint. Half of them calibrate, the other
+half gate: the inpainted watermark regions of the INT8 model are compared with
+the fp32 torch model, and the variant is only enabled when their PSNR and SSIM
+stay above the thresholds. The result is recorded next to the INT8 model.
+"""
+
+import argparse
+from itertools import islice
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from loguru import logger
+
+from sorawm.configs import (
+    CLEAN_ROI_MARGIN,
+    LAMA_ONNX_PATH,
+    MIGAN_ONNX_PATH,
+    QUANT_MIN_PSNR,
+    QUANT_MIN_SSIM,
+)
+from sorawm.iopaint.download import cli_download_model, scan_models
+from sorawm.iopaint.helper import get_int8_path_by_url
+from sorawm.iopaint.model.lama import LAMA_MODEL_URL
+from sorawm.iopaint.model.mi_gan import MIGAN_MODEL_URL
+from sorawm.iopaint.model_manager import ModelManager
+from sorawm.iopaint.schema import InpaintRequest
+from sorawm.onnx_export import export_lama, export_migan
+from sorawm.utils.onnx_utils import OnnxModule, write_gate_record
+from sorawm.utils.roi_utils import bbox_mask, clip_bbox, expand_bbox
+from sorawm.utils.video_utils import VideoLoader
+
+# model name -> (checkpoint url, fp32 onnx export, exporter)
+QUANTIZABLE_MODELS = {
+    "lama": (LAMA_MODEL_URL, LAMA_ONNX_PATH, export_lama),
+    "migan": (MIGAN_MODEL_URL, MIGAN_ONNX_PATH, export_migan),
+}
+QUANT_MODES = ("static", "dynamic")
+
+
+def collect_crops(videos: list[Path], num_crops: int, margin: int, align: int):
+    """ROI windows around the detected watermark, spread over the videos.
+
+    Returns (crop, mask, bbox) tuples, the bbox in crop coordinates.
+    """
+    from sorawm.watermark_detector import SoraWaterMarkDetector
+
+    detector = SoraWaterMarkDetector(strategy="yolo")
+    per_video = -(-num_crops // len(videos))
+    crops = []
+    for video in videos:
+        loader = VideoLoader(video)
+        stride = max(1, loader.frame_count // per_video)
+        frames = list(islice(loader, 0, None, stride))[:per_video]
+        for frame, detection in zip(frames, detector.detect_batch(frames)):
+            if not detection["detected"]:
+                continue
+            height, width = frame.shape[:2]
+            bbox = clip_bbox(detection["bbox"], width, height)
+            window = expand_bbox(bbox, margin, width, height, align=align)
+            left, top, right, bottom = window
+            x1, y1, x2, y2 = bbox
+            crops.append(
+                (
+                    frame[top:bottom, left:right].copy(),
+                    bbox_mask(bbox, window),
+                    (x1 - left, y1 - top, x2 - left, y2 - top),
+                )
+            )
+    return crops
+
+
+class _InputRecorder:
+    """Stands in for the torch model to keep the tensors it is called with."""
+
+    def __init__(self, module):
+        self.module = module
+        self.inputs = []
+
+    def __call__(self, *inputs):
+        self.inputs.append([tensor.detach().cpu().numpy() for tensor in inputs])
+        return self.module(*inputs)
+
+
+def inpaint(manager: ModelManager, crops) -> list[np.ndarray]:
+    return [manager(crop, mask, InpaintRequest()) for crop, mask, _ in crops]
+
+
+def record_inputs(manager: ModelManager, crops) -> list[list[np.ndarray]]:
+    inpaint_model = manager.model
+    recorder = _InputRecorder(inpaint_model.model)
+    inpaint_model.model = recorder
+    try:
+        inpaint(manager, crops)
+    finally:
+        inpaint_model.model = recorder.module
+    return recorder.inputs
+
+
+def quantize_model(
+    fp32_path: Path, int8_path: Path, mode: str, calibration_inputs: list[list[np.ndarray]]
+):
+    """Quantize the convolutions of ``fp32_path``, the spectral and other ops stay fp32."""
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    if mode == "dynamic":
+        quantize_dynamic(
+            fp32_path, int8_path, weight_type=QuantType.QInt8, op_types_to_quantize=["Conv"]
+        )
+        return
+
+    import onnx
+
+    graph = onnx.load(fp32_path, load_external_data=False).graph
+    input_names = [node.name for node in graph.input]
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            # the session takes float32, like OnnxModule feeds it
+            self.feeds = iter(
+                {name: array.astype(np.float32) for name, array in zip(input_names, inputs)}
+                for inputs in calibration_inputs
+            )
+
+        def get_next(self):
+            return next(self.feeds, None)
+
+    quantize_static(
+        fp32_path,
+        int8_path,
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255**2 / mse))
+
+
+def ssim(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean SSIM over the channels, 11x11 gaussian window as in Wang et al."""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a, b = a.astype(np.float64), b.astype(np.float64)
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a**2
+    var_b = blur(b * b) - mu_b**2
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / (
+        (mu_a**2 + mu_b**2 + c1) * (var_a + var_b + c2)
+    )
+    return float(ssim_map.mean())
+
+
+def compare(crops, results, references) -> dict:
+    """PSNR and SSIM of the inpainted watermark regions against the fp32 model."""
+    scores = []
+    for (_, _, (x1, y1, x2, y2)), result, reference in zip(crops, results, references):
+        region, expected = result[y1:y2, x1:x2], reference[y1:y2, x1:x2]
+        scores.append((psnr(region, expected), ssim(region, expected)))
+    psnrs, ssims = np.array(scores).T
+    # the mean psnr of crops identical to fp32 would be inf
+    finite = psnrs[np.isfinite(psnrs)]
+    return {
+        "psnr": float(finite.mean()) if len(finite) else float("inf"),
+        "worst_psnr": float(psnrs.min()),
+        "ssim": float(ssims.mean()),
+        "worst_ssim": float(ssims.min()),
+    }
+
+
+def quantize(
+    name: str,
+    videos: list[Path],
+    mode: str = "static",
+    num_crops: int = 64,
+    margin: int = CLEAN_ROI_MARGIN,
+    min_psnr: float = QUANT_MIN_PSNR,
+    min_ssim: float = QUANT_MIN_SSIM,
+) -> bool:
+    """Build ``<name>-int8`` and return whether it passed the accuracy gate."""
+    url, fp32_path, export = QUANTIZABLE_MODELS[name]
+    if not fp32_path.exists():
+        logger.info(f"Exporting {name} to {fp32_path}")
+        export(fp32_path)
+    if name not in [it.name for it in scan_models()]:
+        cli_download_model(name)
+    manager = ModelManager(name=name, device=torch.device("cpu"))
+
+    crops = collect_crops(videos, num_crops, margin, manager.model.pad_mod)
+    if len(crops) < 2:
+        raise RuntimeError(f"Found {len(crops)} watermark crops in {videos}, need at least 2")
+    calibration, held_out = crops[::2], crops[1::2]
+    logger.info(f"{len(calibration)} calibration and {len(held_out)} gate crops")
+
+    int8_path = Path(get_int8_path_by_url(url))
+    quantize_model(fp32_path, int8_path, mode, record_inputs(manager, calibration))
+
+    references = inpaint(manager, held_out)
+    inpaint_model = manager.model
+    fp32_model = inpaint_model.model
+    inpaint_model.model = OnnxModule(int8_path)
+    try:
+        metrics = compare(held_out, inpaint(manager, held_out), references)
+    finally:
+        inpaint_model.model = fp32_model
+
+    passed = metrics["psnr"] >= min_psnr and metrics["ssim"] >= min_ssim
+    write_gate_record(
+        int8_path,
+        {
+            **metrics,
+            "passed": passed,
+            "mode": mode,
+            "crops": len(held_out),
+            "min_psnr_threshold": min_psnr,
+            "min_ssim_threshold": min_ssim,
+        },
+    )
+    summary = (
+        f"psnr {metrics['psnr']:.2f} dB (worst {metrics['worst_psnr']:.2f}), "
+        f"ssim {metrics['ssim']:.4f} (worst {metrics['worst_ssim']:.4f})"
+    )
+    if passed:
+        logger.info(f"{name}-int8 enabled, {summary}")
+    else:
+        logger.error(
+            f"{name}-int8 stays disabled, {summary} is below "
+            f"psnr {min_psnr} dB / ssim {min_ssim}"
+        )
+    return passed
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model", default=["lama"], nargs="+", choices=list(QUANTIZABLE_MODELS)
+    )
+    parser.add_argument(
+        "--video", type=Path, required=True, nargs="+", help="videos with the watermark"
+    )
+    parser.add_argument("--mode", default="static", choices=QUANT_MODES)
+    parser.add_argument("--crops", default=64, type=int, help="calibration + gate crops")
+    parser.add_argument("--margin", default=CLEAN_ROI_MARGIN, type=int)
+    parser.add_argument("--min-psnr", default=QUANT_MIN_PSNR, type=float)
+    parser.add_argument("--min-ssim", default=QUANT_MIN_SSIM, type=float)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args_parser()
+    for name in args.model:
+        quantize(
+            name,
+            args.video,
+            args.mode,
+            args.crops,
+            args.margin,
+            args.min_psnr,
+            args.min_ssim,
+        )
@@ -1,9 +1,10 @@
 from contextlib import asynccontextmanager
 
+from sqlalchemy import event, inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
-from sorawm.configs import SQLITE_PATH
+from sorawm.configs import SQLITE_BUSY_TIMEOUT_MS, SQLITE_PATH
 
 
 class Base(DeclarativeBase):
@@ -18,9 +19,42 @@ async_session_maker = async_sessionmaker(
 )
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL: readers do not block the writer nor the other way around, and with it
+    # synchronous=NORMAL only syncs at checkpoints while staying consistent
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+# columns added to existing tables since their creation: table -> (column, type)
+_ADDED_COLUMNS = {"tasks": [("content_hash", "VARCHAR")]}
+
+
+def _migrate(conn):
+    """Bring databases created by older versions up to the current models.
+
+    create_all only creates missing tables, new columns of existing tables and
+    indexes added to existing tables are created here.
+    """
+    inspector = inspect(conn)
+    for table_name, columns in _ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        for name, sql_type in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {sql_type}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate)
 
 
 @asynccontextmanager
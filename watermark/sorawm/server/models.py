@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, Integer, String
+from sqlalchemy import DateTime, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from sorawm.server.db import Base
@@ -8,6 +8,8 @@ from sorawm.server.db import Base
 
 class Task(Base):
     __tablename__ = "tasks"
+    # listing and cleanup by status, oldest or newest first
+    __table_args__ = (Index("ix_tasks_status_created_at", "status", "created_at"),)
 
     id: Mapped[str] = mapped_column(String, primary_key=True)
     video_path: Mapped[str] = mapped_column(String, nullable=False)
@@ -15,7 +17,20 @@ class Task(Base):
     status: Mapped[str] = mapped_column(String, nullable=False, default="PROCESSING")
     percentage: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     download_url: Mapped[str] = mapped_column(String, nullable=True)
+    # blake2b of the uploaded video, finds earlier results of the same video
+    content_hash: Mapped[str] = mapped_column(String, nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.now, onupdate=datetime.now
     )
+
+
+class Result(Base):
+    """An output file and the number of finished tasks pointing at it."""
+
+    __tablename__ = "results"
+
+    output_path: Mapped[str] = mapped_column(String, primary_key=True)
+    content_hash: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
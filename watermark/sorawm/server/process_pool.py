@@ -0,0 +1,237 @@
+"""Model worker processes of the server, one per slot, each with its own SoraWM.
+
+Every slot is a spawned process that loads (and warms up) the models once, then
+takes jobs off the queue of the pool. Progress and cancellation go over a manager
+queue and dict, the event loop only awaits the job futures.
+"""
+
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable
+
+from loguru import logger
+
+# state of a slot process, set once by _init_slot
+_sora_wm = None
+_progress_queue = None
+_cancelled = None
+_ready_slots = None
+
+
+def slot_cores(slot: int, cores_per_slot: int) -> list[int] | None:
+    """Cores slot ``slot`` is pinned to, consecutive blocks wrapping around the CPU."""
+    if cores_per_slot <= 0 or not hasattr(os, "sched_setaffinity"):
+        return None
+    available = sorted(os.sched_getaffinity(0))
+    return [
+        available[(slot * cores_per_slot + offset) % len(available)]
+        for offset in range(min(cores_per_slot, len(available)))
+    ]
+
+
+def _init_slot(
+    slot_counter,
+    ready_slots,
+    num_threads: int,
+    cores_per_slot: int,
+    progress_queue,
+    cancelled,
+    warmup: bool,
+    sora_wm_cls: type | None,
+):
+    global _sora_wm, _progress_queue, _cancelled, _ready_slots
+    with slot_counter.get_lock():
+        slot = slot_counter.value
+        slot_counter.value += 1
+    cores = slot_cores(slot, cores_per_slot)
+    if cores:
+        # before torch starts its thread pool, so the threads stay on these cores
+        os.sched_setaffinity(0, cores)
+    if sora_wm_cls is None:
+        from sorawm.core import SoraWM as sora_wm_cls
+
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+    _ready_slots = ready_slots
+    _sora_wm = sora_wm_cls(cpu_threads=num_threads)
+    if warmup:
+        _sora_wm.warmup()
+    logger.info(
+        f"Model slot {slot} ready in process {os.getpid()}, "
+        f"{num_threads} thread(s), cores: {cores or 'all'}"
+    )
+    with ready_slots.get_lock():
+        ready_slots.value += 1
+
+
+def _wait_all_slots(count: int) -> int:
+    # every call holds its process until all slots are loaded, so each lands on its own
+    while _ready_slots.value < count:
+        time.sleep(0.1)
+    return os.getpid()
+
+
+def _run_task(
+    task_id: str,
+    input_video_path: Path,
+    output_video_path: Path,
+    content_hash: str | None = None,
+):
+    def progress_callback(percentage: int):
+        if task_id in _cancelled:
+            raise InterruptedError(f"Task {task_id} was cancelled")
+        _progress_queue.put((task_id, percentage))
+
+    try:
+        _sora_wm.run(
+            input_video_path, output_video_path, progress_callback, False, content_hash
+        )
+    except InterruptedError:
+        raise
+    except Exception as e:
+        # exceptions like ffmpeg.Error cannot be unpickled in the server process
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+class ModelProcessPool:
+    """``concurrency`` model processes running SoraWM.run for the server worker.
+
+    ``sora_wm_cls`` replaces SoraWM in the slots, it has to be importable by the
+    spawned processes.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        threads_per_slot: int = 0,
+        cores_per_slot: int = 0,
+        warmup: bool = True,
+        sora_wm_cls: type | None = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        # by default the slots share the cores evenly
+        self.threads_per_slot = threads_per_slot or cores_per_slot or max(
+            1, (os.cpu_count() or 1) // self.concurrency
+        )
+        self.cores_per_slot = cores_per_slot
+        self.warmup = warmup
+        self.sora_wm_cls = sora_wm_cls
+        self._context = mp.get_context("spawn")
+        self._manager = None
+        self._executor: ProcessPoolExecutor | None = None
+        self._progress_queue = None
+        self._cancelled = None
+        # task id -> progress callback of the jobs in the pool
+        self._running: dict[str, Callable[[int], None] | None] = {}
+        self._drain_thread: threading.Thread | None = None
+        self._restart_lock = asyncio.Lock()
+
+    async def start(self):
+        self._manager = self._context.Manager()
+        self._progress_queue = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._drain_thread = threading.Thread(
+            target=self._drain_progress, name="wm-progress", daemon=True
+        )
+        self._drain_thread.start()
+        await self._start_executor()
+
+    async def _start_executor(self):
+        logger.info(
+            f"Starting {self.concurrency} model process(es), "
+            f"{self.threads_per_slot} thread(s) each"
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.concurrency,
+            # fork is unsafe once torch has started its thread pools
+            mp_context=self._context,
+            initializer=_init_slot,
+            initargs=(
+                self._context.Value("i", 0),
+                self._context.Value("i", 0),
+                self.threads_per_slot,
+                self.cores_per_slot,
+                self._progress_queue,
+                self._cancelled,
+                self.warmup,
+                self.sora_wm_cls,
+            ),
+        )
+        # the pool spawns its processes on demand, one call per slot loads them all now
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _wait_all_slots, self.concurrency)
+                for _ in range(self.concurrency)
+            )
+        )
+        logger.info(f"Model processes ready: {sorted(set(pids))}")
+
+    def _drain_progress(self):
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+            task_id, percentage = item
+            callback = self._running.get(task_id)
+            if callback is not None:
+                callback(percentage)
+
+    async def run(
+        self,
+        task_id: str,
+        input_video_path: Path,
+        output_video_path: Path,
+        progress_callback: Callable[[int], None] | None = None,
+        content_hash: str | None = None,
+    ):
+        """Run the job in a free slot, raises InterruptedError once cancelled."""
+        executor = self._executor
+        self._running[task_id] = progress_callback
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                executor,
+                _run_task,
+                task_id,
+                input_video_path,
+                output_video_path,
+                content_hash,
+            )
+        except BrokenProcessPool:
+            # a slot process died (out of memory, segfault), the others are gone too
+            await self._restart(executor)
+            raise RuntimeError("The model process running the task died")
+        finally:
+            self._running.pop(task_id, None)
+            self._cancelled.pop(task_id, None)
+
+    async def _restart(self, broken: ProcessPoolExecutor):
+        async with self._restart_lock:
+            if self._executor is not broken:
+                return
+            logger.error("Model process pool broken, restarting it")
+            broken.shutdown(wait=False, cancel_futures=True)
+            await self._start_executor()
+
+    def cancel(self, task_ids: list[str]):
+        """Running tasks stop at their next progress report."""
+        for task_id in task_ids:
+            if task_id in self._running:
+                self._cancelled[task_id] = True
+
+    async def stop(self):
+        if self._executor is None:
+            return
+        # running jobs stop at their next progress report instead of finishing
+        self.cancel(list(self._running))
+        await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+        self._executor = None
+        self._progress_queue.put(None)
+        self._drain_thread.join()
+        self._manager.shutdown()
@@ -0,0 +1,102 @@
+"""In-memory state of the live tasks, pushed to subscribers and written back in batches.
+
+Progress reports only touch memory: the event streams of the task get the new
+state at once and the percentages reach the database every ``flush_interval``
+seconds, all in one transaction. Status changes are still written by the worker,
+which relays them here once committed; a settled task leaves the store.
+"""
+
+import asyncio
+
+from loguru import logger
+
+from sorawm.configs import PROGRESS_FLUSH_INTERVAL
+from sorawm.server.repository import TaskRepository
+from sorawm.server.schemas import TERMINAL_STATUSES, Status, WMRemoveResults
+
+
+class ProgressStore:
+    def __init__(
+        self, repository: TaskRepository, flush_interval: float = PROGRESS_FLUSH_INTERVAL
+    ):
+        self.repository = repository
+        self.flush_interval = flush_interval
+        self._states: dict[str, WMRemoveResults] = {}
+        # tasks whose percentage is not in the database yet
+        self._dirty: set[str] = set()
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    def get(self, task_id: str) -> WMRemoveResults | None:
+        return self._states.get(task_id)
+
+    def set_status(self, task_id: str, state: WMRemoveResults):
+        """Relay a status committed by the worker."""
+        if state.status in TERMINAL_STATUSES:
+            self._states.pop(task_id, None)
+            self._dirty.discard(task_id)
+        else:
+            self._states[task_id] = state
+        self._publish(task_id, state)
+
+    def set_progress(self, task_ids: list[str], percentage: int):
+        for task_id in task_ids:
+            state = self._states.get(task_id)
+            if state is None or state.status != Status.PROCESSING:
+                continue
+            state = state.model_copy(update={"percentage": percentage})
+            self._states[task_id] = state
+            self._dirty.add(task_id)
+            self._publish(task_id, state)
+
+    def _publish(self, task_id: str, state: WMRemoveResults):
+        for queue in self._subscribers.get(task_id, ()):
+            queue.put_nowait(state)
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Queue receiving every later state of the task."""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        percentages = {
+            task_id: self._states[task_id].percentage
+            for task_id in dirty
+            if task_id in self._states
+        }
+        if not percentages:
+            return
+        try:
+            await self.repository.set_progress(percentages)
+        except Exception as e:
+            logger.error(f"Error flushing the progress of {len(percentages)} task(s): {e}")
+            self._dirty |= percentages.keys() & self._states.keys()
+            return
+        logger.debug(f"Flushed the progress of {len(percentages)} task(s)")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="wm-progress")
+
+    async def stop(self):
+        if self._flush_task is None:
+            return
+        self._flush_task.cancel()
+        await asyncio.gather(self._flush_task, return_exceptions=True)
+        self._flush_task = None
+        await self.flush()
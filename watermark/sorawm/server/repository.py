@@ -0,0 +1,306 @@
+"""Task and result storage of the server, the only code writing to the database.
+
+Reads use pooled connections of their own, which WAL lets run alongside a write.
+Every write goes through a single writer coroutine that commits whatever has
+queued up meanwhile in one transaction: SQLite never sees two writers fighting
+over its lock, and a burst of status changes costs one commit. Writes are
+direct UPDATE / DELETE statements returning the rows they changed, rows are
+never loaded to be modified.
+"""
+
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Collection, Iterable, TypeVar
+
+from loguru import logger
+from sqlalchemy import Row, bindparam, delete, func, insert, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sorawm.configs import SQLITE_WRITE_BATCH
+from sorawm.server.db import get_session
+from sorawm.server.models import Result, Task
+from sorawm.server.schemas import TERMINAL_STATUSES, Status
+
+T = TypeVar("T")
+WriteUnit = Callable[[AsyncSession], Awaitable[T]]
+
+tasks = Task.__table__
+results = Result.__table__
+
+
+class TaskRepository:
+    def __init__(self, batch_size: int = SQLITE_WRITE_BATCH):
+        self.batch_size = max(1, batch_size)
+        self._writes: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+
+    async def write(self, unit: WriteUnit[T]) -> T:
+        """Run ``unit`` in the transaction of the next batch of the writer."""
+        if self._writer is None:
+            self._writes = asyncio.Queue()
+            self._writer = asyncio.create_task(self._write_loop(), name="wm-db-writer")
+        future = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait((unit, future))
+        return await future
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._writes.get()]
+            while len(batch) < self.batch_size and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                await self._commit(batch)
+            if stop:
+                return
+
+    async def _commit(self, batch: list[tuple[WriteUnit, asyncio.Future]]):
+        try:
+            async with get_session() as session:
+                outcomes = [await unit(session) for unit, _ in batch]
+        except Exception as e:
+            if len(batch) > 1:
+                # one write failed the transaction, commit the others on their own
+                for item in batch:
+                    await self._commit([item])
+                return
+            future = batch[0][1]
+            if not future.done():
+                future.set_exception(e)
+            return
+        for (_, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+    async def stop(self):
+        """Commit the queued writes and stop the writer."""
+        if self._writer is None:
+            return
+        self._writes.put_nowait(None)
+        await self._writer
+        self._writer = None
+
+    # reads
+
+    async def get(self, task_id: str) -> Task | None:
+        async with get_session() as session:
+            return await session.get(Task, task_id)
+
+    async def list_tasks(
+        self,
+        statuses: Iterable[str],
+        created_before: datetime | None = None,
+        limit: int = 100,
+    ) -> list[Task]:
+        """Tasks in ``statuses``, newest first, pages continue from ``created_before``."""
+        query = (
+            select(Task)
+            .where(Task.status.in_(list(statuses)))
+            .order_by(Task.created_at.desc())
+            .limit(limit)
+        )
+        if created_before is not None:
+            query = query.where(Task.created_at < created_before)
+        async with get_session() as session:
+            return list((await session.execute(query)).scalars())
+
+    async def count_by_status(self) -> dict[str, int]:
+        query = select(Task.status, func.count()).group_by(Task.status)
+        async with get_session() as session:
+            return dict((await session.execute(query)).all())
+
+    # writes, each returns the rows it changed
+
+    async def create(self, task_id: str) -> Row:
+        async def unit(session: AsyncSession):
+            result = await session.execute(
+                insert(tasks)
+                .values(id=task_id, video_path="", status=Status.UPLOADING, percentage=0)
+                .returning(*tasks.c)
+            )
+            return result.one()
+
+        return await self.write(unit)
+
+    async def update(
+        self, task_ids: Collection[str], values: dict[str, Any], unsettled_only: bool = False
+    ) -> list[Row]:
+        if not task_ids:
+            return []
+        statement = update(tasks).where(tasks.c.id.in_(list(task_ids)))
+        if unsettled_only:
+            statement = statement.where(tasks.c.status.not_in(TERMINAL_STATUSES))
+        statement = statement.values(**values).returning(*tasks.c)
+
+        async def unit(session: AsyncSession):
+            return (await session.execute(statement)).all()
+
+        return await self.write(unit)
+
+    async def set_progress(self, percentages: dict[str, int]):
+        """One executemany for all the tasks, those settled meanwhile keep their state."""
+        if not percentages:
+            return
+        statement = (
+            update(tasks)
+            .where(tasks.c.id == bindparam("task_id"))
+            .where(tasks.c.status == Status.PROCESSING)
+            .values(percentage=bindparam("task_percentage"))
+        )
+        params = [
+            {"task_id": task_id, "task_percentage": percentage}
+            for task_id, percentage in percentages.items()
+        ]
+
+        async def unit(session: AsyncSession):
+            await session.execute(statement, params)
+
+        await self.write(unit)
+
+    def _finished(self, task_ids: Collection[str], output_path: str):
+        return (
+            update(tasks)
+            .where(tasks.c.id.in_(list(task_ids)))
+            .values(
+                status=Status.FINISHED,
+                percentage=100,
+                output_path=output_path,
+                download_url=literal("/download/") + tasks.c.id,
+            )
+            .returning(*tasks.c)
+        )
+
+    async def finish(
+        self, task_ids: Collection[str], output_path: str, content_hash: str | None
+    ) -> list[Row]:
+        """Finish the tasks with the output, one reference to it per task."""
+
+        async def unit(session: AsyncSession):
+            rows = (await session.execute(self._finished(task_ids, output_path))).all()
+            if content_hash is not None and rows:
+                statement = sqlite_insert(results).values(
+                    output_path=output_path,
+                    content_hash=content_hash,
+                    ref_count=len(rows),
+                )
+                await session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[results.c.output_path],
+                        set_={"ref_count": results.c.ref_count + statement.excluded.ref_count},
+                    )
+                )
+            return rows
+
+        return await self.write(unit)
+
+    async def finish_from_result(
+        self, task_id: str, content_hash: str, output_exists: Callable[[str], bool]
+    ) -> Row | None:
+        """Finish the task with an existing output of the same video, if there is one."""
+
+        async def unit(session: AsyncSession):
+            outputs = await session.execute(
+                select(results.c.output_path)
+                .where(results.c.content_hash == content_hash)
+                .order_by(results.c.created_at.desc())
+            )
+            for output_path in outputs.scalars():
+                if not output_exists(output_path):
+                    continue
+                updated = await session.execute(
+                    update(results)
+                    .where(results.c.output_path == output_path, results.c.ref_count > 0)
+                    .values(ref_count=results.c.ref_count + 1)
+                )
+                if updated.rowcount:
+                    return (await session.execute(self._finished([task_id], output_path))).one()
+            return None
+
+        return await self.write(unit)
+
+    async def fail_interrupted(self) -> list[Row]:
+        """Fail the tasks a previous run of the server left uploading or processing."""
+
+        async def unit(session: AsyncSession):
+            result = await session.execute(
+                update(tasks)
+                .where(tasks.c.status.in_([Status.UPLOADING, Status.PROCESSING]))
+                .values(status=Status.ERROR, percentage=0)
+                .returning(*tasks.c)
+            )
+            return result.all()
+
+        return await self.write(unit)
+
+    async def delete_settled(
+        self, updated_before: datetime, keep_uploads: Collection[str] = ()
+    ) -> tuple[int, list[str]]:
+        """Delete the tasks settled before ``updated_before`` and release their outputs.
+
+        Returns the number of tasks and the files nothing refers to anymore: their
+        uploads, except those of the tasks in ``keep_uploads``, and the outputs whose
+        last reference went with them.
+        """
+
+        async def unit(session: AsyncSession):
+            rows = (
+                await session.execute(
+                    delete(tasks)
+                    .where(
+                        tasks.c.status.in_(TERMINAL_STATUSES),
+                        tasks.c.updated_at < updated_before,
+                    )
+                    .returning(
+                        tasks.c.id, tasks.c.status, tasks.c.video_path, tasks.c.output_path
+                    )
+                )
+            ).all()
+            paths = [
+                row.video_path for row in rows if row.video_path and row.id not in keep_uploads
+            ]
+            references = Counter(
+                row.output_path
+                for row in rows
+                if row.status == Status.FINISHED and row.output_path
+            )
+            if references:
+                shared = set(
+                    (
+                        await session.execute(
+                            select(results.c.output_path).where(
+                                results.c.output_path.in_(list(references))
+                            )
+                        )
+                    ).scalars()
+                )
+                # finished without a content hash, the task owned the output alone
+                paths += [path for path in references if path not in shared]
+                if shared:
+                    await session.execute(
+                        update(results)
+                        .where(results.c.output_path == bindparam("released_path"))
+                        .values(ref_count=results.c.ref_count - bindparam("released")),
+                        [
+                            {"released_path": path, "released": references[path]}
+                            for path in shared
+                        ],
+                    )
+                    freed = await session.execute(
+                        delete(results)
+                        .where(
+                            results.c.output_path.in_(list(shared)),
+                            results.c.ref_count <= 0,
+                        )
+                        .returning(results.c.output_path)
+                    )
+                    paths += list(freed.scalars())
+            return len(rows), paths
+
+        count, paths = await self.write(unit)
+        if count:
+            logger.debug(f"Deleted {count} settled task(s), {len(paths)} file(s) released")
+        return count, paths
@@ -1,37 +1,55 @@
-from pathlib import Path
-from uuid import uuid4
+import asyncio
 
-import aiofiles
-from fastapi import APIRouter, BackgroundTasks, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from loguru import logger
+from starlette.requests import ClientDisconnect
 
-from sorawm.server.schemas import WMRemoveResults
+from sorawm.configs import SSE_KEEPALIVE_INTERVAL
+from sorawm.server.schemas import TERMINAL_STATUSES, WMRemoveEvent, WMRemoveResults
+from sorawm.server.upload import UploadError, UploadTooLarge, stream_upload
 from sorawm.server.worker import worker
 
 router = APIRouter()
 
 
-async def process_upload_and_queue(
-    task_id: str, video_content: bytes, video_path: Path
-):
+@router.post(
+    "/submit_remove_task",
+    # the body is parsed by stream_upload, describe the form for the docs
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"video": {"type": "string", "format": "binary"}},
+                        "required": ["video"],
+                    }
+                }
+            },
+        }
+    },
+)
+async def submit_remove_task(request: Request):
+    task_id = await worker.create_task()
+    try:
+        upload = await stream_upload(request, worker.upload_dir)
+    except (UploadError, ClientDisconnect) as e:
+        await worker.mark_task_error(task_id, f"Upload failed: {e}")
+        if isinstance(e, ClientDisconnect):
+            raise
+        status_code = 413 if isinstance(e, UploadTooLarge) else 400
+        raise HTTPException(status_code=status_code, detail=str(e))
+    logger.debug(
+        f"Task {task_id} uploaded {upload.filename}: {upload.size} bytes, "
+        f"blake2b {upload.content_hash}"
+    )
     try:
-        async with aiofiles.open(video_path, "wb") as f:
-            await f.write(video_content)
-        await worker.queue_task(task_id, video_path)
+        await worker.queue_task(task_id, upload.path, upload.content_hash)
     except Exception as e:
         await worker.mark_task_error(task_id, str(e))
 
-
-@router.post("/submit_remove_task")
-async def submit_remove_task(
-    background_tasks: BackgroundTasks, video: UploadFile = File(...)
-):
-    task_id = await worker.create_task()
-    content = await video.read()
-    upload_filename = f"{uuid4()}_{video.filename}"
-    video_path = worker.upload_dir / upload_filename
-    background_tasks.add_task(process_upload_and_queue, task_id, content, video_path)
-
     return {"task_id": task_id, "message": "Task submitted."}
 
 
@@ -44,6 +62,50 @@ async def get_results(remove_task_id: str) -> WMRemoveResults:
     return result
 
 
+def _sse(task_id: str, state: WMRemoveResults) -> str:
+    event = "complete" if state.status in TERMINAL_STATUSES else "progress"
+    data = WMRemoveEvent(task_id=task_id, **state.model_dump()).model_dump_json()
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.get("/events/{remove_task_id}")
+async def task_events(remove_task_id: str, request: Request):
+    """Server-sent events with the state of the task, ending once it is settled.
+
+    "progress" events carry the percentage while the task runs, the final
+    "complete" event its status and download url.
+    """
+    # subscribe before reading the state, nothing published in between gets lost
+    queue = worker.progress.subscribe(remove_task_id)
+    state = await worker.get_task_status(remove_task_id)
+    if state is None:
+        worker.progress.unsubscribe(remove_task_id, queue)
+        raise HTTPException(status_code=404, detail="Task does not exist.")
+
+    async def stream():
+        try:
+            current = state
+            yield _sse(remove_task_id, current)
+            while current.status not in TERMINAL_STATUSES:
+                try:
+                    current = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(remove_task_id, current)
+        finally:
+            worker.progress.unsubscribe(remove_task_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # no caching nor proxy buffering of the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/download/{task_id}")
 async def download_video(task_id: str):
     result = await worker.get_task_status(task_id)
@@ -11,7 +11,15 @@ class Status(StrEnum):
     CANCELLED = "CANCELLED"
 
 
+# settled tasks, whatever the outcome
+TERMINAL_STATUSES = (Status.FINISHED, Status.ERROR, Status.CANCELLED)
+
+
 class WMRemoveResults(BaseModel):
     percentage: int
     status: Status
     download_url: str | None = None
+
+
+class WMRemoveEvent(WMRemoveResults):
+    task_id: str
@@ -0,0 +1,158 @@
+"""Streaming of the multipart body of an upload straight to disk.
+
+The body is fed to the push parser of python-multipart as it arrives, the file
+part is written out in fixed-size chunks while it is hashed and counted, so an
+upload never sits in memory and an oversized one is cut off early.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+import aiofiles
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.requests import Request
+
+from sorawm.configs import UPLOAD_CHUNK_BYTES, UPLOAD_MAX_BYTES
+
+# multipart boundaries and part headers on top of the file itself
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+@dataclass
+class StreamedUpload:
+    path: Path
+    filename: str
+    size: int
+    # blake2b of the content, the hash the track cache keys videos with
+    content_hash: str
+
+
+class _FilePart:
+    """python-multipart callbacks collecting the data of the ``field`` file part."""
+
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.filename: str | None = None
+        self.pieces: list[bytes] = []
+        self.finished = False
+        self._writing = False
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if (
+            not self.finished
+            and options.get(b"name") == self.field
+            and b"filename" in options
+        ):
+            self._writing = True
+            self.filename = Path(options[b"filename"].decode("utf-8", "replace")).name
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._writing:
+            # the parser reuses its buffer, keep a copy
+            self.pieces.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        if self._writing:
+            self._writing = False
+            self.finished = True
+
+
+async def stream_upload(
+    request: Request,
+    upload_dir: Path,
+    field: str = "video",
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    chunk_bytes: int = UPLOAD_CHUNK_BYTES,
+) -> StreamedUpload:
+    """Write the ``field`` file of the multipart ``request`` to ``upload_dir``.
+
+    The file only gets its final name once complete, a failed upload leaves
+    nothing behind. Raises UploadTooLarge past ``max_bytes``, UploadError for
+    bodies without the file.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError("Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_bytes + _MULTIPART_OVERHEAD:
+        raise UploadTooLarge(f"Upload of {content_length} bytes, the limit is {max_bytes}")
+
+    part = _FilePart(field)
+    parser = MultipartParser(options[b"boundary"], part.callbacks())
+    digest = hashlib.blake2b(digest_size=16)
+    size = 0
+    buffer = bytearray()
+    path = part_path = f = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if part.filename is None:
+                continue
+            if f is None:
+                path = upload_dir / f"{uuid4()}_{part.filename}"
+                part_path = path.with_name(path.name + ".part")
+                f = await aiofiles.open(part_path, "wb")
+            for piece in part.pieces:
+                size += len(piece)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload above the limit of {max_bytes} bytes")
+                digest.update(piece)
+                buffer += piece
+            part.pieces.clear()
+            if len(buffer) >= chunk_bytes:
+                await f.write(bytes(buffer))
+                buffer.clear()
+        parser.finalize()
+        if not part.finished:
+            raise UploadError(f"No complete '{field}' file in the upload")
+        await f.write(bytes(buffer))
+        await f.close()
+        f = None
+        os.replace(part_path, path)
+    except BaseException:
+        if f is not None:
+            await f.close()
+        if part_path is not None:
+            part_path.unlink(missing_ok=True)
+        raise
+    return StreamedUpload(path, part.filename, size, digest.hexdigest())
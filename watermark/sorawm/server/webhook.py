@@ -0,0 +1,74 @@
+"""Completion webhook, so clients learn about settled tasks without polling.
+
+Every finished, failed or cancelled task is POSTed as JSON to the configured URL.
+With a secret, the body is signed with HMAC-SHA256 in the X-Sora-Signature header
+("sha256=<hex>"), to be checked by the receiver.
+"""
+
+import asyncio
+import hashlib
+import hmac
+
+import httpx
+from loguru import logger
+
+from sorawm.configs import WEBHOOK_ATTEMPTS, WEBHOOK_TIMEOUT
+from sorawm.server.schemas import WMRemoveEvent
+
+
+class CompletionWebhook:
+    def __init__(
+        self,
+        url: str,
+        secret: str | None = None,
+        attempts: int = WEBHOOK_ATTEMPTS,
+        timeout: float = WEBHOOK_TIMEOUT,
+    ):
+        self.url = url
+        self.secret = secret
+        self.attempts = max(1, attempts)
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        # deliveries in progress, referenced so they are not garbage collected
+        self._pending: set[asyncio.Task] = set()
+
+    def notify(self, event: WMRemoveEvent):
+        """Deliver in the background, the worker does not wait for the receiver."""
+        delivery = asyncio.create_task(self._deliver(event))
+        self._pending.add(delivery)
+        delivery.add_done_callback(self._pending.discard)
+
+    async def _deliver(self, event: WMRemoveEvent):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        body = event.model_dump_json().encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            signature = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Sora-Signature"] = f"sha256={signature}"
+        for attempt in range(self.attempts):
+            try:
+                response = await self._client.post(self.url, content=body, headers=headers)
+                if response.status_code < 500:
+                    if response.is_error:
+                        logger.warning(
+                            f"Webhook for task {event.task_id} refused: "
+                            f"HTTP {response.status_code}"
+                        )
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt + 1 < self.attempts:
+                await asyncio.sleep(2**attempt)
+        logger.error(
+            f"Webhook for task {event.task_id} failed after {self.attempts} attempt(s): {error}"
+        )
+
+    async def close(self):
+        """Wait for the deliveries in progress."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,57 +1,107 @@
 import asyncio
 import os
 from asyncio import Queue
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Awaitable, Callable
 from uuid import uuid4
 
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import Row
 
-from sorawm.configs import WORKING_DIR
+from sorawm.configs import TASK_RETENTION_HOURS, WARMUP, WORKING_DIR
 from sorawm.core import SoraWM
-from sorawm.server.db import get_session
-from sorawm.server.models import Task
-from sorawm.server.schemas import Status, WMRemoveResults
+from sorawm.server.process_pool import ModelProcessPool
+from sorawm.server.progress import ProgressStore
+from sorawm.server.repository import TaskRepository
+from sorawm.server.schemas import (
+    TERMINAL_STATUSES,
+    Status,
+    WMRemoveEvent,
+    WMRemoveResults,
+)
+from sorawm.server.webhook import CompletionWebhook
+
+# seconds between two sweeps of the expired tasks
+EXPIRY_INTERVAL = 3600
 
 
 class WMRemoveTaskWorker:
-    def __init__(self, concurrency: int = 1) -> None:
+    def __init__(
+        self,
+        concurrency: int = 1,
+        mode: str = "thread",
+        threads_per_slot: int = 0,
+        cores_per_slot: int = 0,
+        retention_hours: float = TASK_RETENTION_HOURS,
+        webhook: CompletionWebhook | None = None,
+    ) -> None:
         self.queue = Queue()
         self.concurrency = max(1, concurrency)
         self._worker_tasks: list[asyncio.Task] = []
         self.sora_wm = None
+        # "thread": the coroutines share one SoraWM in this process, "process": every
+        # coroutine hands its jobs to a pool of model processes, one per slot
+        self.mode = mode
+        self.pool = (
+            ModelProcessPool(self.concurrency, threads_per_slot, cores_per_slot, WARMUP)
+            if mode == "process"
+            else None
+        )
         self.output_dir = WORKING_DIR
         self.upload_dir = WORKING_DIR / "uploads"
         self.upload_dir.mkdir(exist_ok=True, parents=True)
         self.cancelled_tasks: set[str] = set()
+        # a job is named after the task it was queued for. Uploads of a video already
+        # being processed attach to its job: content hash -> job, job -> the tasks
+        # waiting on it (its own task first while not cancelled), task -> job
+        self._inflight: dict[str, str] = {}
+        self._subscribers: dict[str, list[str]] = {}
+        self._job_of: dict[str, str] = {}
+        self.retention_hours = retention_hours
+        self.repository = TaskRepository()
+        # live state of the tasks, read by /get_results and the event streams
+        self.progress = ProgressStore(self.repository)
+        self.webhook = webhook
 
     async def initialize(self):
+        interrupted = await self.repository.fail_interrupted()
+        if interrupted:
+            logger.warning(
+                f"{len(interrupted)} task(s) left unfinished by the last run marked as ERROR"
+            )
+        if self.pool is not None:
+            logger.info("Initializing SoraWM model processes...")
+            await self.pool.start()
+            return
         logger.info("Initializing SoraWM models...")
         self.sora_wm = SoraWM()
         logger.info("SoraWM models initialized")
+        if WARMUP:
+            logger.info("Warming up SoraWM models...")
+            await asyncio.to_thread(self.sora_wm.warmup)
 
     async def create_task(self) -> str:
         task_uuid = str(uuid4())
-        async with get_session() as session:
-            task = Task(
-                id=task_uuid,
-                video_path="",  # 暂时为空，后续会更新
-                status=Status.UPLOADING,
-                percentage=0,
-            )
-            session.add(task)
+        self._publish(await self.repository.create(task_uuid))
         logger.info(f"Task {task_uuid} created with UPLOADING status")
         return task_uuid
 
-    async def queue_task(self, task_id: str, video_path: Path):
-        async with get_session() as session:
-            result = await session.execute(select(Task).where(Task.id == task_id))
-            task = result.scalar_one()
-            task.video_path = str(video_path)
-            if task_id not in self.cancelled_tasks:
-                task.status = Status.PROCESSING
-                task.percentage = 0
+    async def queue_task(
+        self, task_id: str, video_path: Path, content_hash: str | None = None
+    ):
+        """Queue the upload, unless the same video was processed or is being processed.
+
+        A video with a finished result finishes the task at once with that output, one
+        in flight attaches the task to the running job. The duplicate upload is dropped.
+        """
+        values = {"video_path": str(video_path), "content_hash": content_hash}
+        if task_id not in self.cancelled_tasks:
+            values.update(status=Status.PROCESSING, percentage=0)
+        rows = await self.repository.update([task_id], values)
+        if not rows:
+            raise LookupError(f"Task {task_id} does not exist")
+        self._publish(rows[0])
 
         if task_id in self.cancelled_tasks:
             logger.info(f"Task {task_id} was cancelled before entering the queue.")
@@ -59,33 +109,119 @@ class WMRemoveTaskWorker:
             self.cancelled_tasks.discard(task_id)
             return
 
-        self.queue.put_nowait((task_id, video_path))
+        if content_hash is not None:
+            if await self._finish_from_result(task_id, content_hash):
+                video_path.unlink(missing_ok=True)
+                return
+            # no await from the lookup to the registration, so identical uploads
+            # arriving together end up on one job
+            job_id = self._inflight.get(content_hash)
+            if job_id is not None:
+                self._subscribers[job_id].append(task_id)
+                self._job_of[task_id] = job_id
+                video_path.unlink(missing_ok=True)
+                logger.info(f"Task {task_id} attached to task {job_id}, same video")
+                return
+            self._inflight[content_hash] = task_id
+        self._subscribers[task_id] = [task_id]
+        self._job_of[task_id] = task_id
+        self.queue.put_nowait((task_id, video_path, content_hash))
         logger.info(f"Task {task_id} queued for processing: {video_path}")
 
     async def mark_task_error(self, task_id: str, error_msg: str):
-        async with get_session() as session:
-            result = await session.execute(select(Task).where(Task.id == task_id))
-            task = result.scalar_one_or_none()
-            if task:
-                task.status = Status.ERROR
-                task.percentage = 0
+        rows = await self.repository.update(
+            [task_id], {"status": Status.ERROR, "percentage": 0}
+        )
+        for row in rows:
+            self._publish(row)
         logger.error(f"Task {task_id} marked as ERROR: {error_msg}")
 
-    async def _mark_task_cancelled(self, task_id: str):
-        async with get_session() as session:
-            result = await session.execute(select(Task).where(Task.id == task_id))
-            task = result.scalar_one_or_none()
-            if task is None:
-                return
-            if task.status in (Status.FINISHED, Status.ERROR, Status.CANCELLED):
-                return
-            video_path_str = task.video_path
-            output_path_str = task.output_path
-            task.status = Status.CANCELLED
-            task.percentage = 0
-            task.download_url = None
+    async def _finish_from_result(self, task_id: str, content_hash: str) -> bool:
+        """Finish the task with the output of an earlier task of the same video."""
+        row = await self.repository.finish_from_result(
+            task_id, content_hash, lambda output_path: Path(output_path).exists()
+        )
+        if row is None:
+            return False
+        self._publish(row)
+        logger.info(f"Task {task_id} finished with the earlier output {row.output_path}")
+        return True
+
+    def _publish(self, row: Row):
+        """Relay the committed state of a task to the progress store and the webhook."""
+        state = WMRemoveResults(
+            percentage=row.percentage,
+            status=Status(row.status),
+            download_url=row.download_url,
+        )
+        self.progress.set_status(row.id, state)
+        if self.webhook is not None and state.status in TERMINAL_STATUSES:
+            self.webhook.notify(WMRemoveEvent(task_id=row.id, **state.model_dump()))
+
+    def _release_job(self, job_id: str) -> list[str]:
+        """Forget the job, returns the tasks that were still waiting on it."""
+        task_ids = self._subscribers.pop(job_id, [job_id])
+        for task_id in (job_id, *task_ids):
+            self._job_of.pop(task_id, None)
+        self._inflight = {h: j for h, j in self._inflight.items() if j != job_id}
+        return task_ids
+
+    async def _settle_job(
+        self, job_id: str, settle: Callable[[list[str]], Awaitable[list[Row]]]
+    ):
+        """Apply ``settle`` to the tasks of the job, attached ones included, and drop it."""
+        settled: set[str] = set()
+        # tasks can attach while the write is committed, loop until none is left
+        while pending := [
+            task_id
+            for task_id in self._subscribers.get(job_id, [job_id])
+            if task_id not in settled
+        ]:
+            for row in await settle(pending):
+                self._publish(row)
+            settled.update(pending)
+        self._release_job(job_id)
+
+    async def _finish_job(self, job_id: str, output_path: Path, content_hash: str | None):
+        # one reference per finished task, the output lives until the last expires
+        await self._settle_job(
+            job_id,
+            lambda task_ids: self.repository.finish(task_ids, str(output_path), content_hash),
+        )
+
+    async def _fail_job(self, job_id: str):
+        await self._settle_job(
+            job_id,
+            lambda task_ids: self.repository.update(
+                task_ids, {"status": Status.ERROR, "percentage": 0}
+            ),
+        )
 
-        for path_str in (video_path_str, output_path_str):
+    async def _cancel_job(
+        self, job_id: str, video_path: Path, output_path: Path | None = None
+    ):
+        """Cancel the tasks left on the job and delete its upload and partial output."""
+        for task_id in self._release_job(job_id):
+            await self._mark_task_cancelled(task_id)
+        for path in (video_path, output_path):
+            if path is not None:
+                path.unlink(missing_ok=True)
+        self.cancelled_tasks.discard(job_id)
+
+    async def _mark_task_cancelled(self, task_id: str, delete_files: bool = True):
+        rows = await self.repository.update(
+            [task_id],
+            {"status": Status.CANCELLED, "percentage": 0, "download_url": None},
+            unsettled_only=True,
+        )
+        if not rows:
+            return
+        self._publish(rows[0])
+
+        if not delete_files:
+            logger.info(f"Task {task_id} marked as CANCELLED.")
+            return
+        for path_str in (rows[0].video_path, rows[0].output_path):
             if path_str:
                 try:
                     Path(path_str).unlink(missing_ok=True)
@@ -99,10 +235,48 @@ class WMRemoveTaskWorker:
         if not task_ids:
             return
         for task_id in task_ids:
-            self.cancelled_tasks.add(task_id)
-        for task_id in task_ids:
+            job_id = self._job_of.get(task_id, task_id)
+            subscribers = self._subscribers.get(job_id, [])
+            if task_id in subscribers and len(subscribers) > 1:
+                # other tasks still wait on the job and its upload, only detach this one
+                subscribers.remove(task_id)
+                del self._job_of[task_id]
+                await self._mark_task_cancelled(task_id, delete_files=False)
+                continue
+            self.cancelled_tasks.add(job_id)
+            # new uploads of the video must not attach to the dying job
+            self._inflight = {h: j for h, j in self._inflight.items() if j != job_id}
+            if self.pool is not None:
+                self.pool.cancel([job_id])
             await self._mark_task_cancelled(task_id)
 
+    async def expire_tasks(self) -> int:
+        """Delete the tasks settled more than ``retention_hours`` ago, with their files.
+
+        An output shared by the tasks of the same video is deleted with the last one.
+        """
+        cutoff = datetime.now() - timedelta(hours=self.retention_hours)
+        # a cancelled task can still own the upload of the job others wait on
+        count, paths = await self.repository.delete_settled(
+            cutoff, keep_uploads=set(self._subscribers)
+        )
+        for path_str in paths:
+            try:
+                Path(path_str).unlink(missing_ok=True)
+            except Exception as exc:
+                logger.warning(f"Unable to delete expired file {path_str}: {exc}")
+        if count:
+            logger.info(f"Expired {count} task(s) older than {self.retention_hours}h")
+        return count
+
+    async def _expiry_loop(self):
+        while True:
+            try:
+                await self.expire_tasks()
+            except Exception as e:
+                logger.error(f"Error expiring tasks: {e}")
+            await asyncio.sleep(EXPIRY_INTERVAL)
+
     def start(self):
         if self._worker_tasks:
             return
@@ -113,6 +287,11 @@ class WMRemoveTaskWorker:
             self._worker_tasks.append(
                 asyncio.create_task(self._worker_loop(idx), name=f"wm-worker-{idx}")
             )
+        if self.retention_hours > 0:
+            self._worker_tasks.append(
+                asyncio.create_task(self._expiry_loop(), name="wm-expiry")
+            )
+        self.progress.start()
 
     async def stop(self):
         if not self._worker_tasks:
@@ -122,23 +301,29 @@ class WMRemoveTaskWorker:
             task.cancel()
         await asyncio.gather(*self._worker_tasks, return_exceptions=True)
         self._worker_tasks.clear()
+        if self.pool is not None:
+            await self.pool.stop()
+        await self.progress.stop()
+        if self.webhook is not None:
+            await self.webhook.close()
+        await self.repository.stop()
         logger.info("Worker coroutines stopped.")
 
     async def _worker_loop(self, worker_index: int):
         logger.info(f"Worker coroutine #{worker_index} started, waiting for tasks...")
         while True:
-            task_uuid, video_path = await self.queue.get()
+            task_uuid, video_path, content_hash = await self.queue.get()
             logger.info(
                 f"[Worker {worker_index}] Processing task {task_uuid}: {video_path}"
             )
+            output_path = None
 
             try:
                 if task_uuid in self.cancelled_tasks:
                     logger.info(
                         f"Skipping cancelled task {task_uuid} before processing."
                     )
-                    await self._mark_task_cancelled(task_uuid)
-                    self.cancelled_tasks.discard(task_uuid)
+                    await self._cancel_job(task_uuid, video_path)
                     continue
 
                 timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -146,14 +331,6 @@ class WMRemoveTaskWorker:
                 output_filename = f"{task_uuid}_{timestamp}{file_suffix}"
                 output_path = self.output_dir / output_filename
 
-                async with get_session() as session:
-                    result = await session.execute(
-                        select(Task).where(Task.id == task_uuid)
-                    )
-                    task = result.scalar_one()
-                    task.status = Status.PROCESSING
-                    task.percentage = 0  # Commence à 0% au lieu de 10%
-
                 loop = asyncio.get_event_loop()
 
                 def progress_callback(
@@ -161,97 +338,79 @@ class WMRemoveTaskWorker:
                     task_id: str = task_uuid,
                     loop_ref: asyncio.AbstractEventLoop = loop,
                 ):
-                    asyncio.run_coroutine_threadsafe(
-                        self._update_progress(task_id, percentage), loop_ref
+                    loop_ref.call_soon_threadsafe(
+                        self._update_progress, task_id, percentage
                     )
 
                 if task_uuid in self.cancelled_tasks:
                     logger.info(
                         f"Cancellation detected before executing task {task_uuid}."
                     )
-                    await self._mark_task_cancelled(task_uuid)
-                    self.cancelled_tasks.discard(task_uuid)
+                    await self._cancel_job(task_uuid, video_path)
                     continue
 
-                await asyncio.to_thread(
-                    self.sora_wm.run,
-                    video_path,
-                    output_path,
-                    progress_callback,
-                    False,  # quiet
-                )
+                if self.pool is not None:
+                    await self.pool.run(
+                        task_uuid, video_path, output_path, progress_callback, content_hash
+                    )
+                else:
+                    await asyncio.to_thread(
+                        self.sora_wm.run,
+                        video_path,
+                        output_path,
+                        progress_callback,
+                        False,  # quiet
+                        content_hash,
+                    )
 
                 if task_uuid in self.cancelled_tasks:
                     logger.info(
                         f"Cancellation detected after processing task {task_uuid}. Cleaning up."
                     )
-                    await self._mark_task_cancelled(task_uuid)
-                    self.cancelled_tasks.discard(task_uuid)
+                    await self._cancel_job(task_uuid, video_path, output_path)
                     continue
 
-                async with get_session() as session:
-                    result = await session.execute(
-                        select(Task).where(Task.id == task_uuid)
-                    )
-                    task = result.scalar_one()
-                    task.status = Status.FINISHED
-                    task.percentage = 100
-                    task.output_path = str(output_path)
-                    task.download_url = f"/download/{task_uuid}"
+                num_tasks = len(self._subscribers.get(task_uuid, [task_uuid]))
+                await self._finish_job(task_uuid, output_path, content_hash)
 
                 logger.info(
-                    f"[Worker {worker_index}] Task {task_uuid} completed successfully, output: {output_path}"
+                    f"[Worker {worker_index}] Task {task_uuid} completed successfully "
+                    f"for {num_tasks} task(s), output: {output_path}"
                 )
 
             except InterruptedError:
                 logger.info(f"Task {task_uuid} was cancelled during processing")
-                await self._mark_task_cancelled(task_uuid)
-                self.cancelled_tasks.discard(task_uuid)
+                await self._cancel_job(task_uuid, video_path, output_path)
 
             except Exception as e:
                 logger.error(f"Error processing task {task_uuid}: {e}")
-                async with get_session() as session:
-                    result = await session.execute(
-                        select(Task).where(Task.id == task_uuid)
-                    )
-                    task = result.scalar_one()
-                    task.status = Status.ERROR
-                    task.percentage = 0
+                await self._fail_job(task_uuid)
 
             finally:
                 self.queue.task_done()
 
-    async def _update_progress(self, task_id: str, percentage: int):
-        try:
-            async with get_session() as session:
-                result = await session.execute(select(Task).where(Task.id == task_id))
-                task = result.scalar_one_or_none()
-                if task:
-                    task.percentage = percentage
-                    await session.flush()  # Force l'écriture immédiate
-                    logger.debug(f"Task {task_id} progress updated to {percentage}%")
-        except Exception as e:
-            logger.error(f"Error updating progress for task {task_id}: {e}")
+    def _update_progress(self, job_id: str, percentage: int):
+        # in memory only, the store writes the percentages back in batches
+        self.progress.set_progress(self._subscribers.get(job_id, [job_id]), percentage)
 
     async def get_task_status(self, task_id: str) -> WMRemoveResults | None:
-        async with get_session() as session:
-            result = await session.execute(select(Task).where(Task.id == task_id))
-            task = result.scalar_one_or_none()
-            if task is None:
-                return None
-            return WMRemoveResults(
-                percentage=task.percentage,
-                status=Status(task.status),
-                download_url=task.download_url,
-            )
+        state = self.progress.get(task_id)
+        if state is not None:
+            return state
+        task = await self.repository.get(task_id)
+        if task is None:
+            return None
+        return WMRemoveResults(
+            percentage=task.percentage,
+            status=Status(task.status),
+            download_url=task.download_url,
+        )
 
     async def get_output_path(self, task_id: str) -> Path | None:
-        async with get_session() as session:
-            result = await session.execute(select(Task).where(Task.id == task_id))
-            task = result.scalar_one_or_none()
-            if task is None or task.output_path is None:
-                return None
-            return Path(task.output_path)
+        task = await self.repository.get(task_id)
+        if task is None or task.output_path is None:
+            return None
+        return Path(task.output_path)
 
 
 def _resolve_concurrency() -> int:
@@ -268,4 +427,40 @@ def _resolve_concurrency() -> int:
         return 4  # Fallback à 4 au lieu de 1
 
 
-worker = WMRemoveTaskWorker(concurrency=_resolve_concurrency())
+def _resolve_mode() -> str:
+    value = os.getenv("SORA_WORKER_MODE", "thread").strip().lower()
+    if value not in ("thread", "process"):
+        logger.warning(
+            "Invalid SORA_WORKER_MODE value '{}'. Falling back to thread.", value
+        )
+        return "thread"
+    return value
+
+
+def _resolve_non_negative(name: str) -> int:
+    value = os.getenv(name, "0")
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning("Invalid {} value '{}'. Falling back to 0.", name, value)
+        return 0
+
+
+def _resolve_webhook() -> CompletionWebhook | None:
+    url = os.getenv("SORA_WEBHOOK_URL", "").strip()
+    if not url:
+        return None
+    return CompletionWebhook(url, os.getenv("SORA_WEBHOOK_SECRET") or None)
+
+
+# SORA_WORKER_MODE=process runs every slot in its own process with its own models,
+# with SORA_WORKER_THREADS torch threads pinned to SORA_WORKER_CORES cores (0: the
+# cores are split evenly between the slots, without pinning).
+worker = WMRemoveTaskWorker(
+    concurrency=_resolve_concurrency(),
+    mode=_resolve_mode(),
+    threads_per_slot=_resolve_non_negative("SORA_WORKER_THREADS"),
+    cores_per_slot=_resolve_non_negative("SORA_WORKER_CORES"),
+    # settled tasks are POSTed to SORA_WEBHOOK_URL, signed with SORA_WEBHOOK_SECRET
+    webhook=_resolve_webhook(),
+)
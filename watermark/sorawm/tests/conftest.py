@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from sorawm.server import db
+
+
+@pytest.fixture
+def run_with_db(tmp_path, monkeypatch):
+    """Runs a coroutine function in a fresh event loop against a scratch database."""
+
+    def run(scenario):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}")
+            event.listen(engine.sync_engine, "connect", db._configure_sqlite)
+            monkeypatch.setattr(db, "engine", engine)
+            monkeypatch.setattr(
+                db,
+                "async_session_maker",
+                async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+            )
+            await db.init_db()
+            try:
+                return await scenario()
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
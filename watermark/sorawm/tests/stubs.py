@@ -0,0 +1,197 @@
+"""Stand-ins for the models and ffmpeg-made clips, for tests without weights.
+
+Clip frames are a flat background with a green box as the watermark. The frame
+index is written in two flat blocks in the top left corner, which survive the
+encoder, so ``frame_index`` tells which source frame a decoded frame is.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Callable
+
+import ffmpeg
+import numpy as np
+
+from sorawm.core import SoraWM
+
+# bgr
+GREEN = (0x12, 0xAB, 0x34)
+BACKGROUND = 40
+_BLOCK = 16
+
+BBox = tuple[int, int, int, int]
+
+
+def make_frame(idx: int, width: int, height: int, bbox: BBox | None) -> np.ndarray:
+    frame = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    frame[:_BLOCK, :_BLOCK] = (idx % 16) * 16 + 8
+    frame[:_BLOCK, _BLOCK : 2 * _BLOCK] = (idx // 16 % 16) * 16 + 8
+    if bbox is not None:
+        x1, y1, x2, y2 = bbox
+        frame[y1:y2, x1:x2] = GREEN
+    return frame
+
+
+def frame_index(frame: np.ndarray) -> int:
+    low = int(frame[4 : _BLOCK - 4, 4 : _BLOCK - 4].mean()) // 16
+    high = int(frame[4 : _BLOCK - 4, _BLOCK + 4 : 2 * _BLOCK - 4].mean()) // 16
+    return high * 16 + low
+
+
+def write_clip(
+    path: Path,
+    num_frames: int,
+    width: int = 160,
+    height: int = 96,
+    fps: int = 24,
+    watermark: Callable[[int], BBox | None] = lambda idx: (100, 60, 140, 80),
+    gop: int = 12,
+    audio: bool = False,
+) -> Path:
+    """H.264 clip with B-frames and a keyframe every ``gop`` frames."""
+    video = ffmpeg.input(
+        "pipe:", format="rawvideo", pix_fmt="bgr24", s=f"{width}x{height}", r=fps
+    )
+    streams = [video]
+    output_options = {
+        "vcodec": "libx264",
+        "pix_fmt": "yuv420p",
+        "crf": 12,
+        "bf": 2,
+        "g": gop,
+        "keyint_min": gop,
+        "sc_threshold": 0,
+    }
+    if audio:
+        streams.append(
+            ffmpeg.input(f"sine=frequency=440:duration={num_frames / fps}", f="lavfi")
+        )
+        output_options.update(acodec="aac", shortest=None)
+    frames = b"".join(
+        make_frame(idx, width, height, watermark(idx)).tobytes()
+        for idx in range(num_frames)
+    )
+    (
+        ffmpeg.output(*streams, str(path), **output_options)
+        .overwrite_output()
+        .global_args("-loglevel", "error")
+        .run(input=frames)
+    )
+    return path
+
+
+def green_pixels(frame: np.ndarray) -> int:
+    return int((np.abs(frame.astype(np.int16) - GREEN) < 40).all(axis=2).sum())
+
+
+class StubDetector:
+    """Finds the green box, like SoraWaterMarkDetector finds the watermark."""
+
+    batch_size = 4
+    imgsz = None
+    backend = "torch"
+    bf16 = False
+    weights_hash = "stub"
+    template_tracker = None
+
+    def __init__(self):
+        self.yolo_frames = 0
+
+    def reset(self):
+        self.yolo_frames = 0
+
+    def detect(self, frame: np.ndarray) -> dict:
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(
+        self, frames, batch_size=None, imgsz=None, tracking=True
+    ) -> list[dict]:
+        self.yolo_frames += len(frames)
+        detections = []
+        for frame in frames:
+            ys, xs = np.nonzero((np.abs(frame.astype(np.int16) - GREEN) < 40).all(axis=2))
+            if len(xs) < 20:
+                detections.append(
+                    {"detected": False, "bbox": None, "confidence": None, "center": None}
+                )
+                continue
+            x1, y1 = int(xs.min()), int(ys.min())
+            x2, y2 = int(xs.max()) + 1, int(ys.max()) + 1
+            detections.append(
+                {
+                    "detected": True,
+                    "bbox": (x1, y1, x2, y2),
+                    "confidence": 0.9,
+                    "center": ((x1 + x2) // 2, (y1 + y2) // 2),
+                }
+            )
+        return detections
+
+
+class StubCleaner:
+    """Paints the bbox with the background instead of inpainting it."""
+
+    batch_size = 4
+    cache = None
+    model = "stub"
+
+    def clean_roi_batch(self, frames, bboxes, margin=0, batch_size=None):
+        for frame, (x1, y1, x2, y2) in zip(frames, bboxes):
+            # a little margin, the encoder bleeds the box edges
+            frame[max(0, y1 - 2) : y2 + 2, max(0, x1 - 2) : x2 + 2] = BACKGROUND
+        return list(frames)
+
+
+class StubSoraWM(SoraWM):
+    """SoraWM with the stand-in models, rebuilt as is in worker processes."""
+
+    def __init__(
+        self,
+        single_decode: bool = True,
+        spool_max_bytes: int = 1024**3,
+        sparse_detection: bool = False,
+        pipeline_queue_size: int = 4,
+        segments: int = 1,
+        reuse_frame_buffers: bool = True,
+        detect_decode_max_side: int = 0,
+        track_cache: bool = False,
+        cpu_threads: int = 0,
+    ):
+        self.detector = StubDetector()
+        self.cleaner = StubCleaner()
+        self.single_decode = single_decode
+        self.spool_max_bytes = spool_max_bytes
+        self.pipeline_queue_size = pipeline_queue_size
+        self.segments = segments
+        self.reuse_frame_buffers = reuse_frame_buffers
+        self.detect_decode_max_side = detect_decode_max_side
+        self.sparse_detector = None
+        self.track_cache = None
+
+
+class SlotStubSoraWM(StubSoraWM):
+    """StubSoraWM for the server model slots, with two inputs that misbehave.
+
+    On ``hang.mp4`` it keeps reporting progress until the task is cancelled, on
+    ``crash.mp4`` its process dies.
+    """
+
+    def run(
+        self,
+        input_video_path: Path,
+        output_video_path: Path,
+        progress_callback: Callable[[int], None] | None = None,
+        quiet: bool = False,
+        content_hash: str | None = None,
+    ):
+        if input_video_path.name == "crash.mp4":
+            os._exit(1)
+        if input_video_path.name == "hang.mp4":
+            for _ in range(200):
+                progress_callback(10)
+                time.sleep(0.05)
+            raise TimeoutError("hang.mp4 was not cancelled")
+        return super().run(
+            input_video_path, output_video_path, progress_callback, quiet, content_hash
+        )
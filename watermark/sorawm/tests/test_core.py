@@ -0,0 +1,83 @@
+import ffmpeg
+import pytest
+
+from sorawm.core import SoraWM
+from sorawm.tests.stubs import StubSoraWM, frame_index, green_pixels, write_clip
+from sorawm.utils.video_utils import VideoLoader
+
+
+@pytest.fixture
+def clip(tmp_path):
+    return write_clip(tmp_path / "clip.mp4", 48)
+
+
+@pytest.fixture
+def encoders(monkeypatch):
+    """The encoder processes the runs open."""
+    processes = []
+    open_encoder = SoraWM.open_encoder
+
+    def recording_open_encoder(self, *args, **kwargs):
+        process = open_encoder(self, *args, **kwargs)
+        processes.append(process)
+        return process
+
+    monkeypatch.setattr(SoraWM, "open_encoder", recording_open_encoder)
+    return processes
+
+
+@pytest.mark.parametrize("single_decode", [True, False])
+def test_run_removes_the_watermark(clip, tmp_path, encoders, single_decode):
+    output = tmp_path / "out.mp4"
+    StubSoraWM(single_decode=single_decode).run(clip, output, quiet=True)
+    frames = list(VideoLoader(output))
+    assert [frame_index(frame) for frame in frames] == list(range(48))
+    assert max(green_pixels(frame) for frame in frames) < 20
+    assert [process.returncode for process in encoders] == [0]
+
+
+def cancel_at(percentage: int):
+    def progress_callback(progress: int):
+        if progress >= percentage:
+            raise InterruptedError("cancelled")
+
+    return progress_callback
+
+
+@pytest.mark.parametrize(
+    "percentage",
+    [
+        # during detection, before the encoder starts
+        10,
+        # while frames are encoded
+        60,
+    ],
+)
+def test_cancelled_run_leaves_no_encoder_or_output(clip, tmp_path, encoders, percentage):
+    output = tmp_path / "out.mp4"
+    with pytest.raises(InterruptedError):
+        StubSoraWM().run(clip, output, cancel_at(percentage), quiet=True)
+    assert not output.exists()
+    assert all(process.returncode is not None for process in encoders)
+    assert len(encoders) == (percentage > 50)
+
+
+@pytest.mark.parametrize("single_decode", [True, False])
+def test_run_muxes_the_source_audio(tmp_path, single_decode):
+    clip = write_clip(tmp_path / "clip.mp4", 48, audio=True)
+    output = tmp_path / "out.mp4"
+    StubSoraWM(single_decode=single_decode).run(clip, output, quiet=True)
+
+    streams = ffmpeg.probe(str(output))["streams"]
+    audio = [stream for stream in streams if stream["codec_type"] == "audio"]
+    assert [stream["codec_name"] for stream in audio] == ["aac"]
+    # copied as is, about as long as the video
+    assert abs(float(audio[0]["duration"]) - 2.0) < 0.1
+    assert VideoLoader(output).frame_count == 48
+
+
+def test_run_without_audio(clip, tmp_path):
+    output = tmp_path / "out.mp4"
+    StubSoraWM().run(clip, output, quiet=True)
+
+    assert VideoLoader(output).audio_codec is None
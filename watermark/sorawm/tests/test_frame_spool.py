@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from sorawm.utils.video_utils import FrameSpool
+
+
+def frames(count: int) -> list[np.ndarray]:
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (6, 10, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def test_record_then_replay(tmp_path):
+    source = frames(5)
+    with FrameSpool(10, 6, spool_dir=tmp_path) as spool:
+        # record passes the frames through unchanged
+        assert all(a is b for a, b in zip(spool.record(source), source))
+        assert len(spool) == 5
+        replayed = list(spool)
+        assert all(np.array_equal(a, b) for a, b in zip(replayed, source))
+        assert np.array_equal(spool[3], source[3])
+        with pytest.raises(RuntimeError):
+            spool.append(source[0])
+    assert not list(tmp_path.iterdir())
+
+
+def test_replayed_frames_are_copy_on_write(tmp_path):
+    source = frames(2)
+    with FrameSpool(10, 6, spool_dir=tmp_path) as spool:
+        for frame in source:
+            spool.append(frame)
+        # frames are cleaned in place, the edits must not reach the file
+        spool[0][:] = 0
+        on_disk = np.fromfile(spool.path, dtype=np.uint8).reshape(2, 6, 10, 3)
+        assert np.array_equal(on_disk[0], source[0])
+        assert not spool[0].any()
+
+
+def test_empty_spool(tmp_path):
+    with FrameSpool(10, 6, spool_dir=tmp_path) as spool:
+        assert list(spool) == []
@@ -0,0 +1,59 @@
+from sorawm.utils.imputation_utils import (
+    StreamingBBoxImputer,
+    impute_bboxes_kernel_cpd,
+    impute_bboxes_linear,
+)
+
+LEFT = (10, 10, 50, 30)
+RIGHT = (200, 150, 240, 170)
+
+
+def with_misses(bboxes, missed):
+    return [None if idx in missed else bbox for idx, bbox in enumerate(bboxes)]
+
+
+def test_misses_take_the_segment_average():
+    bboxes = [(10 + idx % 2, 10, 50 + idx % 2, 30) for idx in range(20)]
+    filled = impute_bboxes_linear(with_misses(bboxes, {0, 7, 19}))
+    assert filled[7] == filled[0] == filled[19] == (10, 10, 50, 30)
+    assert filled[3] == bboxes[3]
+
+
+def test_jump_starts_a_new_segment():
+    bboxes = with_misses([LEFT] * 30 + [RIGHT] * 30, {12, 30, 31, 45})
+    imputer = StreamingBBoxImputer()
+    for bbox in bboxes:
+        imputer.push(bbox)
+    filled = dict(imputer.flush())
+    assert imputer.num_segments == 2
+    # the new segment starts at its first detection, misses before it stay behind
+    assert filled[12] == filled[30] == filled[31] == LEFT
+    assert filled[45] == RIGHT
+
+
+def test_single_outlier_does_not_split():
+    bboxes = with_misses([LEFT] * 20, {5, 15})
+    bboxes[10] = RIGHT
+    imputer = StreamingBBoxImputer(min_size=3)
+    for bbox in bboxes:
+        imputer.push(bbox)
+    filled = dict(imputer.flush())
+    assert imputer.num_segments == 1
+    assert filled[10] == RIGHT
+    assert filled[5] is not None and filled[5] == filled[15]
+
+
+def test_leading_misses_take_the_first_position():
+    bboxes = [None] * 10 + [LEFT] * 10
+    assert impute_bboxes_linear(bboxes) == [LEFT] * 20
+
+
+def test_no_detection_at_all():
+    assert impute_bboxes_linear([None] * 5) == [None] * 5
+    # linear in the number of frames, not quadratic
+    assert impute_bboxes_linear([None] * 100_000) == [None] * 100_000
+
+
+def test_matches_kernel_cpd_on_a_jump():
+    bboxes = with_misses([LEFT] * 50 + [RIGHT] * 50, {10, 25, 60, 99})
+    assert impute_bboxes_linear(bboxes) == impute_bboxes_kernel_cpd(bboxes)
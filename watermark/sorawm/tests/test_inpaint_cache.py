@@ -0,0 +1,74 @@
+import numpy as np
+
+from sorawm.utils.inpaint_cache import InpaintCache
+
+WINDOW = (0, 0, 64, 48)
+BBOX = (16, 12, 48, 36)
+
+
+def make_crop(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+
+def with_motion(crop: np.ndarray) -> np.ndarray:
+    """A few pixels under the watermark change, like slow motion behind it."""
+    moved = crop.copy()
+    moved[20:22, 30:32] = 255 - moved[20:22, 30:32]
+    return moved
+
+
+def test_key_is_exact_by_default():
+    cache = InpaintCache(1024**2)
+    crop = make_crop()
+    assert cache.key(crop, BBOX, WINDOW, "lama") == cache.key(crop.copy(), BBOX, WINDOW, "lama")
+    assert cache.key(crop, BBOX, WINDOW, "lama") != cache.key(
+        with_motion(crop), BBOX, WINDOW, "lama"
+    )
+    assert cache.key(crop, BBOX, WINDOW, "lama") != cache.key(crop, BBOX, WINDOW, "migan")
+    shifted = (17, 12, 49, 36)
+    assert cache.key(crop, BBOX, WINDOW, "lama") != cache.key(crop, shifted, WINDOW, "lama")
+
+
+def test_near_duplicate_key_ignores_small_motion():
+    # why near_duplicate is off by default: small changes share the stale patch
+    cache = InpaintCache(1024**2, near_duplicate=True)
+    crop = np.full((48, 64, 3), 100, dtype=np.uint8)
+    moved = crop.copy()
+    moved[21, 31] = 112
+    assert cache.key(crop, BBOX, WINDOW, "lama") == cache.key(moved, BBOX, WINDOW, "lama")
+    assert InpaintCache(1024**2).key(crop, BBOX, WINDOW, "lama") != InpaintCache(
+        1024**2
+    ).key(moved, BBOX, WINDOW, "lama")
+
+
+def test_get_put_hit_and_miss():
+    cache = InpaintCache(1024**2)
+    key = cache.key(make_crop(), BBOX, WINDOW, "lama")
+    assert cache.get(key) is None
+    patch = np.full((24, 32, 3), 7, dtype=np.uint8)
+    cache.put(key, patch)
+    assert cache.get(key) is patch
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.nbytes == patch.nbytes
+
+
+def test_lru_eviction_by_bytes():
+    patch_bytes = 24 * 32 * 3
+    cache = InpaintCache(2 * patch_bytes)
+    keys = [cache.key(make_crop(seed), BBOX, WINDOW, "lama") for seed in range(3)]
+    for key in keys[:2]:
+        cache.put(key, np.zeros((24, 32, 3), dtype=np.uint8))
+    # touch the oldest, the other one is evicted next
+    cache.get(keys[0])
+    cache.put(keys[2], np.zeros((24, 32, 3), dtype=np.uint8))
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_patch_larger_than_budget_is_not_cached():
+    cache = InpaintCache(100)
+    key = cache.key(make_crop(), BBOX, WINDOW, "lama")
+    cache.put(key, np.zeros((24, 32, 3), dtype=np.uint8))
+    assert len(cache) == 0 and cache.nbytes == 0
@@ -0,0 +1,176 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from sorawm import watermark_cleaner
+from sorawm.utils import onnx_utils
+from sorawm.utils.onnx_utils import OnnxModule, check_parity, create_session
+from sorawm.watermark_cleaner import WaterMarkCleaner
+
+pytest.importorskip("onnxruntime")
+
+
+class _Inpaint(torch.nn.Module):
+    """Takes (image, mask) and returns an image, like the exported lama."""
+
+    def __init__(self, seed: int = 0):
+        super().__init__()
+        torch.manual_seed(seed)
+        self.conv = torch.nn.Conv2d(4, 3, 3, padding=1)
+
+    def forward(self, image, mask):
+        return torch.sigmoid(self.conv(torch.cat([image, mask], dim=1)))
+
+
+def export(model: torch.nn.Module, path):
+    dynamic_axes = {0: "batch", 2: "height", 3: "width"}
+    torch.onnx.export(
+        model.eval(),
+        (torch.rand(1, 3, 32, 32), torch.rand(1, 1, 32, 32)),
+        str(path),
+        input_names=["image", "mask"],
+        output_names=["output"],
+        dynamic_axes={"image": dynamic_axes, "mask": dynamic_axes, "output": dynamic_axes},
+        dynamo=False,
+    )
+    return path
+
+
+def inputs(height: int = 32, width: int = 48, seed: int = 0) -> list[torch.Tensor]:
+    rng = np.random.default_rng(seed)
+    return [
+        torch.from_numpy(rng.random((1, 3, height, width), dtype=np.float32)),
+        torch.from_numpy((rng.random((1, 1, height, width)) > 0.5).astype(np.float32)),
+    ]
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+    """Optimized graphs go to a scratch cache instead of ARTIFACT_CACHE_DIR."""
+    cache_dir = tmp_path / "artifacts"
+    monkeypatch.setattr(
+        onnx_utils,
+        "create_session",
+        lambda model_path, num_threads=None: create_session(
+            model_path, num_threads, cache_dir=cache_dir
+        ),
+    )
+    return cache_dir
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    return export(_Inpaint(), tmp_path / "inpaint.onnx")
+
+
+@pytest.mark.parametrize("io_binding", [True, False])
+def test_onnx_module_matches_torch(model_path, artifacts, io_binding):
+    onnx_model = OnnxModule(model_path, io_binding=io_binding)
+    torch_model = _Inpaint().eval()
+
+    for shape in [(32, 48), (64, 32), (32, 48)]:
+        image, mask = inputs(*shape)
+        with torch.no_grad():
+            expected = torch_model(image, mask)
+        assert torch.allclose(onnx_model(image, mask), expected, atol=1e-5)
+
+
+def test_io_binding_per_input_shape(model_path, artifacts):
+    onnx_model = OnnxModule(model_path, io_binding=True)
+
+    first = onnx_model(*inputs(seed=0)).clone()
+    output = onnx_model(*inputs(seed=1))
+    # the output buffer of a shape is bound once and reused
+    assert len(onnx_model._bindings) == 1
+    assert output.data_ptr() == onnx_model(*inputs(seed=2)).data_ptr()
+    assert not torch.equal(first, output)
+
+    for height in range(40, 40 + 8 * onnx_utils._MAX_BOUND_SHAPES, 8):
+        onnx_model(*inputs(height=height))
+    assert len(onnx_model._bindings) == onnx_utils._MAX_BOUND_SHAPES
+
+
+def test_create_session_saves_the_optimized_graph(model_path, tmp_path):
+    cache_dir = tmp_path / "artifacts"
+    create_session(model_path, cache_dir=cache_dir)
+    saved = list((cache_dir / "onnxruntime").iterdir())
+    assert [path.suffix for path in saved] == [".onnx"]
+
+    # the second session starts from the saved graph and gives the same outputs
+    image, mask = (tensor.numpy() for tensor in inputs())
+    feeds = {"image": image, "mask": mask}
+    first = create_session(model_path, cache_dir=None).run(None, feeds)[0]
+    second = create_session(model_path, cache_dir=cache_dir).run(None, feeds)[0]
+    assert list((cache_dir / "onnxruntime").iterdir()) == saved
+    np.testing.assert_allclose(first, second, atol=1e-6)
+
+
+class _Counting:
+    def __init__(self, model: torch.nn.Module):
+        self.model = model.eval()
+        self.calls = 0
+
+    def __call__(self, image, mask):
+        self.calls += 1
+        with torch.no_grad():
+            return self.model(torch.from_numpy(image), torch.from_numpy(mask)).numpy()
+
+
+def test_check_parity_records_a_passing_export(model_path, artifacts):
+    onnx_model = OnnxModule(model_path)
+    reference = _Counting(_Inpaint())
+
+    def candidate(image, mask):
+        return onnx_model(torch.from_numpy(image), torch.from_numpy(mask)).numpy()
+
+    check_inputs = [tensor.numpy() for tensor in inputs()]
+    assert check_parity(model_path, reference, candidate, check_inputs, 1e-4)
+    # recorded for this export, the second check does not run the models
+    assert check_parity(model_path, reference, candidate, check_inputs, 1e-4)
+    assert reference.calls == 1
+
+    # a new export is checked again
+    export(_Inpaint(seed=1), model_path)
+    check_parity(model_path, reference, candidate, check_inputs, 1e-4)
+    assert reference.calls == 2
+
+
+def test_check_parity_rejects_a_mismatch(model_path, artifacts):
+    onnx_model = OnnxModule(model_path)
+    reference = _Counting(_Inpaint(seed=1))
+
+    def candidate(image, mask):
+        return onnx_model(torch.from_numpy(image), torch.from_numpy(mask)).numpy()
+
+    check_inputs = [tensor.numpy() for tensor in inputs()]
+    assert not check_parity(model_path, reference, candidate, check_inputs, 1e-4)
+    assert not check_parity(model_path, reference, candidate, check_inputs, 1e-4)
+    # nothing recorded, every load checks again
+    assert reference.calls == 2
+
+
+def onnx_cleaner(monkeypatch, onnx_path, torch_model: torch.nn.Module) -> WaterMarkCleaner:
+    cleaner = WaterMarkCleaner.__new__(WaterMarkCleaner)
+    cleaner.model = "lama"
+    cleaner.device = torch.device("cpu")
+    lama = SimpleNamespace(model=torch_model.eval())
+    cleaner.model_manager = SimpleNamespace(model=lama)
+    monkeypatch.setattr(watermark_cleaner, "LAMA_ONNX_PATH", onnx_path)
+    return cleaner
+
+
+def test_cleaner_uses_a_matching_onnx_lama(monkeypatch, model_path, artifacts):
+    cleaner = onnx_cleaner(monkeypatch, model_path, _Inpaint())
+
+    assert cleaner._use_onnx_lama()
+    assert isinstance(cleaner.model_manager.model.model, OnnxModule)
+
+
+def test_cleaner_keeps_torch_on_parity_mismatch(monkeypatch, model_path, artifacts):
+    torch_model = _Inpaint(seed=1)
+    cleaner = onnx_cleaner(monkeypatch, model_path, torch_model)
+
+    assert not cleaner._use_onnx_lama()
+    assert cleaner.model_manager.model.model is torch_model
@@ -0,0 +1,97 @@
+import pytest
+import torch
+
+from sorawm import parallel
+from sorawm.parallel import auto_segment_count, concat_segments, split_video
+from sorawm.tests.stubs import StubSoraWM, frame_index, green_pixels, write_clip
+from sorawm.utils.video_utils import VideoLoader
+
+NUM_FRAMES = 72
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    path = tmp_path_factory.mktemp("clip") / "clip.mp4"
+    return write_clip(path, NUM_FRAMES, gop=12, audio=True)
+
+
+def frame_indices(path) -> list[int]:
+    return [frame_index(frame) for frame in VideoLoader(path)]
+
+
+@pytest.mark.parametrize("segments", [1, 3, 4])
+def test_split_video_at_keyframes(clip, tmp_path, segments):
+    segment_paths = split_video(clip, tmp_path, segments)
+
+    assert len(segment_paths) >= segments
+    starts = []
+    indices = []
+    for path in segment_paths:
+        loader = VideoLoader(path)
+        segment_indices = frame_indices(path)
+        assert loader.frame_count == len(segment_indices)
+        # every segment starts on a keyframe of the source and has no audio
+        assert segment_indices[0] % 12 == 0
+        assert loader.audio_codec is None
+        starts.append(segment_indices[0])
+        indices += segment_indices
+    # no frame lost or repeated at the boundaries
+    assert indices == list(range(NUM_FRAMES))
+    assert starts == sorted(starts)
+
+
+def encode_segment(segment_path, output_path):
+    """Re-encode a segment from its decoded frames, as the workers do."""
+    loader = VideoLoader(segment_path)
+    process = StubSoraWM().open_encoder(loader, output_path, quiet=True)
+    for frame in loader:
+        process.stdin.write(frame.tobytes())
+    process.stdin.close()
+    assert process.wait() == 0
+    return output_path
+
+
+def test_concat_segments_with_source_audio(clip, tmp_path):
+    encoded = [
+        encode_segment(path, tmp_path / f"encoded_{idx}.mp4")
+        for idx, path in enumerate(split_video(clip, tmp_path, 3))
+    ]
+    output = tmp_path / "joined.mp4"
+
+    concat_segments(encoded, clip, output)
+
+    assert frame_indices(output) == list(range(NUM_FRAMES))
+    assert VideoLoader(output).audio_codec == "aac"
+
+
+@pytest.mark.parametrize(
+    "device, cpus, duration, expected",
+    [
+        ("cpu", 16, 600.0, 16 // parallel.PARALLEL_THREADS_PER_WORKER),
+        # short videos are not cut into tiny segments
+        ("cpu", 16, parallel.PARALLEL_MIN_SEGMENT_SECONDS * 1.5, 1),
+        ("cpu", 1, 600.0, 1),
+        # the workers would share the one accelerator
+        ("cuda", 16, 600.0, 1),
+    ],
+)
+def test_auto_segment_count(monkeypatch, device, cpus, duration, expected):
+    monkeypatch.setattr(parallel, "get_device", lambda: torch.device(device))
+    monkeypatch.setattr(parallel.os, "cpu_count", lambda: cpus)
+
+    assert auto_segment_count(duration) == expected
+
+
+def test_run_chunked(clip, tmp_path):
+    output = tmp_path / "out.mp4"
+    progress = []
+
+    # the spawned workers rebuild StubSoraWM from worker_kwargs, two keep it quick
+    StubSoraWM(segments=2).run(clip, output, progress.append, quiet=True)
+
+    frames = list(VideoLoader(output))
+    assert [frame_index(frame) for frame in frames] == list(range(NUM_FRAMES))
+    assert max(green_pixels(frame) for frame in frames) < 20
+    assert VideoLoader(output).audio_codec == "aac"
+    assert progress == sorted(progress)
+    assert progress[-1] == 99
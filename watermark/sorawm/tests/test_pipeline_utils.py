@@ -0,0 +1,67 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from sorawm.utils.pipeline_utils import FrameWriter, prefetch
+
+# counts the bytes it reads until the end of its stdin, like an encoder
+_READER = "import sys; print(len(sys.stdin.buffer.read()))"
+
+
+def start_reader() -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", _READER], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+
+
+def frames(count: int) -> list[np.ndarray]:
+    return [np.full((8, 16, 3), idx, dtype=np.uint8) for idx in range(count)]
+
+
+@pytest.mark.parametrize("maxsize", [0, 4])
+def test_writer_flushes_and_waits(maxsize):
+    process = start_reader()
+    released = []
+    with FrameWriter(
+        process.stdin, maxsize, release=released.append, process=process
+    ) as writer:
+        for frame in frames(10):
+            writer.write(frame)
+    assert process.returncode == 0
+    assert int(process.stdout.read()) == 10 * 8 * 16 * 3
+    assert len(released) == 10
+
+
+@pytest.mark.parametrize("maxsize", [0, 4])
+def test_writer_reaps_encoder_and_keeps_exception(maxsize):
+    process = start_reader()
+    with pytest.raises(InterruptedError, match="cancelled"):
+        with FrameWriter(process.stdin, maxsize, process=process) as writer:
+            for frame in frames(3):
+                writer.write(frame)
+            raise InterruptedError("cancelled")
+    # the encoder was waited for, it saw the end of its input
+    assert process.returncode == 0
+    assert process.stdin.closed
+
+
+def test_writer_exception_survives_dead_encoder():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "pass"], stdin=subprocess.PIPE
+    )
+    process.wait()
+    with pytest.raises(KeyError):
+        with FrameWriter(process.stdin, 4, process=process) as writer:
+            for frame in frames(200):
+                try:
+                    writer.write(frame)
+                except OSError:
+                    # the broken pipe surfaces on a later write
+                    break
+            raise KeyError("original")
+
+
+def test_prefetch_keeps_order():
+    assert list(prefetch(iter(range(100)), 4)) == list(range(100))
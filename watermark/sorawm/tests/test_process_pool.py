@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+
+from sorawm.server.process_pool import ModelProcessPool
+from sorawm.tests.stubs import SlotStubSoraWM, frame_index, write_clip
+from sorawm.utils.video_utils import VideoLoader
+
+
+def test_run_cancel_and_restart(tmp_path):
+    """One pool through all of it, every slot start imports the whole package."""
+    clip = write_clip(tmp_path / "clip.mp4", 24)
+
+    async def scenario():
+        pool = ModelProcessPool(
+            1, threads_per_slot=1, warmup=False, sora_wm_cls=SlotStubSoraWM
+        )
+        await pool.start()
+        try:
+            progress = []
+            await pool.run("done", clip, tmp_path / "done.mp4", progress.append)
+            frames = list(VideoLoader(tmp_path / "done.mp4"))
+            assert [frame_index(frame) for frame in frames] == list(range(24))
+            # the drain thread delivers the progress of the slot
+            await asyncio.sleep(0.2)
+            assert progress and progress == sorted(progress)
+
+            started = threading.Event()
+            hang = asyncio.create_task(
+                pool.run(
+                    "hang",
+                    tmp_path / "hang.mp4",
+                    tmp_path / "hang_out.mp4",
+                    lambda percentage: started.set(),
+                )
+            )
+            assert await asyncio.to_thread(started.wait, 5)
+            pool.cancel(["hang"])
+            with pytest.raises(InterruptedError):
+                await asyncio.wait_for(hang, 5)
+
+            with pytest.raises(RuntimeError, match="died"):
+                await pool.run(
+                    "crash", tmp_path / "crash.mp4", tmp_path / "crash_out.mp4"
+                )
+            # the pool came back with a new slot process
+            await pool.run("after", clip, tmp_path / "after.mp4")
+            assert VideoLoader(tmp_path / "after.mp4").frame_count == 24
+        finally:
+            await pool.stop()
+
+    asyncio.run(scenario())
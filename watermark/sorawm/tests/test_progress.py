@@ -0,0 +1,107 @@
+import asyncio
+
+from sorawm.server.progress import ProgressStore
+from sorawm.server.schemas import Status, WMRemoveResults
+
+
+class _Repository:
+    """Records the progress writes, fails the next ones while ``failing``."""
+
+    def __init__(self):
+        self.writes = []
+        self.failing = False
+
+    async def set_progress(self, percentages: dict[str, int]):
+        if self.failing:
+            raise RuntimeError("database is locked")
+        self.writes.append(dict(percentages))
+
+
+def processing() -> WMRemoveResults:
+    return WMRemoveResults(percentage=0, status=Status.PROCESSING)
+
+
+def test_progress_written_in_one_batch_per_flush():
+    async def scenario():
+        repository = _Repository()
+        store = ProgressStore(repository, flush_interval=60)
+        store.set_status("a", processing())
+        store.set_status("b", processing())
+        for percentage in (10, 20, 30):
+            store.set_progress(["a", "b"], percentage)
+        assert store.get("a").percentage == 30
+        await store.flush()
+        # nothing changed since the last flush
+        await store.flush()
+        return repository.writes
+
+    assert asyncio.run(scenario()) == [{"a": 30, "b": 30}]
+
+
+def test_settled_tasks_leave_the_store():
+    async def scenario():
+        repository = _Repository()
+        store = ProgressStore(repository)
+        store.set_status("a", processing())
+        store.set_progress(["a"], 50)
+        store.set_status("a", WMRemoveResults(percentage=100, status=Status.FINISHED))
+        # late reports of a settled task, or of an unknown one, are dropped
+        store.set_progress(["a", "unknown"], 60)
+        await store.flush()
+        return store.get("a"), repository.writes
+
+    assert asyncio.run(scenario()) == (None, [])
+
+
+def test_failed_flush_is_retried():
+    async def scenario():
+        repository = _Repository()
+        store = ProgressStore(repository)
+        store.set_status("a", processing())
+        store.set_progress(["a"], 40)
+        repository.failing = True
+        await store.flush()
+        repository.failing = False
+        store.set_status("b", processing())
+        store.set_progress(["b"], 10)
+        await store.flush()
+        return repository.writes
+
+    assert asyncio.run(scenario()) == [{"a": 40, "b": 10}]
+
+
+def test_subscribers_get_every_state():
+    async def scenario():
+        store = ProgressStore(_Repository())
+        queue = store.subscribe("a")
+        other = store.subscribe("b")
+        store.set_status("a", processing())
+        store.set_progress(["a"], 25)
+        store.set_status("a", WMRemoveResults(percentage=100, status=Status.FINISHED))
+        store.unsubscribe("a", queue)
+        store.set_status("a", processing())
+        states = [queue.get_nowait() for _ in range(queue.qsize())]
+        return [(state.status, state.percentage) for state in states], other.qsize()
+
+    states, other = asyncio.run(scenario())
+    assert states == [
+        (Status.PROCESSING, 0),
+        (Status.PROCESSING, 25),
+        (Status.FINISHED, 100),
+    ]
+    assert other == 0
+
+
+def test_stop_flushes_the_last_progress():
+    async def scenario():
+        repository = _Repository()
+        store = ProgressStore(repository, flush_interval=0.01)
+        store.start()
+        store.set_status("a", processing())
+        store.set_progress(["a"], 10)
+        await asyncio.sleep(0.05)
+        store.set_progress(["a"], 90)
+        await store.stop()
+        return repository.writes
+
+    assert asyncio.run(scenario()) == [{"a": 10}, {"a": 90}]
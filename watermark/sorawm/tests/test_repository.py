@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from sorawm.server import db
+from sorawm.server.models import Result
+from sorawm.server.repository import TaskRepository
+from sorawm.server.schemas import Status
+
+HASH = "0" * 32
+
+
+@pytest.fixture
+def run(run_with_db):
+    """Runs a scenario against a TaskRepository on a scratch database."""
+
+    def run_scenario(scenario):
+        async def main():
+            repository = TaskRepository()
+            try:
+                return await scenario(repository)
+            finally:
+                await repository.stop()
+
+        return run_with_db(main)
+
+    return run_scenario
+
+
+async def create_processing(repository: TaskRepository, *task_ids: str):
+    for task_id in task_ids:
+        await repository.create(task_id)
+    await repository.update(
+        task_ids, {"status": Status.PROCESSING, "video_path": "upload.mp4"}
+    )
+
+
+async def ref_counts() -> dict[str, int]:
+    async with db.get_session() as session:
+        rows = await session.execute(select(Result.output_path, Result.ref_count))
+        return dict(rows.all())
+
+
+def everything_settled() -> datetime:
+    return datetime.now() + timedelta(seconds=1)
+
+
+def test_finish_counts_one_reference_per_task(run):
+    async def scenario(repository):
+        await create_processing(repository, "a", "b")
+        rows = await repository.finish(["a", "b"], "out.mp4", HASH)
+        assert {row.id: row.download_url for row in rows} == {
+            "a": "/download/a",
+            "b": "/download/b",
+        }
+        assert {(row.status, row.percentage) for row in rows} == {(Status.FINISHED, 100)}
+        await create_processing(repository, "c")
+        await repository.finish(["c"], "out.mp4", HASH)
+        return await ref_counts()
+
+    assert run(scenario) == {"out.mp4": 3}
+
+
+def test_finish_from_result_reuses_existing_output(run):
+    async def scenario(repository):
+        await create_processing(repository, "a", "b", "c")
+        await repository.finish(["a"], "out.mp4", HASH)
+        row = await repository.finish_from_result("b", HASH, lambda path: True)
+        assert row.status == Status.FINISHED and row.output_path == "out.mp4"
+        # an output removed from disk is not handed out
+        assert await repository.finish_from_result("c", HASH, lambda path: False) is None
+        other_hash = "f" * 32
+        assert await repository.finish_from_result("c", other_hash, lambda path: True) is None
+        assert (await repository.get("c")).status == Status.PROCESSING
+        return await ref_counts()
+
+    assert run(scenario) == {"out.mp4": 2}
+
+
+def test_delete_settled_releases_output_with_last_reference(run):
+    async def scenario(repository):
+        await create_processing(repository, "a", "b", "c")
+        await repository.finish(["a", "b"], "shared.mp4", HASH)
+        # finished without a content hash, the output belongs to the task alone
+        await repository.finish(["c"], "own.mp4", None)
+        await repository.update(["b"], {"video_path": "b.mp4"})
+        await create_processing(repository, "d")
+
+        yesterday = datetime.now() - timedelta(days=1)
+        await repository.update(["b", "c"], {"updated_at": yesterday})
+        count, paths = await repository.delete_settled(
+            datetime.now() - timedelta(hours=1), keep_uploads={"c"}
+        )
+        assert count == 2
+        assert sorted(paths) == ["b.mp4", "own.mp4"]
+        assert await ref_counts() == {"shared.mp4": 1}
+
+        count, paths = await repository.delete_settled(everything_settled())
+        assert count == 1
+        assert sorted(paths) == ["shared.mp4", "upload.mp4"]
+        assert await ref_counts() == {}
+        # the unsettled task stays
+        assert (await repository.get("d")).status == Status.PROCESSING
+        return await repository.count_by_status()
+
+    assert run(scenario) == {Status.PROCESSING: 1}
+
+
+def test_settled_tasks_keep_their_state(run):
+    async def scenario(repository):
+        await create_processing(repository, "a", "b")
+        await repository.update(["a"], {"status": Status.CANCELLED})
+        await repository.set_progress({"a": 40, "b": 40})
+        updated = await repository.update(
+            ["a", "b"], {"status": Status.ERROR}, unsettled_only=True
+        )
+        assert [row.id for row in updated] == ["b"]
+        a, b = await repository.get("a"), await repository.get("b")
+        return (a.status, a.percentage), (b.status, b.percentage)
+
+    assert run(scenario) == ((Status.CANCELLED, 0), (Status.ERROR, 40))
+
+
+def test_fail_interrupted(run):
+    async def scenario(repository):
+        await repository.create("uploading")
+        await create_processing(repository, "processing")
+        await create_processing(repository, "finished")
+        await repository.finish(["finished"], "out.mp4", None)
+        failed = await repository.fail_interrupted()
+        return sorted(row.id for row in failed), await repository.count_by_status()
+
+    failed, statuses = run(scenario)
+    assert failed == ["processing", "uploading"]
+    assert statuses == {Status.ERROR: 2, Status.FINISHED: 1}
+
+
+def test_failed_write_does_not_fail_its_batch(run):
+    async def scenario(repository):
+        await repository.create("a")
+        # queued together, committed in one transaction until the duplicate fails it
+        results = await asyncio.gather(
+            repository.create("b"),
+            repository.create("a"),
+            repository.create("c"),
+            return_exceptions=True,
+        )
+        failed = [isinstance(result, Exception) for result in results]
+        assert failed == [False, True, False]
+        return await repository.count_by_status()
+
+    assert run(scenario) == {Status.UPLOADING: 3}
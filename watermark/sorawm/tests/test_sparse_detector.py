@@ -0,0 +1,119 @@
+import numpy as np
+
+from sorawm.watermark_detector import (
+    NO_DETECTION,
+    SoraWaterMarkDetector,
+    SparseWaterMarkDetector,
+    TemplateTracker,
+)
+
+WATERMARK = (255, 255, 255)
+
+
+class _Detector:
+    """Finds the white box of the frames, records the size of every batch."""
+
+    def __init__(self, batch_size: int = 4):
+        self.batch_size = batch_size
+        self.batches = []
+
+    def detect_batch(self, frames, tracking=True):
+        self.batches.append(len(frames))
+        detections = []
+        for frame in frames:
+            ys, xs = np.nonzero((frame == WATERMARK).all(axis=2))
+            if len(xs) == 0:
+                detections.append(dict(NO_DETECTION))
+                continue
+            bbox = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+            detections.append(
+                {"detected": True, "bbox": bbox, "confidence": 0.9, "center": None}
+            )
+        return detections
+
+
+def make_frames(num_frames: int, positions) -> list[np.ndarray]:
+    """Gray frames with a white box at ``positions(idx)``, no box where it is None."""
+    frames = []
+    for idx in range(num_frames):
+        frame = np.full((72, 128, 3), 40, dtype=np.uint8)
+        position = positions(idx)
+        if position is not None:
+            x, y = position
+            frame[y : y + 10, x : x + 20] = WATERMARK
+        frames.append(frame)
+    return frames
+
+
+def test_static_watermark_one_batch_per_chunk():
+    detector = _Detector(batch_size=4)
+    sparse = SparseWaterMarkDetector(detector, interval=10, miss_interval=3)
+    frames = make_frames(100, lambda idx: (50, 30))
+    detections = list(sparse.detect_stream(frames))
+    assert [d["bbox"] for d in detections] == [(50, 30, 70, 40)] * 100
+    # one detector call per segment of 10 frames, 4 segments per batch
+    assert sparse.detector_calls == 10
+    assert detector.batches == [4, 4, 2]
+
+
+def test_moved_watermark_detected_again():
+    detector = _Detector(batch_size=4)
+    sparse = SparseWaterMarkDetector(detector, interval=10, miss_interval=3)
+    frames = make_frames(40, lambda idx: (10, 10) if idx < 15 else (90, 50))
+    detections = list(sparse.detect_stream(frames))
+    assert all(d["bbox"] == (10, 10, 30, 20) for d in detections[:15])
+    assert all(d["bbox"] == (90, 50, 110, 60) for d in detections[15:])
+    # the move at frame 15 costs one extra call, in a round of its own
+    assert sparse.detector_calls == 5
+    assert detector.batches == [4, 1]
+
+
+def test_missed_frames_retry_after_miss_interval():
+    detector = _Detector(batch_size=2)
+    sparse = SparseWaterMarkDetector(detector, interval=10, miss_interval=3)
+    frames = make_frames(20, lambda idx: None if idx < 7 else (50, 30))
+    detections = list(sparse.detect_stream(frames))
+    assert len(detections) == 20
+    # detector on 0, 3, 6 (misses), then 9 finds the box; the second segment on 10
+    assert [idx for idx, d in enumerate(detections) if d["detected"]] == list(range(9, 20))
+    assert sparse.detector_calls == 5
+    assert detector.batches == [2, 1, 1, 1]
+
+
+def hybrid_detector(batch_size: int = 4) -> SoraWaterMarkDetector:
+    """The hybrid strategy with ``_Detector`` in place of YOLO."""
+    detector = SoraWaterMarkDetector.__new__(SoraWaterMarkDetector)
+    yolo = _Detector(batch_size)
+    detector.batch_size = batch_size
+    detector.yolo = yolo
+    detector.yolo_frames = 0
+    detector.template_tracker = TemplateTracker(threshold=0.8, max_interval=60)
+
+    def detect_yolo(frames, batch_size=None, imgsz=None):
+        detector.yolo_frames += len(frames)
+        return yolo.detect_batch(frames)
+
+    detector._detect_yolo = detect_yolo
+    return detector
+
+
+def test_sparse_detection_bypasses_the_template_tracker():
+    detector = hybrid_detector()
+    sparse = SparseWaterMarkDetector(detector, interval=10, miss_interval=3)
+
+    # every segment of 10 frames has the watermark somewhere else
+    def position(idx):
+        return 10 + idx // 10 * 25, 10 + idx // 10 * 10
+
+    frames = make_frames(40, position)
+    for idx, frame in enumerate(frames):
+        # a dark stroke inside the box, a flat template would never be taken
+        x, y = position(idx)
+        frame[y + 3 : y + 7, x + 5 : x + 15] = 0
+    detections = list(sparse.detect_stream(frames))
+    for idx, detection in enumerate(detections):
+        x, y = position(idx)
+        assert detection["bbox"] == (x, y, x + 20, y + 10)
+    # the interleaved segment frames all went to yolo, the tracker never saw them
+    assert detector.yolo_frames == sparse.detector_calls == 4
+    assert detector.template_tracker.template is None
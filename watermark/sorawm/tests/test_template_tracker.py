@@ -0,0 +1,136 @@
+import numpy as np
+
+from sorawm.watermark_detector import NO_DETECTION, SoraWaterMarkDetector, TemplateTracker
+
+# a textured 40x20 watermark, a flat one would correlate with anything
+TEMPLATE = np.random.default_rng(0).integers(60, 255, (20, 40, 3), dtype=np.uint8)
+
+
+def make_frame(position: tuple[int, int] | None, seed: int = 1) -> np.ndarray:
+    """A noisy background with the template pasted at ``position`` (x, y)."""
+    frame = np.random.default_rng(seed).integers(0, 50, (120, 200, 3), dtype=np.uint8)
+    if position is not None:
+        x, y = position
+        frame[y : y + 20, x : x + 40] = TEMPLATE
+    return frame
+
+
+def detection(position: tuple[int, int]) -> dict:
+    x, y = position
+    return {
+        "detected": True,
+        "bbox": (x, y, x + 40, y + 20),
+        "confidence": 0.9,
+        "center": (x + 20, y + 10),
+    }
+
+
+def test_match_without_template_asks_for_yolo():
+    assert TemplateTracker().match(make_frame((30, 40))) is None
+
+
+def test_match_follows_the_watermark():
+    tracker = TemplateTracker(threshold=0.8)
+    tracker.update(make_frame((30, 40)), detection((30, 40)))
+
+    # a few pixels off, inside the search window
+    match = tracker.match(make_frame((35, 37), seed=2))
+
+    assert match["bbox"] == (35, 37, 75, 57)
+    assert match["confidence"] > 0.99
+    assert tracker.last_bbox == (35, 37, 75, 57)
+
+
+def test_match_searches_the_earlier_positions():
+    tracker = TemplateTracker(threshold=0.8)
+    tracker.update(make_frame((10, 10)), detection((10, 10)))
+    tracker.update(make_frame((140, 90)), detection((140, 90)))
+    assert tracker.positions == [(10, 10, 50, 30), (140, 90, 180, 110)]
+
+    # back at the first position, far from the last one
+    match = tracker.match(make_frame((10, 10), seed=2))
+
+    assert match["bbox"] == (10, 10, 50, 30)
+
+
+def test_update_takes_no_flat_or_missed_template():
+    tracker = TemplateTracker()
+    tracker.update(make_frame(None), dict(NO_DETECTION))
+    assert tracker.template is None
+
+    flat = np.full((120, 200, 3), 80, dtype=np.uint8)
+    tracker.update(flat, detection((30, 40)))
+    assert tracker.template is None
+    assert tracker.match(make_frame((30, 40))) is None
+
+
+def test_gone_watermark_falls_back_to_yolo():
+    tracker = TemplateTracker(threshold=0.8)
+    tracker.update(make_frame((30, 40)), detection((30, 40)))
+
+    assert tracker.match(make_frame(None, seed=2)) is None
+
+
+def test_yolo_runs_again_after_max_interval():
+    tracker = TemplateTracker(threshold=0.8, max_interval=3)
+    tracker.update(make_frame((30, 40)), detection((30, 40)))
+
+    matches = [tracker.match(make_frame((30, 40), seed=seed)) for seed in range(2, 9)]
+
+    # every 4th frame goes to yolo, the matching carries on after it
+    assert [match is None for match in matches] == [False] * 3 + [True] + [False] * 3
+
+
+def test_reset_forgets_the_video():
+    tracker = TemplateTracker()
+    tracker.update(make_frame((30, 40)), detection((30, 40)))
+    tracker.reset()
+
+    assert tracker.template is None
+    assert tracker.positions == []
+    assert tracker.match(make_frame((30, 40))) is None
+
+
+class _Yolo:
+    """Stands in for the YOLO pass, the template is brighter than the background."""
+
+    def __init__(self):
+        self.frames = 0
+
+    def __call__(self, frames, batch_size=None, imgsz=None) -> list[dict]:
+        self.frames += len(frames)
+        detections = []
+        for frame in frames:
+            ys, xs = np.nonzero((frame >= 60).all(axis=2))
+            if len(xs) == 0:
+                detections.append(dict(NO_DETECTION))
+                continue
+            detections.append(detection((int(xs.min()), int(ys.min()))))
+        return detections
+
+
+def hybrid_detector() -> SoraWaterMarkDetector:
+    detector = SoraWaterMarkDetector.__new__(SoraWaterMarkDetector)
+    detector.yolo_frames = 0
+    detector.template_tracker = TemplateTracker(threshold=0.8, max_interval=60)
+    detector._detect_yolo = _Yolo()
+    return detector
+
+
+def test_hybrid_detector_runs_yolo_only_on_unmatched_frames():
+    detector = hybrid_detector()
+    positions = [(30, 40)] * 5 + [None] * 2 + [(140, 90)] * 5
+    frames = [make_frame(position, seed) for seed, position in enumerate(positions)]
+
+    detections = []
+    for start in range(0, len(frames), 4):
+        detections += detector.detect_batch(frames[start : start + 4])
+
+    for position, result in zip(positions, detections):
+        if position is None:
+            assert not result["detected"]
+        else:
+            assert result["bbox"] == detection(position)["bbox"]
+    # the first batch has no template yet; in the second the frames without the
+    # watermark and the jump to the new position; the third matches throughout
+    assert detector._detect_yolo.frames == 4 + 3
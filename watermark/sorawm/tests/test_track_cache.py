@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+from sorawm.utils import track_cache
+from sorawm.utils.track_cache import DetectionTrack, TrackCache, hash_file
+
+BBOXES = [(10, 20, 110, 60), None, (12, 20, 112, 60), None, None, (14, 22, 114, 62)]
+
+
+def test_track_round_trip():
+    track = DetectionTrack.from_bboxes(BBOXES)
+    assert len(track) == len(BBOXES)
+    assert track.to_list() == BBOXES
+    assert track.bbox(1) is None
+    doubled = track.scaled(2.0, 2.0, 1000, 1000)
+    assert doubled.bbox(0) == (20, 40, 220, 120)
+    assert doubled.bbox(1) is None
+
+
+def test_cache_put_get(tmp_path):
+    cache = TrackCache(tmp_path / "tracks", 1024**2)
+    assert cache.get("missing") is None
+    cache.put("key", DetectionTrack.from_bboxes(BBOXES), video="clip.mp4")
+    assert cache.get("key").to_list() == BBOXES
+    assert not list((tmp_path / "tracks").glob("*.tmp"))
+
+
+def test_cache_drops_unreadable_track(tmp_path):
+    cache = TrackCache(tmp_path, 1024**2)
+    (tmp_path / "key.npz").write_bytes(b"not an npz")
+    assert cache.get("key") is None
+    assert not (tmp_path / "key.npz").exists()
+
+
+def test_cache_evicts_oldest_past_budget(tmp_path):
+    cache = TrackCache(tmp_path, 1024**2)
+    track = DetectionTrack.from_bboxes(BBOXES * 100)
+    cache.put("old", track)
+    size = (tmp_path / "old.npz").stat().st_size
+    cache.max_bytes = size
+    # backdated, a coarse mtime could otherwise tie the two tracks
+    old = tmp_path / "old.npz"
+    stat = old.stat()
+    os.utime(old, (stat.st_atime - 10, stat.st_mtime - 10))
+    cache.put("new", track)
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+
+
+def test_key_uses_given_content_hash(tmp_path, monkeypatch):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(np.random.default_rng(0).bytes(4096))
+    content_hash = hash_file(video)
+    settings = {"imgsz": None, "source": "spool"}
+    expected = TrackCache.key(video, "weights", settings)
+
+    def no_hashing(path, *args):
+        raise AssertionError("the video should not be hashed again")
+
+    monkeypatch.setattr(track_cache, "hash_file", no_hashing)
+    assert TrackCache.key(video, "weights", settings, content_hash) == expected
+    decoded = {**settings, "source": "decode"}
+    assert TrackCache.key(video, "weights", decoded, content_hash) != expected
+    assert TrackCache.key(video, "other", settings, content_hash) != expected
@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+
+from sorawm.server.upload import UploadError, UploadTooLarge, stream_upload
+from sorawm.utils.track_cache import hash_file
+
+MAX_BYTES = 64 * 1024
+
+
+@pytest.fixture
+def post(tmp_path):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        try:
+            uploaded = await stream_upload(
+                request, tmp_path, max_bytes=MAX_BYTES, chunk_bytes=4096
+            )
+        except UploadError as e:
+            raise HTTPException(413 if isinstance(e, UploadTooLarge) else 400, str(e))
+        return {
+            "path": str(uploaded.path),
+            "filename": uploaded.filename,
+            "size": uploaded.size,
+            "content_hash": uploaded.content_hash,
+        }
+
+    def send_post(content, headers):
+        async def send():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                return await client.post("/upload", content=content, headers=headers)
+
+        return asyncio.run(send())
+
+    return send_post
+
+
+def multipart(payload: bytes, field: str = "video") -> bytes:
+    boundary = "sorawm-test"
+    return (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="../clip.mp4"\r\n'
+        "Content-Type: video/mp4\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+
+
+async def chunked(body: bytes, size: int = 1000):
+    # a generator body is sent without a content-length
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+HEADERS = {"content-type": "multipart/form-data; boundary=sorawm-test"}
+
+
+def test_upload_written_and_hashed(post, tmp_path):
+    payload = os.urandom(MAX_BYTES)
+    response = post(chunked(multipart(payload)), headers=HEADERS)
+    assert response.status_code == 200
+    uploaded = response.json()
+    path = tmp_path / os.path.basename(uploaded["path"])
+    assert path.read_bytes() == payload
+    assert uploaded["filename"] == "clip.mp4"
+    assert uploaded["size"] == MAX_BYTES
+    assert uploaded["content_hash"] == hash_file(path)
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+
+def test_upload_rejected_by_content_length(post, tmp_path):
+    response = post(multipart(os.urandom(2 * MAX_BYTES)), headers=HEADERS)
+    assert response.status_code == 413
+    assert not list(tmp_path.iterdir())
+
+
+def test_streamed_upload_cut_off_past_limit(post, tmp_path):
+    body = multipart(os.urandom(MAX_BYTES + 1))
+    response = post(chunked(body), headers=HEADERS)
+    assert response.status_code == 413
+    # the partial file is removed
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize(
+    "body, headers",
+    [
+        (multipart(b"data", field="other"), HEADERS),
+        (multipart(b"data")[:-20], HEADERS),
+        (b"data", {"content-type": "application/octet-stream"}),
+    ],
+)
+def test_upload_without_the_file(post, tmp_path, body, headers):
+    response = post(body, headers=headers)
+    assert response.status_code == 400
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,125 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from sorawm.tests.stubs import frame_index, write_clip
+from sorawm.utils.video_utils import FrameBufferPool, VideoLoader, audio_output_options
+
+NUM_FRAMES = 60
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    # B-frames, so decode order differs from display order, and a keyframe every 12
+    return write_clip(tmp_path_factory.mktemp("clip") / "clip.mp4", NUM_FRAMES, gop=12)
+
+
+def test_packet_index(clip):
+    pts, keyframes = VideoLoader(clip).packet_index
+
+    assert len(pts) == NUM_FRAMES
+    # display order, whatever the packet order in the file
+    assert (pts[1:] > pts[:-1]).all()
+    assert VideoLoader(clip).keyframe_indices.tolist() == [0, 12, 24, 36, 48]
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (0, 5),
+        # on a keyframe
+        (12, 20),
+        # between keyframes, across the next one
+        (17, 30),
+        # up to the end, past it
+        (50, None),
+        (55, 100),
+    ],
+)
+def test_iter_range(clip, start, end):
+    frames = list(VideoLoader(clip).iter_range(start, end))
+
+    expected = list(range(start, min(end or NUM_FRAMES, NUM_FRAMES)))
+    assert [frame_index(frame) for frame in frames] == expected
+
+
+def test_iter_range_empty(clip):
+    loader = VideoLoader(clip)
+
+    assert list(loader.iter_range(10, 10)) == []
+    assert list(loader.iter_range(NUM_FRAMES, NUM_FRAMES + 5)) == []
+
+
+@pytest.mark.parametrize("idx", [0, 11, 13, 47, NUM_FRAMES - 1])
+def test_get_frame(clip, idx):
+    assert frame_index(VideoLoader(clip).get_frame(idx)) == idx
+
+
+def test_get_frame_out_of_range(clip):
+    with pytest.raises(IndexError):
+        VideoLoader(clip).get_frame(NUM_FRAMES)
+
+
+def test_iter_range_matches_full_decode(clip):
+    loader = VideoLoader(clip)
+    full = list(loader)
+
+    assert [frame_index(frame) for frame in full] == list(range(NUM_FRAMES))
+    for frame, ranged in zip(full[30:40], loader.iter_range(30, 40)):
+        assert (frame == ranged).all()
+
+
+def test_buffer_pool_reuses_released_frames():
+    pool = FrameBufferPool((4, 4, 3))
+    first, second = pool.acquire(), pool.acquire()
+    assert pool.allocated == 2
+
+    pool.release(first)
+    # released twice or not from the pool: ignored
+    pool.release(first)
+    pool.release(np.empty((4, 4, 3), dtype=np.uint8))
+
+    assert pool.acquire() is first
+    pool.acquire()
+    assert pool.allocated == 3
+
+
+def test_reuse_buffers_decodes_into_the_pool(clip):
+    loader = VideoLoader(clip, reuse_buffers=True)
+    indices = []
+    for frame in loader:
+        indices.append(frame_index(frame))
+        loader.release(frame)
+
+    assert indices == list(range(NUM_FRAMES))
+    # each frame was released before the next one was read
+    assert loader.buffer_pool.allocated == 1
+
+
+def test_reuse_buffers_held_frames_stay_valid(clip):
+    loader = VideoLoader(clip, reuse_buffers=True)
+    # frames not released yet are never overwritten by the next ones
+    held = list(loader.iter_range(0, 8))
+
+    assert [frame_index(frame) for frame in held] == list(range(8))
+    # plus the buffer the end of the stream was read into
+    assert loader.buffer_pool.allocated == 9
+    for frame in held:
+        loader.release(frame)
+    assert [frame_index(frame) for frame in loader.iter_range(8, 12)] == [8, 9, 10, 11]
+    assert loader.buffer_pool.allocated == 9
+
+
+@pytest.mark.parametrize(
+    "audio_codec, output, acodec",
+    [
+        ("aac", "out.mp4", "copy"),
+        ("opus", "out.MP4", "copy"),
+        ("pcm_s16le", "out.mp4", "aac"),
+        ("pcm_s16le", "out.mov", "copy"),
+        ("vorbis", "out.mkv", "copy"),
+    ],
+)
+def test_audio_output_options(audio_codec, output, acodec):
+    assert audio_output_options(audio_codec, Path(output)) == {"acodec": acodec}
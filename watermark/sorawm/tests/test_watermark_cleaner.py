@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from sorawm import watermark_cleaner
+from sorawm.iopaint.model import models
+from sorawm.iopaint.schema import InpaintRequest
+from sorawm.utils.inpaint_cache import InpaintCache
+from sorawm.watermark_cleaner import WaterMarkCleaner
+
+
+class _Model:
+    pad_mod = 8
+
+
+class _ModelManager:
+    """Fills the masked area with a constant and records the batch sizes."""
+
+    def __init__(self):
+        self.model = _Model()
+        self.calls = []
+
+    def batch(self, images, masks, config, batch_size=8):
+        assert images, "batch called without crops"
+        self.calls.append(len(images))
+        results = []
+        for image, mask in zip(images, masks):
+            result = image[:, :, ::-1].copy()
+            result[mask > 0] = 7
+            results.append(result)
+        return results
+
+
+def make_cleaner(cache_max_bytes: int = 1024**2) -> WaterMarkCleaner:
+    cleaner = WaterMarkCleaner.__new__(WaterMarkCleaner)
+    cleaner.model = "lama"
+    cleaner.batch_size = 4
+    cleaner.cache = InpaintCache(cache_max_bytes) if cache_max_bytes else None
+    cleaner.model_manager = _ModelManager()
+    cleaner.inpaint_request = InpaintRequest()
+    return cleaner
+
+
+def static_clip(num_frames: int = 4) -> list[np.ndarray]:
+    frame = np.random.default_rng(0).integers(0, 256, (72, 128, 3), dtype=np.uint8)
+    return [frame.copy() for _ in range(num_frames)]
+
+
+BBOX = (40, 20, 80, 40)
+
+
+def test_clean_roi_batch_static_clip_inpaints_once():
+    cleaner = make_cleaner()
+    frames = cleaner.clean_roi_batch(static_clip(), [BBOX] * 4, margin=8)
+
+    assert cleaner.model_manager.calls == [1]
+    for frame in frames:
+        assert (frame[20:40, 40:80] == 7).all()
+
+
+def test_clean_roi_batch_all_cache_hits():
+    cleaner = make_cleaner()
+    cleaner.clean_roi_batch(static_clip(), [BBOX] * 4, margin=8)
+
+    # the whole second batch is served by the cache, the model is not called
+    frames = cleaner.clean_roi_batch(static_clip(), [BBOX] * 4, margin=8)
+
+    assert cleaner.model_manager.calls == [1]
+    assert cleaner.cache.hits == 4 + 3
+    for frame in frames:
+        assert (frame[20:40, 40:80] == 7).all()
+
+
+def test_clean_roi_batch_without_cache():
+    cleaner = make_cleaner(cache_max_bytes=0)
+    frames = cleaner.clean_roi_batch(static_clip(), [BBOX] * 4, margin=8)
+
+    assert cleaner.model_manager.calls == [4]
+    untouched = static_clip(1)[0]
+    for frame in frames:
+        assert (frame[20:40, 40:80] == 7).all()
+        assert (frame[:20] == untouched[:20]).all()
+
+
+@pytest.mark.parametrize("model", ["lama-int8", "migan-int8"])
+def test_int8_model_is_not_downloadable(model):
+    with pytest.raises(FileNotFoundError, match="sorawm.quantize"):
+        models[model].download()
+
+
+@pytest.mark.parametrize(
+    "enabled, expected",
+    [
+        # not built, or below the quality gate
+        (False, "lama"),
+        (True, "lama-int8"),
+    ],
+)
+def test_int8_model_falls_back_to_fp32(monkeypatch, enabled, expected):
+    scanned = ["lama"] + (["lama-int8"] if enabled else [])
+    downloads = []
+    monkeypatch.setattr(watermark_cleaner, "DEFAULT_WATERMARK_REMOVE_MODEL", "lama-int8")
+    monkeypatch.setattr(
+        watermark_cleaner,
+        "scan_models",
+        lambda: [SimpleNamespace(name=name) for name in scanned],
+    )
+    monkeypatch.setattr(watermark_cleaner, "cli_download_model", downloads.append)
+    monkeypatch.setattr(
+        watermark_cleaner,
+        "ModelManager",
+        lambda name, device: SimpleNamespace(name=name),
+    )
+
+    cleaner = WaterMarkCleaner(cache_max_bytes=0, backend="torch", cpu_optimize=False)
+
+    assert cleaner.model == expected
+    assert cleaner.model_manager.name == expected
+    assert downloads == []
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import select
+
+from sorawm.server import db
+from sorawm.server.models import Result
+from sorawm.server.schemas import Status
+from sorawm.server.worker import WMRemoveTaskWorker
+
+HASH = "0" * 32
+
+
+class _SoraWM:
+    """Writes the output once ``gate`` is set, counts the runs."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.runs = 0
+
+    def run(
+        self,
+        input_video_path,
+        output_video_path,
+        progress_callback=None,
+        quiet=True,
+        content_hash=None,
+    ):
+        self.runs += 1
+        self.started.set()
+        self.gate.wait(5)
+        progress_callback(50)
+        Path(output_video_path).write_bytes(Path(input_video_path).read_bytes())
+
+
+def make_worker(tmp_path: Path) -> WMRemoveTaskWorker:
+    worker = WMRemoveTaskWorker(concurrency=1, retention_hours=0)
+    worker.upload_dir = tmp_path / "uploads"
+    worker.output_dir = tmp_path / "outputs"
+    worker.upload_dir.mkdir()
+    worker.output_dir.mkdir()
+    worker.sora_wm = _SoraWM()
+    return worker
+
+
+async def submit(worker: WMRemoveTaskWorker, name: str) -> tuple[str, Path]:
+    task_id = await worker.create_task()
+    upload = worker.upload_dir / f"{name}.mp4"
+    upload.write_bytes(b"same video")
+    await worker.queue_task(task_id, upload, HASH)
+    return task_id, upload
+
+
+async def ref_counts() -> dict[str, int]:
+    async with db.get_session() as session:
+        rows = await session.execute(select(Result.output_path, Result.ref_count))
+        return {Path(path).name: count for path, count in rows.all()}
+
+
+def test_identical_uploads_share_one_job(run_with_db, tmp_path):
+    async def scenario():
+        worker = make_worker(tmp_path)
+        worker.start()
+        try:
+            first, first_upload = await submit(worker, "first")
+            await asyncio.to_thread(worker.sora_wm.started.wait, 5)
+            second, second_upload = await submit(worker, "second")
+            third, _ = await submit(worker, "third")
+            # the duplicate uploads are dropped, the job keeps its own
+            assert not second_upload.exists()
+            assert first_upload.exists()
+            await worker.cancel_tasks([third])
+            worker.sora_wm.gate.set()
+            await worker.queue.join()
+
+            statuses = [
+                (await worker.get_task_status(task_id)).status
+                for task_id in (first, second, third)
+            ]
+            assert statuses == [Status.FINISHED, Status.FINISHED, Status.CANCELLED]
+            output = await worker.get_output_path(first)
+            assert await worker.get_output_path(second) == output
+            assert output.read_bytes() == b"same video"
+            assert await ref_counts() == {output.name: 2}
+
+            # a later upload of the video finishes at once with the same output
+            later, later_upload = await submit(worker, "later")
+            assert (await worker.get_task_status(later)).status == Status.FINISHED
+            assert await worker.get_output_path(later) == output
+            assert not later_upload.exists()
+            assert worker.sora_wm.runs == 1
+            assert await ref_counts() == {output.name: 3}
+            return output
+        finally:
+            await worker.stop()
+
+    assert run_with_db(scenario).exists()
+
+
+def test_output_deleted_with_its_last_task(run_with_db, tmp_path):
+    async def scenario():
+        worker = make_worker(tmp_path)
+        worker.sora_wm.gate.set()
+        worker.start()
+        try:
+            first, _ = await submit(worker, "first")
+            await worker.queue.join()
+            second, _ = await submit(worker, "second")
+            output = await worker.get_output_path(first)
+
+            worker.retention_hours = 1
+            hours_ago = datetime.now() - timedelta(hours=2)
+            await worker.repository.update([first], {"updated_at": hours_ago})
+            assert await worker.expire_tasks() == 1
+            assert output.exists()
+            await worker.repository.update([second], {"updated_at": hours_ago})
+            assert await worker.expire_tasks() == 1
+            assert not output.exists()
+            assert not list(worker.upload_dir.iterdir())
+            return await ref_counts()
+        finally:
+            await worker.stop()
+
+    assert run_with_db(scenario) == {}
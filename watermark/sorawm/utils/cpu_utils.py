@@ -0,0 +1,79 @@
+from contextlib import nullcontext
+
+import torch
+from loguru import logger
+
+from sorawm.utils.devices_utils import cpu_supports_bf16
+
+
+def freeze_module(module):
+    """Freeze a TorchScript module and let oneDNN prepack its conv weights.
+
+    Plain nn.Modules are returned as they are, only scripted graphs can be frozen.
+    The prepacked mkldnn constants do not load back from ``torch.jit.save``, so the
+    freezing runs on every start and ``SoraWM.warmup`` keeps it out of the first job.
+    """
+    if not isinstance(module, torch.jit.ScriptModule):
+        return module
+    try:
+        return torch.jit.optimize_for_inference(torch.jit.freeze(module.eval()))
+    except Exception as e:
+        # graphs with ops the freezing passes do not handle keep running unfrozen
+        logger.warning(f"Could not freeze {type(module).__name__}, running it as is: {e}")
+        return module
+
+
+def cpu_autocast(bf16: bool):
+    if bf16 and cpu_supports_bf16():
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def _to_float32(output):
+    if isinstance(output, torch.Tensor) and output.is_floating_point():
+        return output.float()
+    if isinstance(output, (list, tuple)):
+        return type(output)(_to_float32(item) for item in output)
+    return output
+
+
+class CpuOptimizedModule:
+    """Runs a model in the CPU performance mode, called like the model itself.
+
+    TorchScript models are frozen with their weights prepacked for oneDNN, 4D inputs
+    are passed channels_last and, with ``bf16`` on a CPU with native bf16, the call
+    runs under bf16 autocast. Floating outputs are returned as float32, so the
+    inpainting models around it do not change.
+    """
+
+    def __init__(self, module, channels_last: bool = True, bf16: bool = False):
+        if channels_last and isinstance(module, torch.nn.Module) and not isinstance(
+            module, torch.jit.ScriptModule
+        ):
+            module = module.to(memory_format=torch.channels_last)
+        self.module = freeze_module(module)
+        self.channels_last = channels_last
+        self.bf16 = bf16 and cpu_supports_bf16()
+        if bf16 and not self.bf16:
+            logger.info("This CPU has no native bf16, keeping fp32")
+
+    def _prepare(self, value):
+        if self.channels_last and isinstance(value, torch.Tensor) and value.dim() == 4:
+            return value.contiguous(memory_format=torch.channels_last)
+        return value
+
+    def __call__(self, *args, **kwargs):
+        args = [self._prepare(arg) for arg in args]
+        kwargs = {key: self._prepare(value) for key, value in kwargs.items()}
+        with torch.no_grad(), cpu_autocast(self.bf16):
+            output = self.module(*args, **kwargs)
+        return _to_float32(output)
+
+    def eval(self):
+        return self
+
+    def __getattr__(self, name):
+        if name == "module":
+            raise AttributeError(name)
+        # attributes like MAT's c_dim still come from the wrapped model
+        return getattr(self.module, name)
@@ -1,5 +1,6 @@
-import torch
 from functools import lru_cache
+
+import torch
 from loguru import logger
 
 
@@ -12,3 +13,26 @@ def get_device():
         device = "mps"
     logger.debug(f"Using device: {device}")
     return torch.device(device)
+
+
+@lru_cache()
+def cpu_supports_bf16() -> bool:
+    """Whether the CPU runs bf16 natively (AVX512-BF16 or AMX), emulated bf16 is slower than fp32."""
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return torch.backends.mkldnn.is_available() and any(
+        getattr(torch.cpu, check, lambda: False)() for check in checks
+    )
+
+
+def configure_cpu_threads(num_threads: int):
+    """Pin the intra-op thread pool to ``num_threads``, 0 keeps torch's default."""
+    if num_threads <= 0:
+        return
+    torch.set_num_threads(num_threads)
+    try:
+        # only possible before the first inter-op parallel work of the process
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    logger.debug(f"torch intra-op threads: {num_threads}")
+
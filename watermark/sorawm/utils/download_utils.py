@@ -89,4 +89,13 @@ def download_detector_weights(force_download: bool = False):
             logger.info(f"Hash mismatch detected, updating model...")
             download_detector_weights(force_download=True)
         else:
-            logger.debug("Model is up-to-date") 
\ No newline at end of file
+            logger.debug("Model is up-to-date") 
+
+def detector_weights_hash() -> str:
+    """sha256 of the local detector weights, read from the version file when present."""
+    if WATER_MARK_DETECT_YOLO_WEIGHTS_HASH_JSON.exists():
+        with WATER_MARK_DETECT_YOLO_WEIGHTS_HASH_JSON.open("r") as f:
+            local_sha256_hash = json.load(f).get("sha256", None)
+        if local_sha256_hash:
+            return local_sha256_hash
+    return generate_sha256_hash(WATER_MARK_DETECT_YOLO_WEIGHTS)
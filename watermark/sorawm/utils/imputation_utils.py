@@ -1,3 +1,5 @@
+from collections import deque
+
 import ruptures as rpt
 import numpy as np
 import pandas as pd
@@ -18,35 +20,192 @@ def find_2d_data_bkps(X: List[Tuple[int, int]]) -> List[int]:
 def get_interval_average_bbox(
     bboxes: List[Tuple[int, int, int, int] | None], bkps: List[int]
 ) -> List[Tuple[int, int, int, int]]:
+    valid = np.array([bbox is not None for bbox in bboxes], dtype=bool)
+    values = np.zeros((len(bboxes), 4), dtype=float)
+    if valid.any():
+        values[valid] = [bbox for bbox in bboxes if bbox is not None]
+    # prefix sums turn every interval sum into one subtraction
+    value_sums = np.concatenate([np.zeros((1, 4)), np.cumsum(values, axis=0)])
+    valid_counts = np.concatenate([[0], np.cumsum(valid)])
+    bkps = np.clip(np.asarray(bkps, dtype=int), 0, len(bboxes))
+    left, right = bkps[:-1], bkps[1:]
+    counts = valid_counts[right] - valid_counts[left]
+    sums = value_sums[right] - value_sums[left]
     average_bboxes = []
-    for left, right in zip(bkps[:-1], bkps[1:]):
-        bboxes_interval = bboxes[left:right]
-        valid_bboxes = [bbox for bbox in bboxes_interval if bbox is not None]
-        if len(valid_bboxes) > 0:
-            average_bbox = np.mean(valid_bboxes, axis=0)
-            average_bboxes.append(tuple(map(int, average_bbox)))
+    for interval_sum, count in zip(sums, counts):
+        if count > 0:
+            average_bboxes.append(tuple(map(int, interval_sum / count)))
         else:
             average_bboxes.append(None)
     return average_bboxes
 
 
 def find_idxs_interval(idxs: List[int], bkps: List[int]) -> List[int]:
-    def _find_idx_interval(_idx: int) -> int:
-        left = 0
-        right = len(bkps) - 2 
-
-        while left <= right:
-            mid = (left + right) // 2
-            if bkps[mid] <= _idx < bkps[mid + 1]:
-                return mid
-            elif _idx < bkps[mid]:
-                right = mid - 1
-            else:
-                left = mid + 1
-        return min(max(left, 0), len(bkps) - 2)
-
-    intervals = []
-    for idx in idxs:
-        interval_idx = _find_idx_interval(idx)
-        intervals.append(interval_idx)
-    return intervals
+    intervals = np.searchsorted(np.asarray(bkps), np.asarray(idxs), side="right") - 1
+    return np.clip(intervals, 0, len(bkps) - 2).tolist()
+
+
+def impute_bboxes_kernel_cpd(
+    bboxes: List[Tuple[int, int, int, int] | None],
+) -> List[Tuple[int, int, int, int] | None]:
+    """Fill missed frames with the average bbox of their KernelCPD interval.
+
+    Quadratic in the number of frames, kept as the reference for impute_bboxes_linear.
+    """
+    total_frames = len(bboxes)
+    filled = list(bboxes)
+    detect_missed = [idx for idx, bbox in enumerate(bboxes) if bbox is None]
+    if not detect_missed or len(detect_missed) == total_frames:
+        return filled
+    bbox_centers = [
+        None if bbox is None else (int((bbox[0] + bbox[2]) / 2), int((bbox[1] + bbox[3]) / 2))
+        for bbox in bboxes
+    ]
+    # 1. find the bkps of the bbox centers
+    bkps = find_2d_data_bkps(bbox_centers)
+    # add the start and end position, to form the complete interval boundaries
+    bkps_full = [0] + bkps + [total_frames]
+    # 2. calculate the average bbox of each interval
+    interval_bboxes = get_interval_average_bbox(bboxes, bkps_full)
+    # 3. find the interval index of each missed frame
+    missed_intervals = find_idxs_interval(detect_missed, bkps_full)
+    # 4. fill the missed frames with the average bbox of the corresponding interval
+    for missed_idx, interval_idx in zip(detect_missed, missed_intervals):
+        if interval_idx < len(interval_bboxes) and interval_bboxes[interval_idx] is not None:
+            filled[missed_idx] = interval_bboxes[interval_idx]
+        else:
+            # if the interval has no valid bbox, use the previous and next frame to complete (fallback strategy)
+            before = max(missed_idx - 1, 0)
+            after = min(missed_idx + 1, total_frames - 1)
+            filled[missed_idx] = filled[before] or filled[after]
+    return filled
+
+
+class _Segment:
+    """Running sums of the detected bboxes of one stationary watermark position."""
+
+    def __init__(self):
+        self.bbox_sum = [0.0, 0.0, 0.0, 0.0]
+        self.count = 0
+
+    def add(self, bbox: Tuple[int, int, int, int]):
+        for i, v in enumerate(bbox):
+            self.bbox_sum[i] += v
+        self.count += 1
+
+    def mean_bbox(self) -> Tuple[int, int, int, int] | None:
+        if self.count == 0:
+            return None
+        return tuple(int(v / self.count) for v in self.bbox_sum)
+
+
+class StreamingBBoxImputer:
+    """Linear-time imputation of missed detections, fed one frame at a time.
+
+    The watermark sits still and then jumps, so the center series is cut where a
+    detection lands more than ``jump`` bbox sizes away from the mean of the current
+    segment and ``min_size`` detections in a row agree on the new position. Missed
+    frames get the average bbox of their whole segment once ``flush`` is called.
+    """
+
+    def __init__(self, jump: float = 0.5, min_size: int = 3):
+        self.jump = jump
+        self.min_size = min_size
+        self.num_segments = 0
+        self._segment = self._new_segment()
+        # frames not emitted yet: [idx, bbox, segment]
+        self._pending: deque = deque()
+        # the detected bboxes among them, for segments without any detection
+        self._pending_detected: deque = deque()
+        # detections far from the current segment that may start a new one
+        self._candidate: list = []
+        self._idx = 0
+        self._last_emitted = None
+
+    def _new_segment(self) -> _Segment:
+        self.num_segments += 1
+        return _Segment()
+
+    def _is_far(self, bbox, reference) -> bool:
+        size = max(reference[2] - reference[0], reference[3] - reference[1], 1)
+        # compare doubled centers, saves the divisions
+        dx = abs(bbox[0] + bbox[2] - reference[0] - reference[2])
+        dy = abs(bbox[1] + bbox[3] - reference[1] - reference[3])
+        return max(dx, dy) > 2 * self.jump * size
+
+    def push(self, bbox: Tuple[int, int, int, int] | None):
+        """Add the detection of the next frame."""
+        entry = [self._idx, bbox, self._segment]
+        self._idx += 1
+        self._pending.append(entry)
+        if bbox is not None:
+            self._pending_detected.append(bbox)
+            self._assign(entry)
+
+    def flush(self) -> List[Tuple[int, Tuple | None]]:
+        """Finish the stream and return every remaining frame."""
+        self._fold_candidate()
+        emitted = []
+        while self._pending:
+            emitted.append(self._emit())
+        return emitted
+
+    def _assign(self, entry):
+        bbox = entry[1]
+        reference = self._segment.mean_bbox()
+        if reference is None or not self._is_far(bbox, reference):
+            self._fold_candidate()
+            self._segment.add(bbox)
+            return
+        if self._candidate and self._is_far(bbox, self._candidate[0][1]):
+            # not the position the candidate is heading for, start over from here
+            self._fold_candidate()
+        self._candidate.append(entry)
+        if len(self._candidate) >= self.min_size:
+            self._start_segment()
+
+    def _fold_candidate(self):
+        # outliers that never confirmed a new position stay in the current segment
+        for entry in self._candidate:
+            self._segment.add(entry[1])
+        self._candidate = []
+
+    def _start_segment(self):
+        start = self._candidate[0][0]
+        self._segment = self._new_segment()
+        # the new segment starts at the newest frames, stop at the first older one
+        for entry in reversed(self._pending):
+            if entry[0] < start:
+                break
+            entry[2] = self._segment
+        for entry in self._candidate:
+            self._segment.add(entry[1])
+        self._candidate = []
+
+    def _emit(self) -> Tuple[int, Tuple | None]:
+        idx, bbox, segment = self._pending.popleft()
+        if bbox is not None:
+            self._pending_detected.popleft()
+        else:
+            bbox = segment.mean_bbox()
+        if bbox is None:
+            # no detection in the whole segment, borrow from the neighbouring frames
+            bbox = self._last_emitted or (
+                self._pending_detected[0] if self._pending_detected else None
+            )
+        self._last_emitted = bbox
+        return idx, bbox
+
+
+def impute_bboxes_linear(
+    bboxes: List[Tuple[int, int, int, int] | None],
+    jump: float = 0.5,
+    min_size: int = 3,
+) -> List[Tuple[int, int, int, int] | None]:
+    imputer = StreamingBBoxImputer(jump, min_size)
+    filled = [None] * len(bboxes)
+    for bbox in bboxes:
+        imputer.push(bbox)
+    for idx, imputed in imputer.flush():
+        filled[idx] = imputed
+    return filled
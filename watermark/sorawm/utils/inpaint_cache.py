@@ -0,0 +1,84 @@
+import hashlib
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from sorawm.utils.roi_utils import BBox
+
+
+class InpaintCache:
+    """LRU cache of inpainted watermark patches, bounded by ``max_bytes``.
+
+    Entries are keyed by a hash of the ROI crop, the bbox position inside the crop
+    and the model name. With ``near_duplicate`` the crop is hashed through a small
+    quantized thumbnail instead of the raw pixels, so duplicated frames that only
+    differ by encoder noise share the same patch.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        near_duplicate: bool = False,
+        thumbnail_size: int = 16,
+        quant_step: int = 8,
+    ):
+        self.max_bytes = max_bytes
+        self.near_duplicate = near_duplicate
+        self.thumbnail_size = thumbnail_size
+        self.quant_step = quant_step
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, crop: np.ndarray, bbox: BBox, window: BBox, model: str) -> bytes:
+        left, top, right, bottom = window
+        x1, y1, x2, y2 = bbox
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(model.encode())
+        digest.update(
+            np.array(
+                [right - left, bottom - top, x1 - left, y1 - top, x2 - left, y2 - top],
+                dtype=np.int32,
+            ).tobytes()
+        )
+        if self.near_duplicate:
+            crop = cv2.resize(
+                crop,
+                (self.thumbnail_size, self.thumbnail_size),
+                interpolation=cv2.INTER_AREA,
+            )
+            crop = crop // self.quant_step
+        digest.update(np.ascontiguousarray(crop).data)
+        return digest.digest()
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        patch = self._entries.get(key)
+        if patch is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return patch
+
+    def put(self, key: bytes, patch: np.ndarray):
+        if patch.nbytes > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = patch
+        self.nbytes += patch.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+        self.reset_stats()
@@ -0,0 +1,230 @@
+"""ONNX Runtime execution of exported models, see sorawm/onnx_export.py for the export.
+
+onnxruntime is an optional dependency, it is only imported once an ONNX model is
+loaded, like the ONNX path of the AnyText recognizer.
+"""
+
+import hashlib
+import json
+import os
+import platform
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Sequence
+
+import numpy as np
+import torch
+from loguru import logger
+
+from sorawm.configs import ARTIFACT_CACHE_DIR
+
+# input shapes whose io bindings a session keeps around
+_MAX_BOUND_SHAPES = 8
+
+
+def import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError(
+            "The onnx inference backend needs onnxruntime, install it with "
+            "`pip install onnxruntime`"
+        ) from e
+    return onnxruntime
+
+
+def _optimized_model_path(model_path: Path, cache_dir: Path, version: str) -> Path:
+    # graphs optimized at ORT_ENABLE_ALL are specific to the runtime and the machine
+    stat = model_path.stat()
+    key = [model_path.resolve(), stat.st_size, stat.st_mtime_ns, version, platform.machine()]
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+    return cache_dir / "onnxruntime" / f"{model_path.stem}-{digest}.onnx"
+
+
+def create_session(
+    model_path: Path,
+    num_threads: int | None = None,
+    cache_dir: Path | None = ARTIFACT_CACHE_DIR,
+):
+    """CPU inference session, with as many threads as torch uses in this process.
+
+    With ``cache_dir`` the optimized graph is saved on the first load and later
+    sessions start from it instead of optimizing the model again.
+    """
+    ort = import_onnxruntime()
+    model_path = Path(model_path)
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # the segment and batch workers size their thread pools through torch
+    options.intra_op_num_threads = num_threads or torch.get_num_threads()
+    options.inter_op_num_threads = 1
+
+    optimized_path = tmp_path = None
+    if cache_dir is not None:
+        optimized_path = _optimized_model_path(model_path, cache_dir, ort.__version__)
+        if optimized_path.exists():
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            model_path = optimized_path
+        else:
+            optimized_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = optimized_path.with_suffix(f".{os.getpid()}.tmp")
+            options.optimized_model_filepath = str(tmp_path)
+    session = ort.InferenceSession(
+        str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+    )
+    if tmp_path is not None and tmp_path.exists():
+        os.replace(tmp_path, optimized_path)
+        logger.debug(f"Saved the optimized graph of {model_path.name} to {optimized_path}")
+    return session
+
+
+class OnnxModule:
+    """An ONNX Runtime session called like the torch module it was exported from.
+
+    Takes and returns CPU torch tensors, so it can stand in for the TorchScript
+    model inside an inpainting model. With ``io_binding`` the output buffer is
+    allocated once per input shape and the binding reused, so the fixed ROI shapes
+    of a video do not allocate on every call. The returned tensor then shares that
+    buffer and is only valid until the next call with the same shapes.
+    """
+
+    def __init__(self, model_path: Path, io_binding: bool = True):
+        self.model_path = Path(model_path)
+        self.session = create_session(model_path)
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.output_name = self.session.get_outputs()[0].name
+        self.io_binding = io_binding
+        # input shapes -> (binding, output array)
+        self._bindings: OrderedDict[tuple, tuple] = OrderedDict()
+
+    def eval(self):
+        return self
+
+    def __call__(self, *inputs: torch.Tensor) -> torch.Tensor:
+        arrays = [
+            np.ascontiguousarray(tensor.detach().cpu().numpy(), dtype=np.float32)
+            for tensor in inputs
+        ]
+        if not self.io_binding:
+            feeds = dict(zip(self.input_names, arrays))
+            return torch.from_numpy(self.session.run([self.output_name], feeds)[0])
+
+        shapes = tuple(array.shape for array in arrays)
+        bound = self._bindings.get(shapes)
+        if bound is None:
+            bound = self._bind(shapes, arrays)
+        else:
+            self._bindings.move_to_end(shapes)
+        binding, output = bound
+        for name, array in zip(self.input_names, arrays):
+            binding.bind_cpu_input(name, array)
+        self.session.run_with_iobinding(binding)
+        return torch.from_numpy(output)
+
+    def _bind(self, shapes: tuple, arrays: list[np.ndarray]) -> tuple:
+        # one plain run gives the output shape for these input shapes
+        feeds = dict(zip(self.input_names, arrays))
+        output = np.empty_like(self.session.run([self.output_name], feeds)[0])
+        binding = self.session.io_binding()
+        binding.bind_output(
+            self.output_name,
+            "cpu",
+            0,
+            output.dtype,
+            list(output.shape),
+            output.ctypes.data,
+        )
+        self._bindings[shapes] = (binding, output)
+        while len(self._bindings) > _MAX_BOUND_SHAPES:
+            self._bindings.popitem(last=False)
+        return binding, output
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024**2):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_parity(
+    model_path: Path,
+    reference: Callable[..., np.ndarray],
+    candidate: Callable[..., np.ndarray],
+    inputs: Sequence[np.ndarray],
+    tolerance: float,
+) -> bool:
+    """Compare ``candidate`` (ONNX) against ``reference`` (torch) outputs on ``inputs``.
+
+    The error is the max abs difference relative to the largest reference value.
+    A passing export is recorded next to ``model_path``, keyed by its hash, so the
+    check only runs on the first use of an export.
+    """
+    record_path = model_path.with_suffix(model_path.suffix + ".parity.json")
+    model_hash = file_sha256(model_path)
+    if record_path.exists():
+        try:
+            record = json.loads(record_path.read_text())
+        except ValueError:
+            record = {}
+        if record.get("sha256") == model_hash and record.get("tolerance") == tolerance:
+            return True
+
+    expected = np.asarray(reference(*inputs), dtype=np.float32)
+    actual = np.asarray(candidate(*inputs), dtype=np.float32)
+    if expected.shape != actual.shape:
+        logger.error(
+            f"{model_path.name}: onnx output shape {actual.shape} != torch {expected.shape}"
+        )
+        return False
+    error = float(np.abs(expected - actual).max() / max(1.0, float(np.abs(expected).max())))
+    if error > tolerance:
+        logger.error(f"{model_path.name}: onnx output differs from torch by {error:.2e}")
+        return False
+    logger.info(f"{model_path.name}: onnx matches torch, relative error {error:.2e}")
+    tmp_path = record_path.with_suffix(".tmp")
+    tmp_path.write_text(
+        json.dumps({"sha256": model_hash, "tolerance": tolerance, "error": error})
+    )
+    os.replace(tmp_path, record_path)
+    return True
+
+
+def gate_record_path(model_path: Path) -> Path:
+    return model_path.with_suffix(model_path.suffix + ".gate.json")
+
+
+def write_gate_record(model_path: Path, record: dict):
+    record_path = gate_record_path(model_path)
+    tmp_path = record_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps({"sha256": file_sha256(model_path), **record}))
+    os.replace(tmp_path, record_path)
+
+
+@lru_cache(maxsize=16)
+def _read_gate_record(model_path: Path, stamp: tuple) -> dict | None:
+    try:
+        record = json.loads(gate_record_path(model_path).read_text())
+    except (OSError, ValueError):
+        return None
+    if record.get("sha256") != file_sha256(model_path):
+        return None
+    return record
+
+
+def read_gate_record(model_path: Path) -> dict | None:
+    """Accuracy gate result of a quantized model, None if it was not gated as it is now.
+
+    Cached on the size and mtime of both files, model scans ask for it on every call.
+    """
+    model_path = Path(model_path)
+    record_path = gate_record_path(model_path)
+    if not model_path.exists() or not record_path.exists():
+        return None
+    stamp = tuple(
+        (stat.st_mtime_ns, stat.st_size)
+        for stat in (model_path.stat(), record_path.stat())
+    )
+    return _read_gate_record(model_path, stamp)
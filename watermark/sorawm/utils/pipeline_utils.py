@@ -0,0 +1,200 @@
+import queue
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterable, Iterator, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+_DONE = object()
+# how often a blocked put/get wakes up to check whether the other side has stopped
+_POLL_SECONDS = 0.1
+
+
+class StageTimer:
+    """Busy time per pipeline stage, the slowest stage bounds the wall time."""
+
+    def __init__(self):
+        self.busy = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.busy[stage] += elapsed
+
+    def summary(self, wall: float) -> str:
+        stages = ", ".join(f"{stage} {busy:.2f}s" for stage, busy in self.busy.items())
+        return f"wall {wall:.2f}s, busy: {stages}"
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def prefetch(
+    iterable: Iterable[T],
+    maxsize: int,
+    timer: StageTimer | None = None,
+    stage: str = "decode",
+) -> Iterator[T]:
+    """Iterate ``iterable`` in a background thread, at most ``maxsize`` items ahead.
+
+    Errors raised by the producer are re-raised in the consumer. ``maxsize`` <= 0
+    iterates in the calling thread.
+    """
+    timer = timer or StageTimer()
+    if maxsize <= 0:
+        iterator = iter(iterable)
+        while True:
+            with timer.measure(stage):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    items = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            iterator = iter(iterable)
+            while True:
+                with timer.measure(stage):
+                    item = next(iterator, _DONE)
+                if not put(item) or item is _DONE:
+                    return
+        except BaseException as exc:
+            put(_Failure(exc))
+
+    thread = threading.Thread(target=produce, name=f"sorawm-{stage}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        # the consumer may stop early, unblock the producer so the thread exits
+        stopped.set()
+        thread.join()
+
+
+class FrameWriter:
+    """Writes frames to ``stream`` from a background thread through a bounded queue.
+
+    ``write`` blocks once ``maxsize`` frames are pending, so a slow encoder
+    applies backpressure instead of buffering the whole video. ``release`` is
+    called with every frame once it has been written. ``process``, the encoder
+    reading ``stream``, is waited for once the stream is closed.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        maxsize: int,
+        timer: StageTimer | None = None,
+        stage: str = "encode",
+        release: Callable[[np.ndarray], None] | None = None,
+        process: subprocess.Popen | None = None,
+    ):
+        self.stream = stream
+        self.release = release
+        self.process = process
+        self.timer = timer or StageTimer()
+        self.stage = stage
+        self._error: BaseException | None = None
+        self._aborted = False
+        self._thread = None
+        if maxsize > 0:
+            self._frames = queue.Queue(maxsize)
+            self._thread = threading.Thread(
+                target=self._consume, name=f"sorawm-{stage}", daemon=True
+            )
+            self._thread.start()
+
+    def _consume(self):
+        while True:
+            frame = self._frames.get()
+            if frame is _DONE:
+                return
+            if self._error is not None or self._aborted:
+                # keep draining so the producer never blocks on a dead writer
+                continue
+            try:
+                self._write(frame)
+            except BaseException as exc:
+                self._error = exc
+
+    def _write(self, frame: np.ndarray):
+        with self.timer.measure(self.stage):
+            self.stream.write(frame.data)
+        if self.release:
+            self.release(frame)
+
+    def write(self, frame: np.ndarray):
+        if self._error is not None:
+            raise self._error
+        if self._thread is None:
+            self._write(frame)
+            return
+        self._frames.put(frame)
+
+    def close(self):
+        """Flush the pending frames, close ``stream`` and wait for ``process``."""
+        try:
+            if self._thread is not None:
+                self._frames.put(_DONE)
+                self._thread.join()
+            self.stream.close()
+        finally:
+            if self.process is not None:
+                self.process.wait()
+        if self._error is not None:
+            raise self._error
+
+    def abort(self):
+        """Drop the pending frames, close ``stream`` and reap ``process``, never raises."""
+        self._aborted = True
+        if self._thread is not None:
+            self._frames.put(_DONE)
+            self._thread.join()
+        try:
+            self.stream.close()
+        except OSError:
+            # the encoder is gone already, e.g. a broken pipe on the last flush
+            pass
+        if self.process is not None:
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # an exception in the with block goes on, not one of the writer over it
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
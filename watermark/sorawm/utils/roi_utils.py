@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+
+BBox = tuple[int, int, int, int]
+
+
+def clip_bbox(bbox: BBox, width: int, height: int) -> BBox:
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    x1 = min(max(x1, 0), width)
+    x2 = min(max(x2, x1), width)
+    y1 = min(max(y1, 0), height)
+    y2 = min(max(y2, y1), height)
+    return x1, y1, x2, y2
+
+
+def scale_bbox(bbox: BBox, scale_x: float, scale_y: float, width: int, height: int) -> BBox:
+    """Map a bbox found on a resized frame back to a ``width`` x ``height`` frame.
+
+    The box is rounded outwards, so it never loses a partially covered pixel.
+    """
+    x1, y1, x2, y2 = bbox
+    return clip_bbox(
+        (
+            math.floor(x1 * scale_x),
+            math.floor(y1 * scale_y),
+            math.ceil(x2 * scale_x),
+            math.ceil(y2 * scale_y),
+        ),
+        width,
+        height,
+    )
+
+
+def _ceil_to(value: int, align: int) -> int:
+    return -(-value // align) * align
+
+
+def expand_bbox(
+    bbox: BBox, margin: int, width: int, height: int, align: int = 1
+) -> BBox:
+    """Grow ``bbox`` by ``margin`` pixels on every side.
+
+    Near the frame border the window is shifted back inside the frame instead of
+    being cut, so it keeps the same size and gets more context from the other side.
+    With ``align`` > 1 the window size is rounded up to a multiple of it, so bboxes
+    that jitter by a few pixels still get windows of the same shape.
+    """
+    x1, y1, x2, y2 = clip_bbox(bbox, width, height)
+    window_w = min(_ceil_to(x2 - x1 + 2 * margin, align), width)
+    window_h = min(_ceil_to(y2 - y1 + 2 * margin, align), height)
+    left = min(max(x1 - margin, 0), width - window_w)
+    top = min(max(y1 - margin, 0), height - window_h)
+    return left, top, left + window_w, top + window_h
+
+
+def bbox_mask(bbox: BBox, window: BBox) -> np.ndarray:
+    """uint8 mask of the ``window`` area with 255 inside ``bbox``."""
+    left, top, right, bottom = window
+    x1, y1, x2, y2 = bbox
+    mask = np.zeros((bottom - top, right - left), dtype=np.uint8)
+    mask[y1 - top : y2 - top, x1 - left : x2 - left] = 255
+    return mask
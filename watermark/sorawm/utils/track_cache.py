@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+from loguru import logger
+
+from sorawm.utils.roi_utils import BBox, scale_bbox
+
+# bytes read per step while hashing a video
+_HASH_CHUNK_BYTES = 1024**2
+_INT16_MAX = np.iinfo(np.int16).max
+
+
+def hash_file(path: Path, chunk_bytes: int = _HASH_CHUNK_BYTES) -> str:
+    """blake2b of the file content, read in chunks so large videos never sit in memory."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_bytes):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionTrack:
+    """Per-frame detections as typed arrays.
+
+    ``bboxes`` is int16 (n, 4) x1, y1, x2, y2, ``confidences`` float16 and
+    ``detected`` a bool flag, the bbox and confidence of a missed frame are 0.
+    ``append`` grows the arrays geometrically, so a track can be filled frame by
+    frame without knowing the frame count up front.
+    """
+
+    def __init__(
+        self,
+        bboxes: np.ndarray | None = None,
+        confidences: np.ndarray | None = None,
+        detected: np.ndarray | None = None,
+    ):
+        self.bboxes = (
+            np.zeros((0, 4), dtype=np.int16)
+            if bboxes is None
+            else np.asarray(bboxes, dtype=np.int16).reshape(-1, 4)
+        )
+        size = len(self.bboxes)
+        self.confidences = (
+            np.zeros(size, dtype=np.float16)
+            if confidences is None
+            else np.asarray(confidences, dtype=np.float16)
+        )
+        self.detected = (
+            np.zeros(size, dtype=bool) if detected is None else np.asarray(detected, dtype=bool)
+        )
+        if not len(self.confidences) == len(self.detected) == size:
+            raise ValueError("bboxes, confidences and detected must have the same length")
+        self._size = size
+
+    @classmethod
+    def from_bboxes(cls, bboxes: Iterable[BBox | None]) -> "DetectionTrack":
+        track = cls()
+        for bbox in bboxes:
+            track.append(bbox)
+        track.shrink()
+        return track
+
+    @classmethod
+    def concat(cls, tracks: Iterable["DetectionTrack"]) -> "DetectionTrack":
+        tracks = list(tracks)
+        if not tracks:
+            return cls()
+        return cls(
+            np.concatenate([track.bboxes[: len(track)] for track in tracks]),
+            np.concatenate([track.confidences[: len(track)] for track in tracks]),
+            np.concatenate([track.detected[: len(track)] for track in tracks]),
+        )
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.bboxes.nbytes + self.confidences.nbytes + self.detected.nbytes
+
+    def append(self, bbox: BBox | None, confidence: float | None = None):
+        if self._size == len(self.bboxes):
+            self._grow(max(64, 2 * self._size))
+        idx = self._size
+        if bbox is not None:
+            self.bboxes[idx] = np.clip(bbox, 0, _INT16_MAX)
+            self.confidences[idx] = 1.0 if confidence is None else confidence
+            self.detected[idx] = True
+        else:
+            self.bboxes[idx] = 0
+            self.confidences[idx] = 0
+            self.detected[idx] = False
+        self._size += 1
+
+    def _grow(self, capacity: int):
+        self.bboxes = np.resize(self.bboxes, (capacity, 4))
+        self.confidences = np.resize(self.confidences, capacity)
+        self.detected = np.resize(self.detected, capacity)
+
+    def shrink(self):
+        """Drop the spare capacity left by ``append``."""
+        if len(self.bboxes) != self._size:
+            self._grow(self._size)
+
+    def bbox(self, idx: int) -> BBox | None:
+        if not self.detected[idx]:
+            return None
+        return tuple(int(v) for v in self.bboxes[idx])
+
+    def to_list(self) -> list[BBox | None]:
+        """One bbox or None per frame, the form the imputation works on."""
+        size = self._size
+        bboxes = self.bboxes[:size].tolist()
+        return [
+            tuple(bbox) if detected else None
+            for bbox, detected in zip(bboxes, self.detected[:size].tolist())
+        ]
+
+    def scaled(
+        self, scale_x: float, scale_y: float, width: int, height: int
+    ) -> "DetectionTrack":
+        """The track mapped back from a resized frame to ``width`` x ``height``."""
+        size = self._size
+        bboxes = self.bboxes[:size].copy()
+        for idx in np.flatnonzero(self.detected[:size]):
+            bboxes[idx] = scale_bbox(bboxes[idx].tolist(), scale_x, scale_y, width, height)
+        return DetectionTrack(
+            bboxes, self.confidences[:size].copy(), self.detected[:size].copy()
+        )
+
+    def save(self, path: Path, **metadata):
+        size = self._size
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                bboxes=self.bboxes[:size],
+                confidences=self.confidences[:size],
+                detected=self.detected[:size],
+                metadata=np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "DetectionTrack":
+        with np.load(path) as data:
+            return cls(data["bboxes"], data["confidences"], data["detected"])
+
+
+class TrackCache:
+    """Detection tracks on disk, one npz file per video and detector configuration.
+
+    The key combines a hash of the video content, the hash of the detector weights
+    and the detection settings, so a renamed or re-uploaded copy of a video hits
+    while new weights or settings miss. The oldest tracks are removed once the
+    directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(
+        video_path: Path, weights_hash: str, settings: dict, content_hash: str | None = None
+    ) -> str:
+        """``content_hash`` is the hash_file of the video, computed when not given."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update((content_hash or hash_file(video_path)).encode())
+        digest.update(weights_hash.encode())
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key: str) -> DetectionTrack | None:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            track = DetectionTrack.load(path)
+        except Exception as e:
+            logger.warning(f"Dropping unreadable detection track {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        # recently used tracks are the last to be evicted
+        os.utime(path)
+        return track
+
+    def put(self, key: str, track: DetectionTrack, **metadata):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            track.save(Path(tmp), **metadata)
+            # readers only ever see complete files
+            os.replace(tmp, self._path(key))
+        finally:
+            Path(tmp).unlink(missing_ok=True)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self.cache_dir.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # removed by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            path.unlink(missing_ok=True)
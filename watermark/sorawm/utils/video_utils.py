@@ -1,13 +1,80 @@
+import os
+import tempfile
+import threading
+from functools import cached_property
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import ffmpeg
 import numpy as np
 
+from sorawm.configs import SPOOL_DIR
+
+
+# Audio codecs each container takes as-is, anything else is re-encoded to AAC.
+# None means the container accepts every codec.
+AUDIO_COPY_CODECS = {
+    ".mp4": {"aac", "mp3", "alac", "ac3", "eac3", "opus", "flac"},
+    ".m4v": {"aac", "mp3", "alac", "ac3", "eac3"},
+    ".mov": {"aac", "mp3", "alac", "ac3", "eac3", "pcm_s16le", "pcm_s24le"},
+    ".mkv": None,
+}
+
+
+def audio_output_options(audio_codec: str, output_path: Path) -> dict:
+    """Stream-copy ``audio_codec`` when the output container supports it."""
+    suffix = output_path.suffix.lower()
+    copy_codecs = AUDIO_COPY_CODECS.get(suffix, set())
+    if suffix in AUDIO_COPY_CODECS and (copy_codecs is None or audio_codec in copy_codecs):
+        return {"acodec": "copy"}
+    return {"acodec": "aac"}
+
+
+class FrameBufferPool:
+    """Reusable writable frame buffers.
+
+    ``acquire`` hands out a free buffer and only allocates when all of them are in
+    use, so the pool grows to the number of frames in flight and then stops
+    allocating. A frame stays valid until it is passed to ``release``. Frames that
+    did not come from the pool are ignored by ``release``.
+    """
+
+    def __init__(self, shape: tuple[int, ...], preallocate: int = 0):
+        self.shape = shape
+        self.allocated = 0
+        self._free: list[np.ndarray] = []
+        self._lent: set[int] = set()
+        self._lock = threading.Lock()
+        for _ in range(preallocate):
+            self._free.append(self._allocate())
+
+    def _allocate(self) -> np.ndarray:
+        self.allocated += 1
+        return np.empty(self.shape, dtype=np.uint8)
+
+    def acquire(self) -> np.ndarray:
+        with self._lock:
+            frame = self._free.pop() if self._free else self._allocate()
+            self._lent.add(id(frame))
+        return frame
+
+    def release(self, frame: np.ndarray):
+        with self._lock:
+            if id(frame) not in self._lent:
+                return
+            self._lent.discard(id(frame))
+            self._free.append(frame)
+
 
 class VideoLoader:
-    def __init__(self, video_path: Path):
+    def __init__(self, video_path: Path, reuse_buffers: bool = False):
+        """With ``reuse_buffers`` frames are decoded into a FrameBufferPool and
+        consumers must ``release`` each frame once they are done with it."""
         self.video_path = video_path
         self.get_video_info()
+        self.buffer_pool = (
+            FrameBufferPool((self.height, self.width, 3)) if reuse_buffers else None
+        )
 
     def get_video_info(self):
         probe = ffmpeg.probe(self.video_path)
@@ -28,26 +95,127 @@ class VideoLoader:
         original_bitrate = video_info.get("bit_rate", None)
         self.original_bitrate = original_bitrate
 
+        audio_info = next(
+            (s for s in probe["streams"] if s["codec_type"] == "audio"), None
+        )
+        self.audio_codec = audio_info["codec_name"] if audio_info else None
+        # ffmpeg input seeking is relative to the container start time
+        self.start_time = float(probe["format"].get("start_time", 0.0))
+
+    @cached_property
+    def packet_index(self) -> tuple[np.ndarray, np.ndarray]:
+        """(pts in seconds, keyframe flag) of every video frame, in display order.
+
+        Built once from the packet list with ffprobe, which only demuxes the file.
+        """
+        probe = ffmpeg.probe(
+            self.video_path,
+            select_streams="v:0",
+            show_entries="packet=pts_time,dts_time,flags",
+        )
+        pts, keyframes = [], []
+        for packet in probe.get("packets", []):
+            flags = packet.get("flags", "")
+            # packets flagged D are decoded but never shown (e.g. edit list pre-roll)
+            if "D" in flags:
+                continue
+            timestamp = packet.get("pts_time", packet.get("dts_time"))
+            if timestamp is None:
+                continue
+            pts.append(float(timestamp))
+            keyframes.append("K" in flags)
+        pts = np.asarray(pts, dtype=np.float64)
+        order = np.argsort(pts, kind="stable")
+        return pts[order], np.asarray(keyframes, dtype=bool)[order]
+
+    @property
+    def frame_count(self) -> int:
+        """Exact number of frames, counted from the packet index."""
+        return len(self.packet_index[0])
+
+    @property
+    def keyframe_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.packet_index[1])
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.width * self.height * 3
+
+    def release(self, frame: np.ndarray):
+        """Hand a frame back to the buffer pool, a no-op without ``reuse_buffers``."""
+        if self.buffer_pool is not None:
+            self.buffer_pool.release(frame)
+
     def __len__(self):
         return self.total_frames
 
     def __iter__(self):
+        return self._read_frames(ffmpeg.input(self.video_path))
+
+    def iter_range(self, start: int, end: int | None = None) -> Iterator[np.ndarray]:
+        """Frames ``start`` to ``end`` (exclusive) without decoding the ones before.
+
+        ffmpeg seeks to the keyframe before ``start`` and decodes forward from
+        there, dropping the frames before it instead of piping them.
+        """
+        pts, _ = self.packet_index
+        end = len(pts) if end is None else min(end, len(pts))
+        if not 0 <= start < end:
+            return iter(())
+        # half a frame early, so rounding of the timestamps never skips frame ``start``
+        seek = max(pts[start] - self.start_time - 0.5 / self.fps, 0.0)
+        # passthrough: one output frame per decoded frame, as counted by the index,
+        # constant frame rate output would duplicate the first frame after the seek
+        return self._read_frames(
+            ffmpeg.input(self.video_path, ss=f"{seek:.6f}"),
+            vframes=end - start,
+            vsync="passthrough",
+        )
+
+    def iter_scaled(self, width: int, height: int) -> Iterator[np.ndarray]:
+        """All frames downscaled to ``width`` x ``height`` by ffmpeg while decoding.
+
+        Only the scaled frames go through the pipe, and they do not come from the
+        buffer pool.
+        """
+        stream = ffmpeg.input(self.video_path).filter(
+            "scale", width, height, flags="area"
+        )
+        return self._read_frames(stream, size=(width, height))
+
+    def get_frame(self, idx: int) -> np.ndarray:
+        if not 0 <= idx < self.frame_count:
+            raise IndexError(f"frame {idx} out of range for {self.frame_count} frames")
+        return next(self.iter_range(idx, idx + 1))
+
+    def _read_frames(
+        self, stream, size: tuple[int, int] | None = None, **output_kwargs
+    ) -> Iterator[np.ndarray]:
+        width, height = size or (self.width, self.height)
+        frame_bytes = width * height * 3
+        buffer_pool = self.buffer_pool if size is None else None
         process_in = (
-            ffmpeg.input(self.video_path)
-            .output("pipe:", format="rawvideo", pix_fmt="bgr24")
+            stream.output("pipe:", format="rawvideo", pix_fmt="bgr24", **output_kwargs)
             .global_args("-loglevel", "error")
             .run_async(pipe_stdout=True)
         )
 
         try:
             while True:
-                in_bytes = process_in.stdout.read(self.width * self.height * 3)
-                if not in_bytes:
+                if buffer_pool is not None:
+                    frame = buffer_pool.acquire()
+                    if process_in.stdout.readinto(frame.data.cast("B")) < frame_bytes:
+                        buffer_pool.release(frame)
+                        break
+                    yield frame
+                    continue
+
+                # read into a bytearray so the frame is writable and can be cleaned in place
+                in_bytes = bytearray(frame_bytes)
+                if process_in.stdout.readinto(in_bytes) < frame_bytes:
                     break
 
-                frame = np.frombuffer(in_bytes, np.uint8).reshape(
-                    [self.height, self.width, 3]
-                )
+                frame = np.frombuffer(in_bytes, np.uint8).reshape([height, width, 3])
                 yield frame
         finally:
             # 确保进程被清理
@@ -57,6 +225,70 @@ class VideoLoader:
             process_in.wait()
 
 
+class FrameSpool:
+    """Raw bgr24 frames spilled to a memory-mapped file.
+
+    Frames are appended while the video is decoded once, and read back from
+    the page cache afterwards instead of running ffmpeg a second time.
+    """
+
+    def __init__(self, width: int, height: int, spool_dir: Path = SPOOL_DIR):
+        self.width = width
+        self.height = height
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".spool", dir=spool_dir)
+        self.path = Path(path)
+        self._writer = os.fdopen(fd, "wb")
+        self._frames: np.ndarray | None = None
+        self.total_frames = 0
+
+    def append(self, frame: np.ndarray):
+        if self._frames is not None:
+            raise RuntimeError("Cannot append to a spool that is already being read.")
+        self._writer.write(np.ascontiguousarray(frame).data)
+        self.total_frames += 1
+
+    def record(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """Pass ``frames`` through unchanged while appending each one to the spool."""
+        for frame in frames:
+            self.append(frame)
+            yield frame
+
+    def _open_frames(self) -> np.ndarray:
+        if self._frames is None:
+            self._writer.close()
+            shape = (self.total_frames, self.height, self.width, 3)
+            if self.total_frames == 0:
+                self._frames = np.empty(shape, dtype=np.uint8)
+            else:
+                # copy-on-write: frames are writable, but edits never reach the file
+                self._frames = np.memmap(self.path, dtype=np.uint8, mode="c", shape=shape)
+        return self._frames
+
+    def __len__(self):
+        return self.total_frames
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        return self._open_frames()[idx]
+
+    def __iter__(self):
+        frames = self._open_frames()
+        for idx in range(self.total_frames):
+            yield frames[idx]
+
+    def close(self):
+        self._frames = None
+        if not self._writer.closed:
+            self._writer.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
 if __name__ == "__main__":
     from tqdm import tqdm
 
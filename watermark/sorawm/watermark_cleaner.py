@@ -1,26 +1,65 @@
+from collections import defaultdict
 from pathlib import Path
+from typing import Sequence
 
 import cv2
 import numpy as np
 import torch
 from loguru import logger
 
-from sorawm.configs import DEFAULT_WATERMARK_REMOVE_MODEL
+from sorawm.configs import (
+    CLEAN_BATCH_SIZE,
+    CLEAN_ROI_MARGIN,
+    CPU_BF16,
+    CPU_OPTIMIZE,
+    DEFAULT_WATERMARK_REMOVE_MODEL,
+    INPAINT_CACHE_MAX_BYTES,
+    INPAINT_CACHE_NEAR_DUPLICATE,
+    INFERENCE_BACKEND,
+    LAMA_ONNX_PATH,
+    ONNX_IO_BINDING,
+    ONNX_PARITY_TOLERANCE,
+)
 from sorawm.iopaint.const import DEFAULT_MODEL_DIR
 from sorawm.iopaint.download import cli_download_model, scan_models
 from sorawm.iopaint.model_manager import ModelManager
 from sorawm.iopaint.schema import InpaintRequest
+from sorawm.utils.cpu_utils import CpuOptimizedModule
 from sorawm.utils.devices_utils import get_device
+from sorawm.utils.inpaint_cache import InpaintCache
+from sorawm.utils.roi_utils import bbox_mask, clip_bbox, expand_bbox
 
 # This codebase is from https://github.com/Sanster/IOPaint#, thanks for their amazing work!
 
 
 class WaterMarkCleaner:
-    def __init__(self):
+    def __init__(
+        self,
+        batch_size: int = CLEAN_BATCH_SIZE,
+        cache_max_bytes: int = INPAINT_CACHE_MAX_BYTES,
+        backend: str = INFERENCE_BACKEND,
+        cpu_optimize: bool = CPU_OPTIMIZE,
+    ):
         self.model = DEFAULT_WATERMARK_REMOVE_MODEL
+        self.batch_size = max(1, batch_size)
+        self.cache = (
+            InpaintCache(cache_max_bytes, near_duplicate=INPAINT_CACHE_NEAR_DUPLICATE)
+            if cache_max_bytes > 0
+            else None
+        )
         self.device = get_device()
 
         scanned_models = scan_models()
+        if self.model.endswith("-int8") and self.model not in [
+            it.name for it in scanned_models
+        ]:
+            # not built or below the quality gate, there is nothing to download
+            fp32_model = self.model.removesuffix("-int8")
+            logger.warning(
+                f"{self.model} is not enabled, using {fp32_model}; build it with "
+                f"`python -m sorawm.quantize --model {fp32_model}`"
+            )
+            self.model = fp32_model
         if self.model not in [it.name for it in scanned_models]:
             logger.info(
                 f"{self.model} not found in {DEFAULT_MODEL_DIR}, try to downloading"
@@ -28,6 +67,67 @@ class WaterMarkCleaner:
             cli_download_model(self.model)
         self.model_manager = ModelManager(name=self.model, device=self.device)
         self.inpaint_request = InpaintRequest()
+        self.backend = "torch"
+        if backend == "onnx" and self._use_onnx_lama():
+            self.backend = "onnx"
+        elif cpu_optimize and self.device.type == "cpu":
+            self._optimize_for_cpu()
+
+    def _optimize_for_cpu(self):
+        inpaint_model = self.model_manager.model
+        # the int8 variants already run through ONNX Runtime
+        if not inpaint_model.is_erase_model or not isinstance(
+            inpaint_model.model, torch.nn.Module
+        ):
+            logger.warning(f"No CPU performance mode for {self.model}")
+            return
+        inpaint_model.model = CpuOptimizedModule(inpaint_model.model, bf16=CPU_BF16)
+        logger.debug(
+            f"{self.model} in CPU performance mode, bf16: {inpaint_model.model.bf16}"
+        )
+
+    def _use_onnx_lama(self) -> bool:
+        """Swap the TorchScript lama for its ONNX export once it matches torch."""
+        if self.model != "lama":
+            logger.warning(f"No onnx export for {self.model}, using torch")
+            return False
+        if not LAMA_ONNX_PATH.exists():
+            logger.warning(
+                f"{LAMA_ONNX_PATH} not found, export it with "
+                "`python -m sorawm.onnx_export --model lama`, using torch"
+            )
+            return False
+        from sorawm.utils.onnx_utils import OnnxModule, check_parity
+
+        lama = self.model_manager.model
+        onnx_model = OnnxModule(LAMA_ONNX_PATH, io_binding=ONNX_IO_BINDING)
+
+        def torch_output(image, mask):
+            with torch.no_grad():
+                return (
+                    lama.model(
+                        torch.from_numpy(image).to(self.device),
+                        torch.from_numpy(mask).to(self.device),
+                    )
+                    .cpu()
+                    .numpy()
+                )
+
+        def onnx_output(image, mask):
+            return onnx_model(torch.from_numpy(image), torch.from_numpy(mask)).numpy()
+
+        rng = np.random.default_rng(0)
+        image = rng.random((1, 3, 256, 256), dtype=np.float32)
+        mask = np.zeros((1, 1, 256, 256), dtype=np.float32)
+        mask[:, :, 96:160, 64:192] = 1
+        if not check_parity(
+            LAMA_ONNX_PATH, torch_output, onnx_output, [image, mask], ONNX_PARITY_TOLERANCE
+        ):
+            logger.error("The onnx lama does not match torch, using torch")
+            return False
+        lama.model = onnx_model
+        logger.debug(f"Using the onnx lama {LAMA_ONNX_PATH}")
+        return True
 
     def clean(self, input_image: np.array, watermark_mask: np.array) -> np.array:
         inpaint_result = self.model_manager(
@@ -35,3 +135,82 @@ class WaterMarkCleaner:
         )
         inpaint_result = cv2.cvtColor(inpaint_result, cv2.COLOR_BGR2RGB)
         return inpaint_result
+
+    def clean_roi(
+        self,
+        frame: np.ndarray,
+        bbox: tuple[int, int, int, int],
+        margin: int = CLEAN_ROI_MARGIN,
+    ) -> np.ndarray:
+        """Inpaint ``bbox`` using only a context window of ``margin`` pixels around it.
+
+        The cleaned pixels are pasted back into ``frame`` in place, so it must be
+        writable. Work and allocations scale with the watermark, not the frame.
+        """
+        return self.clean_roi_batch([frame], [bbox], margin)[0]
+
+    def clean_roi_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        bboxes: Sequence[tuple[int, int, int, int]],
+        margin: int = CLEAN_ROI_MARGIN,
+        batch_size: int | None = None,
+    ) -> list[np.ndarray]:
+        """Batched clean_roi, windows of the same size go through the model together.
+
+        Window sizes are rounded up to the model padding, so small bbox jitter
+        between frames does not split the batch. Crops found in the inpaint cache,
+        or repeated within the call, are only inpainted once.
+        """
+        # window shape -> cache key -> frames sharing that crop
+        groups = defaultdict(lambda: defaultdict(list))
+        for idx, (frame, bbox) in enumerate(zip(frames, bboxes)):
+            height, width = frame.shape[:2]
+            bbox = clip_bbox(bbox, width, height)
+            x1, y1, x2, y2 = bbox
+            if x2 <= x1 or y2 <= y1:
+                continue
+            window = expand_bbox(
+                bbox, margin, width, height, align=self.model_manager.model.pad_mod
+            )
+            left, top, right, bottom = window
+            shape = (bottom - top, right - left)
+            key = idx
+            if self.cache is not None:
+                key = self.cache.key(
+                    frame[top:bottom, left:right], bbox, window, self.model
+                )
+                # get(): indexing the defaultdict would leave an empty group behind
+                # when the crop then hits the cache
+                if key in groups.get(shape, {}):
+                    # same crop earlier in this call, reuse its result
+                    self.cache.hits += 1
+                else:
+                    patch = self.cache.get(key)
+                    if patch is not None:
+                        frame[y1:y2, x1:x2] = patch
+                        continue
+            groups[shape][key].append((idx, bbox, window))
+
+        for duplicates in groups.values():
+            keys = list(duplicates)
+            # every frame under a key has the same crop, inpaint the first one
+            items = [duplicates[key][0] for key in keys]
+            crops = [
+                frames[idx][top:bottom, left:right]
+                for idx, _, (left, top, right, bottom) in items
+            ]
+            masks = [bbox_mask(bbox, window) for _, bbox, window in items]
+            inpaint_results = self.model_manager.batch(
+                crops, masks, self.inpaint_request, batch_size=batch_size or self.batch_size
+            )
+            for key, (_, bbox, window), inpaint_result in zip(keys, items, inpaint_results):
+                x1, y1, x2, y2 = bbox
+                left, top, _, _ = window
+                # the model swaps the channel order, see clean()
+                patch = inpaint_result[y1 - top : y2 - top, x1 - left : x2 - left, ::-1]
+                for idx, (dx1, dy1, dx2, dy2), _ in duplicates[key]:
+                    frames[idx][dy1:dy2, dx1:dx2] = patch
+                if self.cache is not None:
+                    self.cache.put(key, patch.copy())
+        return list(frames)
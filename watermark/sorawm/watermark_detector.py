@@ -1,56 +1,416 @@
+from itertools import batched
 from pathlib import Path
+from typing import Iterable, Iterator, Sequence
 
+import cv2
 import numpy as np
+import torch
 from loguru import logger
 from ultralytics import YOLO
 
-from sorawm.configs import WATER_MARK_DETECT_YOLO_WEIGHTS
-from sorawm.utils.devices_utils import get_device
-from sorawm.utils.download_utils import download_detector_weights
+from sorawm.configs import (
+    CPU_BF16,
+    CPU_OPTIMIZE,
+    DETECT_BATCH_SIZE,
+    DETECT_IMGSZ,
+    DETECT_STRATEGY,
+    DETECT_TEMPLATE_MAX_INTERVAL,
+    DETECT_TEMPLATE_SEARCH_MARGIN,
+    DETECT_TEMPLATE_THRESHOLD,
+    DETECTOR_ONNX_PATH,
+    INFERENCE_BACKEND,
+    ONNX_PARITY_TOLERANCE,
+    SPARSE_DETECT_INTERVAL,
+    SPARSE_DETECT_MISS_INTERVAL,
+    SPARSE_ROI_DIFF_THRESHOLD,
+    WATER_MARK_DETECT_YOLO_WEIGHTS,
+)
+from sorawm.utils.cpu_utils import cpu_autocast
+from sorawm.utils.devices_utils import cpu_supports_bf16, get_device
+from sorawm.utils.download_utils import detector_weights_hash, download_detector_weights
+from sorawm.utils.roi_utils import BBox, clip_bbox
 from sorawm.utils.video_utils import VideoLoader
 
 # based on the sora tempalte to detect the whole, and then got the icon part area.
 
 
+NO_DETECTION = {"detected": False, "bbox": None, "confidence": None, "center": None}
+DETECT_STRATEGIES = ("yolo", "hybrid")
+
+
+def _detection(bbox: BBox, confidence: float) -> dict:
+    x1, y1, x2, y2 = bbox
+    return {
+        "detected": True,
+        "bbox": bbox,
+        "confidence": confidence,
+        "center": ((x1 + x2) // 2, (y1 + y2) // 2),
+    }
+
+
+class TemplateTracker:
+    """Find the watermark by normalized template correlation instead of running YOLO.
+
+    The template is the grayscale crop of the last YOLO detection, so it has the
+    scale and extent of the bbox YOLO reports. ``match`` searches a small window
+    around the last known bbox, then around the other positions the watermark was
+    detected at in this video, and gives up when no window correlates above
+    ``threshold`` or after ``max_interval`` matches in a row.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DETECT_TEMPLATE_THRESHOLD,
+        search_margin: float = DETECT_TEMPLATE_SEARCH_MARGIN,
+        max_interval: int = DETECT_TEMPLATE_MAX_INTERVAL,
+        max_positions: int = 8,
+    ):
+        self.threshold = threshold
+        self.search_margin = search_margin
+        self.max_interval = max(1, max_interval)
+        self.max_positions = max_positions
+        self.reset()
+
+    def reset(self):
+        self.template: np.ndarray | None = None
+        self.last_bbox: BBox | None = None
+        self.positions: list[BBox] = []
+        self.since_update = 0
+
+    def update(self, frame: np.ndarray, detection: dict):
+        """Take the result of a YOLO call on ``frame`` as the new reference."""
+        self.since_update = 0
+        if not detection["detected"]:
+            self.last_bbox = None
+            return
+        x1, y1, x2, y2 = clip_bbox(detection["bbox"], frame.shape[1], frame.shape[0])
+        template = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        # a flat crop correlates with anything
+        if template.size == 0 or template.std() < 1:
+            self.last_bbox = None
+            return
+        self.template = template
+        self.last_bbox = (x1, y1, x2, y2)
+        center = ((x1 + x2) // 2, (y1 + y2) // 2)
+        height, width = template.shape
+        for idx, (px1, py1, px2, py2) in enumerate(self.positions):
+            if (
+                abs((px1 + px2) // 2 - center[0]) <= width // 2
+                and abs((py1 + py2) // 2 - center[1]) <= height // 2
+            ):
+                self.positions[idx] = self.last_bbox
+                return
+        self.positions.append(self.last_bbox)
+        del self.positions[: -self.max_positions]
+
+    def match(self, frame: np.ndarray) -> dict | None:
+        """The detection found by correlation, None when YOLO has to run."""
+        if self.template is None:
+            return None
+        if self.since_update >= self.max_interval:
+            # hand this frame to YOLO, the frames after it keep matching meanwhile
+            self.since_update = 0
+            return None
+        height, width = self.template.shape
+        margin = max(4, int(self.search_margin * max(width, height)))
+        candidates = [self.last_bbox] if self.last_bbox is not None else []
+        candidates += [bbox for bbox in self.positions if bbox != self.last_bbox]
+        for x1, y1, _, _ in candidates:
+            left, top, right, bottom = clip_bbox(
+                (x1 - margin, y1 - margin, x1 + width + margin, y1 + height + margin),
+                frame.shape[1],
+                frame.shape[0],
+            )
+            if right - left < width or bottom - top < height:
+                continue
+            window = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+            scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if score >= self.threshold:
+                self.since_update += 1
+                self.last_bbox = (left + dx, top + dy, left + dx + width, top + dy + height)
+                return _detection(self.last_bbox, float(score))
+        return None
+
+
 class SoraWaterMarkDetector:
-    def __init__(self):
+    def __init__(
+        self,
+        batch_size: int = DETECT_BATCH_SIZE,
+        imgsz: int | None = DETECT_IMGSZ,
+        strategy: str = DETECT_STRATEGY,
+        backend: str = INFERENCE_BACKEND,
+        cpu_optimize: bool = CPU_OPTIMIZE,
+    ):
+        if strategy not in DETECT_STRATEGIES:
+            raise ValueError(
+                f"Unknown detector strategy {strategy!r}, expected one of {DETECT_STRATEGIES}"
+            )
         download_detector_weights()
         logger.debug(f"Begin to load yolo water mark detet model.")
         self.model = YOLO(WATER_MARK_DETECT_YOLO_WEIGHTS)
+        # identifies the weights in the detection track cache
+        self.weights_hash = detector_weights_hash()
         self.model.to(str(get_device()))
         logger.debug(f"Yolo water mark detet model loaded.")
 
         self.model.eval()
+        self.backend = "torch"
+        self.bf16 = False
+        self._channels_last = False
+        if backend == "onnx" and self._onnx_ready():
+            # ultralytics runs .onnx weights through ONNX Runtime with the same
+            # letterboxing and NMS as the torch model
+            self.model = YOLO(str(DETECTOR_ONNX_PATH), task="detect")
+            self.backend = "onnx"
+            logger.debug(f"Using the onnx detector {DETECTOR_ONNX_PATH}")
+        elif cpu_optimize and get_device().type == "cpu":
+            # set on the fused model once the first call built it, see _detect_yolo
+            self._channels_last = True
+            self.bf16 = CPU_BF16 and cpu_supports_bf16()
+            logger.debug(f"Detector in CPU performance mode, bf16: {self.bf16}")
+        self.batch_size = max(1, batch_size)
+        self.imgsz = imgsz
+        self.strategy = strategy
+        self.template_tracker = TemplateTracker() if strategy == "hybrid" else None
+        self.yolo_frames = 0
+
+    def _onnx_ready(self) -> bool:
+        if not DETECTOR_ONNX_PATH.exists():
+            logger.warning(
+                f"{DETECTOR_ONNX_PATH} not found, export it with "
+                "`python -m sorawm.onnx_export --model detector`, using torch"
+            )
+            return False
+        from sorawm.utils.onnx_utils import check_parity, create_session
+
+        session = create_session(DETECTOR_ONNX_PATH)
+        torch_model = self.model.model
+        input_name = session.get_inputs()[0].name
+
+        def torch_output(images):
+            with torch.no_grad():
+                output = torch_model(torch.from_numpy(images).to(get_device()))
+            # the detect head also returns its feature maps outside of export
+            if isinstance(output, (list, tuple)):
+                output = output[0]
+            return output.float().cpu().numpy()
+
+        def onnx_output(images):
+            return session.run(None, {input_name: images})[0]
+
+        probe = np.random.default_rng(0).random((1, 3, 640, 640), dtype=np.float32)
+        if not check_parity(
+            DETECTOR_ONNX_PATH, torch_output, onnx_output, [probe], ONNX_PARITY_TOLERANCE
+        ):
+            logger.error("The onnx detector does not match torch, using torch")
+            return False
+        return True
+
+    def reset(self):
+        """Forget the state carried between the frames of a video."""
+        self.yolo_frames = 0
+        if self.template_tracker is not None:
+            self.template_tracker.reset()
 
     def detect(self, input_image: np.ndarray):
-        # Run YOLO inference
-        results = self.model(input_image, verbose=False)
-        # Extract predictions from the first (and only) result
-        result = results[0]
-
-        # Check if any detections were made
-        if len(result.boxes) == 0:
-            return {"detected": False, "bbox": None, "confidence": None, "center": None}
-
-        # Get the first detection (highest confidence)
-        box = result.boxes[0]
-
-        # Extract bounding box coordinates (xyxy format)
-        # Convert tensor to numpy, then to python float, finally to int
-        xyxy = box.xyxy[0].cpu().numpy()
-        x1, y1, x2, y2 = float(xyxy[0]), float(xyxy[1]), float(xyxy[2]), float(xyxy[3])
-        # Extract confidence score
-        confidence = float(box.conf[0].cpu().numpy())
-        # Calculate center point
-        center_x = (x1 + x2) / 2
-        center_y = (y1 + y2) / 2
-
-        return {
-            "detected": True,
-            "bbox": (int(x1), int(y1), int(x2), int(y2)),
-            "confidence": confidence,
-            "center": (int(center_x), int(center_y)),
-        }
+        return self.detect_batch([input_image])[0]
+
+    def detect_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        batch_size: int | None = None,
+        imgsz: int | None = None,
+        tracking: bool = True,
+    ) -> list[dict]:
+        """Run YOLO on ``frames`` in chunks of ``batch_size`` images per forward pass.
+
+        ``imgsz`` overrides the inference size, smaller values trade accuracy for speed.
+        Returns one detection dict per frame, in order. With the hybrid strategy the
+        frames are expected in video order, only those the template tracker cannot
+        match go through YOLO. ``tracking=False`` runs YOLO on all of them and leaves
+        the tracker alone, for frames that are not in video order.
+        """
+        if self.template_tracker is None or not tracking:
+            return self._detect_yolo(frames, batch_size, imgsz)
+        detections = [self.template_tracker.match(frame) for frame in frames]
+        missed = [idx for idx, detection in enumerate(detections) if detection is None]
+        if missed:
+            results = self._detect_yolo([frames[idx] for idx in missed], batch_size, imgsz)
+            for idx, detection in zip(missed, results):
+                detections[idx] = detection
+                self.template_tracker.update(frames[idx], detection)
+        return detections
+
+    def _detect_yolo(
+        self,
+        frames: Sequence[np.ndarray],
+        batch_size: int | None = None,
+        imgsz: int | None = None,
+    ) -> list[dict]:
+        self.yolo_frames += len(frames)
+        batch_size = max(1, batch_size or self.batch_size)
+        imgsz = imgsz or self.imgsz
+        predict_kwargs = {"verbose": False}
+        if imgsz:
+            predict_kwargs["imgsz"] = imgsz
+
+        detections = []
+        for start in range(0, len(frames), batch_size):
+            with cpu_autocast(self.bf16):
+                results = self.model(
+                    list(frames[start : start + batch_size]), **predict_kwargs
+                )
+            if self._channels_last:
+                self._predictor_to_channels_last()
+            detections.extend(self._parse_results(results))
+        return detections
+
+    def _predictor_to_channels_last(self):
+        """Pass the model channels_last once ultralytics built its predictor.
+
+        The predictor fuses conv and bn on the first call. Converted before that,
+        ultralytics 8.3 fails to fuse the channels_last weights, and 8.4 runs a copy
+        of the model in the format it picks itself.
+        """
+        self.model.predictor.model.model.to(memory_format=torch.channels_last)
+        self._channels_last = False
+
+    @staticmethod
+    def _parse_results(results) -> list[dict]:
+        detections = [dict(NO_DETECTION) for _ in results]
+        hits = [idx for idx, result in enumerate(results) if len(result.boxes) > 0]
+        if not hits:
+            return detections
+
+        # boxes are sorted by confidence, keep the first row (x1, y1, x2, y2, conf, cls)
+        # of every frame and move them to the CPU in a single transfer
+        top_boxes = torch.stack([results[idx].boxes.data[0] for idx in hits])
+        top_boxes = top_boxes.float().cpu().numpy()
+        xyxy = top_boxes[:, :4]
+        bboxes = xyxy.astype(int)
+        centers = ((xyxy[:, :2] + xyxy[:, 2:]) / 2).astype(int)
+        confidences = top_boxes[:, 4]
+
+        for row, idx in enumerate(hits):
+            detections[idx] = {
+                "detected": True,
+                "bbox": tuple(int(v) for v in bboxes[row]),
+                "confidence": float(confidences[row]),
+                "center": (int(centers[row, 0]), int(centers[row, 1])),
+            }
+        return detections
+
+
+class _SparseSegment:
+    """Progress of the sparse detection over the frames ``idx`` to ``end``."""
+
+    def __init__(self, start: int, end: int):
+        self.idx = start
+        self.end = end
+        self.reference = None  # (detection, gray roi) of the last successful detection
+        self.last_detect_idx = None
+
+
+class SparseWaterMarkDetector:
+    """Run the detector on every Nth frame and track the watermark in between.
+
+    Between two detections the previous bbox is kept as long as the watermark ROI
+    stays close to the crop seen at the last detection (mean absolute difference
+    in grayscale). A larger difference means the watermark moved or the scene
+    changed under it, so the detector runs again on that frame. Frames skipped
+    while no watermark is known are reported as missed and left to imputation.
+
+    The tracking restarts every ``interval`` frames, which makes these segments
+    independent: ``batch_size`` of them advance together and their detector calls
+    go through ``detect_batch`` at once. That many segments of frames are held. The
+    tracking between detector calls happens here, so the hybrid template tracker of
+    the detector is bypassed.
+    """
+
+    def __init__(
+        self,
+        detector: SoraWaterMarkDetector,
+        interval: int = SPARSE_DETECT_INTERVAL,
+        miss_interval: int = SPARSE_DETECT_MISS_INTERVAL,
+        roi_diff_threshold: float = SPARSE_ROI_DIFF_THRESHOLD,
+    ):
+        self.detector = detector
+        self.interval = max(1, interval)
+        self.miss_interval = max(1, miss_interval)
+        self.roi_diff_threshold = roi_diff_threshold
+        self.detector_calls = 0
+
+    @staticmethod
+    def _gray_roi(frame: np.ndarray, bbox: tuple[int, int, int, int]) -> np.ndarray:
+        x1, y1, x2, y2 = bbox
+        return cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+
+    def _roi_unchanged(self, frame: np.ndarray, bbox, reference_roi: np.ndarray) -> bool:
+        roi = self._gray_roi(frame, bbox)
+        if roi.shape != reference_roi.shape or roi.size == 0:
+            return False
+        return float(cv2.absdiff(roi, reference_roi).mean()) <= self.roi_diff_threshold
+
+    def detect_stream(self, frames: Iterable[np.ndarray]) -> Iterator[dict]:
+        """Yield one detection dict per frame, in order."""
+        self.detector_calls = 0
+        for chunk in batched(frames, self.interval * self.detector.batch_size):
+            yield from self._detect_chunk(chunk)
+
+    def _detect_chunk(self, frames: Sequence[np.ndarray]) -> list[dict]:
+        detections = [None] * len(frames)
+        segments = [
+            _SparseSegment(start, min(start + self.interval, len(frames)))
+            for start in range(0, len(frames), self.interval)
+        ]
+        while True:
+            # every segment runs up to its next frame for the detector
+            pending = []
+            for segment in segments:
+                if self._advance(segment, frames, detections):
+                    pending.append(segment)
+            if not pending:
+                return detections
+            # the frames of several segments, not in video order for a template tracker
+            results = self.detector.detect_batch(
+                [frames[segment.idx] for segment in pending], tracking=False
+            )
+            self.detector_calls += len(pending)
+            for segment, detection in zip(pending, results):
+                idx = segment.idx
+                segment.last_detect_idx = idx
+                if detection["detected"]:
+                    roi = self._gray_roi(frames[idx], detection["bbox"])
+                    segment.reference = (detection, roi)
+                else:
+                    segment.reference = None
+                detections[idx] = detection
+                segment.idx += 1
+
+    def _advance(
+        self, segment: _SparseSegment, frames: Sequence[np.ndarray], detections: list
+    ) -> bool:
+        """Fill the frames the detector can skip, False once the segment is done."""
+        while segment.idx < segment.end:
+            idx = segment.idx
+            last = segment.last_detect_idx
+            since_detect = None if last is None else idx - last
+            if segment.reference is not None and since_detect < self.interval:
+                detection, reference_roi = segment.reference
+                if not self._roi_unchanged(frames[idx], detection["bbox"], reference_roi):
+                    return True
+                detections[idx] = dict(detection)
+            elif (
+                segment.reference is None
+                and since_detect is not None
+                and since_detect < self.miss_interval
+            ):
+                detections[idx] = dict(NO_DETECTION)
+            else:
+                return True
+            segment.idx += 1
+        return False
 
 
 if __name__ == "__main__":